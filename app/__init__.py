@@ -30,9 +30,14 @@ def create_app():
         }
     })
     
+    # Compress JSON/HTML responses; streamed SSE responses are left untouched
+    from app.compression import init_compression
+    init_compression(app)
+    
     # Register blueprints
     from app.routes import main_bp, auth_bp
     from app.oauth_mcp_fixed import oauth_mcp_fixed_bp
+    from app.metrics import metrics_bp
     
     # Register non-conflicting routes first
     app.register_blueprint(auth_bp, url_prefix='/auth')
@@ -40,6 +45,9 @@ def create_app():
     # Register the FIXED OAuth MCP server that properly exposes tools
     app.register_blueprint(oauth_mcp_fixed_bp)
     
+    # Prometheus scrape endpoint
+    app.register_blueprint(metrics_bp)
+    
     # Register main routes (dashboard, etc) - avoid conflicts with MCP root
     app.register_blueprint(main_bp)
     
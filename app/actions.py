@@ -0,0 +1,158 @@
+"""
+Action classifier
+Revenue and conversion counts come from the actions / action_values lists
+on insights rows. Graph reports one event under several action types
+(omni_purchase, purchase, offsite_conversion.fb_pixel_purchase), so each
+event is an alias group and only its most-preferred alias present on a row
+is counted. The event sets are compiled once into a dict lookup table,
+globally or per ad account:
+
+    CONVERSION_EVENTS=purchase,lead
+    REVENUE_EVENTS=purchase
+    ACCOUNT_ACTION_EVENTS={"1234567890": {"conversions": ["purchase", "complete_registration"]}}
+
+Action types that are not a known event (e.g. offsite_conversion.custom.123)
+are counted as they are. complete_registration is not a conversion by
+default; list it in CONVERSION_EVENTS to count it.
+"""
+
+import json
+import logging
+import operator
+import os
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Event -> action types Graph reports it under, most-preferred first
+EVENT_ALIASES = {
+    'landing_page_view': ('omni_landing_page_view', 'landing_page_view'),
+    'add_to_cart': ('omni_add_to_cart', 'add_to_cart', 'offsite_conversion.fb_pixel_add_to_cart'),
+    'initiate_checkout': ('omni_initiated_checkout', 'initiate_checkout',
+                          'offsite_conversion.fb_pixel_initiate_checkout'),
+    'purchase': ('omni_purchase', 'purchase', 'offsite_conversion.fb_pixel_purchase'),
+    'lead': ('lead', 'onsite_conversion.lead_grouped', 'offsite_conversion.fb_pixel_lead'),
+    'complete_registration': ('omni_complete_registration', 'complete_registration',
+                              'offsite_conversion.fb_pixel_complete_registration')
+}
+
+DEFAULT_CONVERSION_EVENTS = tuple(e.strip() for e in os.getenv('CONVERSION_EVENTS', 'purchase,lead').split(',') if e.strip())
+DEFAULT_REVENUE_EVENTS = tuple(e.strip() for e in os.getenv('REVENUE_EVENTS', 'purchase').split(',') if e.strip())
+
+
+def compile_events(events: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+    """action type -> (event slot, alias rank) for the given events"""
+    table = {}
+    for slot, event in enumerate(dict.fromkeys(events)):
+        for rank, action_type in enumerate(EVENT_ALIASES.get(event, (event,))):
+            table.setdefault(action_type, (slot, rank))
+    return table
+
+
+def _sum_best(entries: Optional[List[Dict]], table: Dict[str, Tuple[int, int]]) -> float:
+    """Sum each event's most-preferred alias present in one actions list"""
+    if not entries:
+        return 0.0
+    best: Dict[int, Tuple[int, float]] = {}
+    lookup = table.get
+    for entry in entries:
+        found = lookup(entry.get('action_type'))
+        if found is None:
+            continue
+        slot, rank = found
+        current = best.get(slot)
+        if current is None or rank < current[0]:
+            best[slot] = (rank, float(entry.get('value', 0)))
+    return sum(value for _, value in best.values())
+
+
+class ActionClassifier:
+    """Revenue and conversions from one insights row, with the event sets compiled up front"""
+
+    __slots__ = ('conversion_events', 'revenue_events', '_conversions', '_revenue')
+
+    def __init__(self, conversion_events: Sequence[str] = DEFAULT_CONVERSION_EVENTS,
+                 revenue_events: Sequence[str] = DEFAULT_REVENUE_EVENTS):
+        self.conversion_events = frozenset(conversion_events)
+        self.revenue_events = frozenset(revenue_events)
+        self._conversions = compile_events(conversion_events)
+        self._revenue = compile_events(revenue_events)
+
+    def revenue(self, row: Dict) -> float:
+        return _sum_best(row.get('action_values'), self._revenue)
+
+    def conversions(self, row: Dict) -> int:
+        return int(_sum_best(row.get('actions'), self._conversions))
+
+    def classify(self, row: Dict) -> Tuple[float, int]:
+        """(revenue, conversions) for one row"""
+        return self.revenue(row), self.conversions(row)
+
+    def classify_page(self, rows: Sequence[Dict]) -> Tuple[array, array]:
+        """Revenue and conversion columns for a page of rows"""
+        revenue = _page_totals(rows, 'action_values', self._revenue)
+        conversions = _page_totals(rows, 'actions', self._conversions)
+        return revenue, array('q', map(int, conversions))
+
+
+def _page_totals(rows: Sequence[Dict], key: str, table: Dict[str, Tuple[int, int]]) -> array:
+    """Per-row totals of each event's most-preferred alias, for a whole page at once
+
+    Winning (rank, value) pairs live in flat row * slots + slot cells, so the
+    page is one pass over its actions lists followed by a column sum per slot.
+    """
+    slots = 1 + max((slot for slot, _ in table.values()), default=-1)
+    if not slots or not rows:
+        return array('d', bytes(8 * len(rows)))
+    cells = len(rows) * slots
+    ranks = array('l', [1 + max(rank for _, rank in table.values())]) * cells
+    values = array('d', bytes(8 * cells))
+    lookup = table.get
+    base = 0
+    for row in rows:
+        for entry in row.get(key) or ():
+            found = lookup(entry.get('action_type'))
+            if found is not None:
+                cell = base + found[0]
+                if found[1] < ranks[cell]:
+                    ranks[cell] = found[1]
+                    values[cell] = float(entry.get('value', 0))
+        base += slots
+    totals = values[0::slots]
+    for slot in range(1, slots):
+        totals = array('d', map(operator.add, totals, values[slot::slots]))
+    return totals
+
+
+def _account_events_from_env() -> Dict[str, Dict[str, List[str]]]:
+    raw = os.getenv('ACCOUNT_ACTION_EVENTS', '')
+    if not raw:
+        return {}
+    try:
+        return {account.replace('act_', ''): events for account, events in json.loads(raw).items()}
+    except (ValueError, AttributeError):
+        logger.warning("ACCOUNT_ACTION_EVENTS is not a JSON object of account id -> events; ignoring it")
+        return {}
+
+
+_account_events = _account_events_from_env()
+_default_classifier = ActionClassifier()
+_classifiers: Dict[str, ActionClassifier] = {}
+_lock = threading.Lock()
+
+
+def classifier_for(account_id: Optional[str] = None) -> ActionClassifier:
+    """The compiled classifier for an ad account's attribution setup"""
+    events = _account_events.get((account_id or '').replace('act_', ''))
+    if not events:
+        return _default_classifier
+    with _lock:
+        classifier = _classifiers.get(account_id)
+        if classifier is None:
+            classifier = _classifiers[account_id] = ActionClassifier(
+                events.get('conversions', DEFAULT_CONVERSION_EVENTS),
+                events.get('revenue', DEFAULT_REVENUE_EVENTS)
+            )
+        return classifier
@@ -0,0 +1,139 @@
+"""
+Audience cube
+One insights fetch at the finest compatible breakdown (age x gender, or a
+single geo dimension) is kept as a dense array-backed cube. Coarser views
+(age only, gender only, totals) are rolled up locally, and ROAS is computed
+once per output cell at the end.
+"""
+
+import logging
+import os
+from array import array
+from typing import Dict, List, Sequence, Tuple
+
+from app import actions
+from app.tool_registry import TTLCache
+
+logger = logging.getLogger(__name__)
+
+MEASURES = ('spend', 'revenue', 'impressions', 'clicks', 'conversions')
+SPEND, REVENUE, IMPRESSIONS, CLICKS, CONVERSIONS = range(len(MEASURES))
+
+# Requested breakdown -> the cube that answers it; age and gender share one fetch
+CUBE_DIMENSIONS = {
+    'age': ('age', 'gender'),
+    'gender': ('age', 'gender'),
+    'country': ('country',),
+    'region': ('region',)
+}
+
+_cube_cache = TTLCache(ttl=float(os.getenv('AUDIENCE_CACHE_TTL', '900')), max_entries=256)
+
+
+class AudienceCube:
+    """Dense cube of MEASURES over the labels seen for each dimension"""
+
+    __slots__ = ('dimensions', 'labels', 'strides', 'values')
+
+    def __init__(self, dimensions: Sequence[str], labels: List[List[str]]):
+        self.dimensions = tuple(dimensions)
+        self.labels = labels
+        self.strides = []
+        size = 1
+        for dimension_labels in reversed(labels):
+            self.strides.insert(0, size)
+            size *= len(dimension_labels)
+        self.values = [array('d', bytes(8 * size)) for _ in MEASURES]
+
+    @classmethod
+    def from_rows(cls, dimensions: Sequence[str], rows: List[Tuple[Tuple[str, ...], Tuple[float, ...]]]):
+        """Build from (coordinates, measures) pairs"""
+        indexes = [{} for _ in dimensions]
+        for coordinates, _ in rows:
+            for index, label in zip(indexes, coordinates):
+                index.setdefault(label, len(index))
+        cube = cls(dimensions, [list(index) for index in indexes])
+        for coordinates, measures in rows:
+            offset = sum(index[label] * stride for index, label, stride in zip(indexes, coordinates, cube.strides))
+            for column, value in zip(cube.values, measures):
+                column[offset] += value
+        return cube
+
+    def rollup(self, keep: Sequence[str] = ()) -> Dict[Tuple[str, ...], List[float]]:
+        """Sum measures over every dimension not in `keep`"""
+        positions = [self.dimensions.index(dimension) for dimension in keep]
+        result: Dict[Tuple[str, ...], List[float]] = {}
+        for offset in range(len(self.values[0])):
+            key = tuple(self.labels[p][(offset // self.strides[p]) % len(self.labels[p])] for p in positions)
+            sums = result.get(key)
+            if sums is None:
+                sums = result[key] = [0.0] * len(MEASURES)
+            for i, column in enumerate(self.values):
+                sums[i] += column[offset]
+        return result
+
+
+def _summary(sums: List[float], roas) -> Dict:
+    return {
+        'spend': round(sums[SPEND], 2),
+        'conversions': int(sums[CONVERSIONS]),
+        'revenue': round(sums[REVENUE], 2),
+        'impressions': int(sums[IMPRESSIONS]),
+        'clicks': int(sums[CLICKS]),
+        'roas': roas(sums[SPEND], sums[REVENUE])
+    }
+
+
+def load_cube(client, account_id: str, date_range: Dict, dimensions: Tuple[str, ...]) -> AudienceCube:
+    """The cached cube for this account, period and dimensions, fetched on a miss"""
+    key = (account_id, date_range['since'], date_range['until'], dimensions)
+    cube = _cube_cache.get(key)
+    if cube is not None:
+        return cube
+
+    params = {
+        'fields': 'spend,impressions,clicks,actions,action_values',
+        'time_range': f'{{"since":"{date_range["since"]}","until":"{date_range["until"]}"}}',
+        'level': 'account',
+        'breakdowns': ','.join(dimensions),
+        'action_breakdowns': 'action_type',
+        'limit': 500
+    }
+    classifier = actions.classifier_for(account_id)
+    rows = []
+    for segment in client._iter_pages(f'/act_{account_id}/insights', params):
+        revenue, conversions = classifier.classify(segment)
+        measures = (
+            float(segment.get('spend', 0)),
+            revenue,
+            float(segment.get('impressions', 0)),
+            float(segment.get('clicks', 0)),
+            float(conversions)
+        )
+        rows.append((tuple(segment.get(dimension, 'unknown') for dimension in dimensions), measures))
+    cube = AudienceCube.from_rows(dimensions, rows)
+    _cube_cache.set(key, cube)
+    return cube
+
+
+def audience_insights(client, account_id: str, date_range: Dict, breakdown: str = 'age,gender') -> Dict:
+    """Per-dimension breakdowns and totals for the requested breakdown(s), from cached cubes
+
+    age_breakdown and gender_breakdown are always present; an age or gender
+    request fills both since they come from the same cube.
+    """
+    requested = [dimension.strip() for dimension in breakdown.split(',') if dimension.strip()]
+    insights = {'age_breakdown': {}, 'gender_breakdown': {}}
+    total = None
+    for dimensions in dict.fromkeys(CUBE_DIMENSIONS.get(d, (d,)) for d in requested):
+        cube = load_cube(client, account_id, date_range, dimensions)
+        for dimension in dimensions:
+            insights[f'{dimension}_breakdown'] = {
+                key[0]: _summary(sums, client._calculate_roas)
+                for key, sums in cube.rollup((dimension,)).items() if key[0] != 'unknown'
+            }
+        if total is None:
+            total = cube.rollup().get((), [0.0] * len(MEASURES))
+
+    insights['total_metrics'] = _summary(total or [0.0] * len(MEASURES), client._calculate_roas)
+    return insights
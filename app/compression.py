@@ -0,0 +1,120 @@
+"""
+Response compression for JSON and HTML responses
+Negotiates brotli (when installed) or gzip from Accept-Encoding.
+Streamed responses such as the MCP SSE endpoint are never compressed, so
+every event is flushed to the client as soon as it is yielded.
+"""
+
+import gzip
+import os
+import threading
+from typing import Optional
+
+from flask import Flask, Response, request
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = frozenset([
+    'application/json',
+    'text/html',
+    'text/css',
+    'text/plain',
+    'application/javascript',
+    'text/javascript'
+])
+
+# Compressed bodies of responses with a strong ETag (precomputed payloads)
+_etag_cache = {}
+_etag_cache_lock = threading.Lock()
+_ETAG_CACHE_SIZE = 64
+
+
+def init_compression(app: Flask) -> None:
+    """Register the compression hook on the app"""
+    app.config.setdefault('COMPRESS_MIN_SIZE', int(os.getenv('COMPRESS_MIN_SIZE', '1024')))
+    app.config.setdefault('COMPRESS_LEVEL', int(os.getenv('COMPRESS_LEVEL', '6')))
+    app.config.setdefault('COMPRESS_BR_LEVEL', int(os.getenv('COMPRESS_BR_LEVEL', '5')))
+    app.config.setdefault('COMPRESS_MIMETYPES', COMPRESSIBLE_MIMETYPES)
+    app.after_request(_compress_response)
+
+
+def _accepted_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header, honouring q=0"""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        pieces = part.strip().split(';')
+        coding = pieces[0].strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in pieces[1:]:
+            param = param.strip()
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+
+    def allowed(coding):
+        return accepted.get(coding, accepted.get('*', 0.0)) > 0
+
+    if brotli is not None and allowed('br'):
+        return 'br'
+    if allowed('gzip'):
+        return 'gzip'
+    return None
+
+
+def _compress(body: bytes, encoding: str, config) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=config['COMPRESS_BR_LEVEL'])
+    return gzip.compress(body, compresslevel=config['COMPRESS_LEVEL'], mtime=0)
+
+
+def _compress_response(response: Response) -> Response:
+    from flask import current_app
+    config = current_app.config
+
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.direct_passthrough
+            or response.is_streamed
+            or response.mimetype == 'text/event-stream'
+            or response.mimetype not in config['COMPRESS_MIMETYPES']
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    encoding = _accepted_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding is None:
+        return response
+
+    body = response.get_data()
+    if len(body) < config['COMPRESS_MIN_SIZE']:
+        return response
+
+    etag = response.headers.get('ETag')
+    cache_key = (etag, encoding) if etag and not etag.startswith('W/') else None
+    compressed = None
+    if cache_key:
+        with _etag_cache_lock:
+            compressed = _etag_cache.get(cache_key)
+    if compressed is None:
+        compressed = _compress(body, encoding, config)
+        if cache_key:
+            with _etag_cache_lock:
+                if len(_etag_cache) >= _ETAG_CACHE_SIZE:
+                    _etag_cache.clear()
+                _etag_cache[cache_key] = compressed
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    response.headers['Content-Length'] = str(len(compressed))
+    if etag and not etag.startswith('W/'):
+        # The compressed bytes differ from the identity representation
+        response.headers['ETag'] = f'W/{etag}'
+    return response
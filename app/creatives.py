@@ -0,0 +1,131 @@
+"""
+Creative dimension cache
+Maps ad id -> creative category per ad account. The first lookup pages
+through the whole ads edge; later refreshes only ask Graph for ads whose
+updated_time moved, and a periodic full sync drops deleted ads.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+REFRESH_SECONDS = float(os.getenv('CREATIVE_REFRESH_SECONDS', '300'))
+FULL_SYNC_SECONDS = float(os.getenv('CREATIVE_FULL_SYNC_SECONDS', '86400'))
+MAX_ACCOUNTS = int(os.getenv('CREATIVE_CACHE_ACCOUNTS', '64'))
+
+AD_FIELDS = 'id,updated_time,creative{object_type}'
+
+CATEGORIES = {
+    'VIDEO': 'video',
+    'VIDEO_AUTOPLAY': 'video',
+    'LINK': 'image',
+    'IMAGE': 'image',
+    'PHOTO': 'image',
+    'CAROUSEL': 'carousel'
+}
+
+
+def creative_category(object_type: Optional[str]) -> str:
+    """Map Facebook creative object types to simple categories"""
+    return CATEGORIES.get(object_type, 'other')
+
+
+def _epoch(updated_time: Optional[str]) -> int:
+    """Graph times look like 2026-01-31T12:00:00+0000"""
+    try:
+        return int(datetime.strptime(updated_time, '%Y-%m-%dT%H:%M:%S%z').timestamp())
+    except (TypeError, ValueError):
+        return 0
+
+
+class _AccountCreatives:
+    __slots__ = ('types', 'high_water', 'refreshed_at', 'full_sync_at', 'lock')
+
+    def __init__(self):
+        self.types: Dict[str, str] = {}
+        self.high_water = 0  # newest updated_time seen, as a unix timestamp
+        self.refreshed_at: Optional[float] = None  # monotonic; None until the first sync
+        self.full_sync_at: Optional[float] = None
+        self.lock = threading.Lock()
+
+
+class CreativeIndex:
+    """Per-account ad id -> creative category, refreshed incrementally by updated_time"""
+
+    def __init__(self, max_accounts: int = MAX_ACCOUNTS):
+        self.max_accounts = max_accounts
+        self._accounts: 'OrderedDict[str, _AccountCreatives]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, account_id: str) -> _AccountCreatives:
+        with self._lock:
+            entry = self._accounts.get(account_id)
+            if entry is None:
+                entry = self._accounts[account_id] = _AccountCreatives()
+                while len(self._accounts) > self.max_accounts:
+                    self._accounts.popitem(last=False)
+            self._accounts.move_to_end(account_id)
+            return entry
+
+    def types_for(self, client, account_id: str) -> Dict[str, str]:
+        """The account's ad id -> category map, refreshed first if it is due"""
+        entry = self._entry(account_id)
+        with entry.lock:
+            now = time.monotonic()
+            if entry.full_sync_at is None or now - entry.full_sync_at >= FULL_SYNC_SECONDS:
+                self._sync(client, account_id, entry, full=True)
+            elif entry.refreshed_at is None or now - entry.refreshed_at >= REFRESH_SECONDS:
+                self._sync(client, account_id, entry, full=False)
+            return entry.types
+
+    def resolve(self, client, account_id: str, ad_ids: Iterable[str]) -> Dict[str, str]:
+        """Look up ads missing from the ads edge (e.g. archived) by id, 50 per request"""
+        entry = self._entry(account_id)
+        missing = [ad_id for ad_id in ad_ids if ad_id not in entry.types]
+        found = {}
+        for start in range(0, len(missing), 50):
+            chunk = missing[start:start + 50]
+            try:
+                nodes = client._make_request('/', {'ids': ','.join(chunk), 'fields': 'creative{object_type}'})
+            except Exception as e:
+                logger.warning(f"Creative lookup for {len(chunk)} ads failed: {e}")
+                continue
+            for ad_id, node in nodes.items():
+                if isinstance(node, dict):
+                    found[ad_id] = creative_category((node.get('creative') or {}).get('object_type'))
+        with entry.lock:
+            entry.types.update(found)
+        return found
+
+    def _sync(self, client, account_id: str, entry: _AccountCreatives, full: bool) -> None:
+        params = {'fields': AD_FIELDS, 'limit': 500}
+        if not full and entry.high_water:
+            params['filtering'] = (f'[{{"field":"updated_time","operator":"GREATER_THAN",'
+                                   f'"value":{entry.high_water}}}]')
+        types = {} if full else entry.types
+        high_water = 0 if full else entry.high_water
+        changed = 0
+        for ad in client._iter_pages(f'/act_{account_id}/ads', params):
+            types[ad.get('id')] = creative_category((ad.get('creative') or {}).get('object_type'))
+            high_water = max(high_water, _epoch(ad.get('updated_time')))
+            changed += 1
+        entry.types = types
+        entry.high_water = high_water
+        entry.refreshed_at = time.monotonic()
+        if full:
+            entry.full_sync_at = entry.refreshed_at
+        logger.info(f"Creative index for {account_id}: {'full' if full else 'incremental'} sync, "
+                    f"{changed} ads, {len(types)} cached")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._accounts.clear()
+
+
+creative_index = CreativeIndex()
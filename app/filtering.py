@@ -0,0 +1,155 @@
+"""
+Insights filtering
+Tool predicates are split into the ones Graph can evaluate (pushed down as
+the insights `filtering` parameter, so fewer rows come back) and the rest,
+which are evaluated locally while the pages stream in. Ad rows for the
+underperformer scan are cached recommendation-ready, so a tweak to a
+threshold re-runs over the cached rows instead of Graph, as long as the
+cached fetch was at least as broad as the new one.
+"""
+
+import json
+import logging
+import operator
+import os
+from typing import Dict, Iterable, List, NamedTuple, Sequence, Tuple
+
+from app import actions
+from app.tool_registry import TTLCache
+
+logger = logging.getLogger(__name__)
+
+OPERATORS = {
+    'EQUAL': operator.eq,
+    'GREATER_THAN': operator.gt,
+    'GREATER_THAN_OR_EQUAL': operator.ge,
+    'LESS_THAN': operator.lt,
+    'LESS_THAN_OR_EQUAL': operator.le
+}
+LOWER_BOUNDS = frozenset(['GREATER_THAN', 'GREATER_THAN_OR_EQUAL'])
+UPPER_BOUNDS = frozenset(['LESS_THAN', 'LESS_THAN_OR_EQUAL'])
+
+# Insights metrics Graph accepts in `filtering`; anything else (roas from action values, ...) is local
+PUSHDOWN_FIELDS = frozenset(['spend', 'impressions', 'clicks', 'reach', 'ctr', 'cpc', 'cpm'])
+
+AD_FIELDS = 'ad_id,ad_name,adset_id,campaign_id,spend,impressions,clicks,purchase_roas,actions,action_values,ctr,cpm,cpc'
+
+_row_cache = TTLCache(ttl=float(os.getenv('UNDERPERFORMER_CACHE_TTL', '300')), max_entries=256)
+
+
+class Predicate(NamedTuple):
+    field: str
+    operator: str
+    value: float
+
+    def matches(self, row: Dict) -> bool:
+        return OPERATORS[self.operator](row.get(self.field, 0), self.value)
+
+    def narrows(self, other: 'Predicate') -> bool:
+        """True if every row matching self also matches other"""
+        if self.field != other.field:
+            return False
+        if self.operator in LOWER_BOUNDS and other.operator in LOWER_BOUNDS:
+            return self.value > other.value or (self.value == other.value and (
+                self.operator == other.operator or other.operator == 'GREATER_THAN_OR_EQUAL'))
+        if self.operator in UPPER_BOUNDS and other.operator in UPPER_BOUNDS:
+            return self.value < other.value or (self.value == other.value and (
+                self.operator == other.operator or other.operator == 'LESS_THAN_OR_EQUAL'))
+        return self == other
+
+
+def plan(predicates: Iterable[Predicate]) -> Tuple[List[Predicate], List[Predicate]]:
+    """Split predicates into (pushed down to Graph, evaluated locally)"""
+    pushed, local = [], []
+    for predicate in predicates:
+        (pushed if predicate.field in PUSHDOWN_FIELDS else local).append(predicate)
+    return pushed, local
+
+
+def to_filtering(predicates: Sequence[Predicate]) -> str:
+    """The Graph `filtering` parameter for pushed-down predicates"""
+    return json.dumps([{'field': p.field, 'operator': p.operator, 'value': p.value} for p in predicates])
+
+
+def covers(cached: Sequence[Predicate], wanted: Sequence[Predicate]) -> bool:
+    """True if rows fetched under `cached` include every row `wanted` can match"""
+    return all(any(new.narrows(old) for new in wanted) for old in cached)
+
+
+def recommendation(ad: Dict) -> str:
+    """Next step for an ad that missed its ROAS target"""
+    if ad.get('roas', 0) < 0.5:
+        return 'Very low ROAS - consider pausing immediately'
+    if ad.get('ctr', 0) < 1.0:
+        return 'Low CTR - test new creative or audience'
+    if ad.get('conversions', 0) < 1:
+        return 'No conversions - review landing page and offer'
+    return 'Below threshold - optimize bid strategy or creative'
+
+
+def _stream_ads(client, account_id: str, date_range: Dict, pushed: Sequence[Predicate],
+                local: Sequence[Predicate]) -> Tuple[List[Dict], List[Dict]]:
+    """(every row Graph returned, rows also matching `local`), checked as each page streams in"""
+    params = {
+        'fields': AD_FIELDS,
+        'time_range': f'{{"since":"{date_range["since"]}","until":"{date_range["until"]}"}}',
+        'level': 'ad',
+        'action_breakdowns': 'action_type',
+        'limit': 500
+    }
+    if pushed:
+        params['filtering'] = to_filtering(pushed)
+    classifier = actions.classifier_for(account_id)
+    rows, matches = [], []
+    for ad in client._iter_pages(f'/act_{account_id}/insights', params):
+        spend = float(ad.get('spend', 0))
+        revenue, conversions = classifier.classify(ad)
+        purchase_roas = ad.get('purchase_roas', [])
+        row = {
+            'ad_id': ad.get('ad_id'),
+            'ad_name': ad.get('ad_name', 'Unknown'),
+            'adset_id': ad.get('adset_id'),
+            'campaign_id': ad.get('campaign_id'),
+            'status': ad.get('status', 'UNKNOWN'),
+            'spend': spend,
+            'revenue': revenue,
+            'roas': float(purchase_roas[0].get('value', 0)) if purchase_roas else client._calculate_roas(spend, revenue),
+            'impressions': int(ad.get('impressions', 0)),
+            'clicks': int(ad.get('clicks', 0)),
+            'conversions': conversions,
+            'ctr': float(ad.get('ctr', 0)),
+            'cpm': float(ad.get('cpm', 0)),
+            'cpc': float(ad.get('cpc', 0))
+        }
+        row['recommendation'] = recommendation(row)
+        rows.append(row)
+        if all(predicate.matches(row) for predicate in local):
+            matches.append(dict(row))
+    logger.info(f"Underperformer scan for {account_id}: {len(rows)} ads after pushdown "
+                f"{[tuple(p) for p in pushed]}")
+    return rows, matches
+
+
+def filter_ads(client, account_id: str, date_range: Dict, predicates: Sequence[Predicate]) -> List[Dict]:
+    """Ads matching every predicate; pushed-down ones go to Graph, the rest run over cached rows"""
+    pushed, local = plan(predicates)
+    key = (account_id, date_range['since'], date_range['until'])
+    cached = _row_cache.get(key)
+    if cached is not None and covers(cached[0], pushed):
+        # The cached fetch may have been broader, so pushed predicates are re-checked too
+        return [dict(row) for row in cached[1] if all(predicate.matches(row) for predicate in predicates)]
+    rows, matches = _stream_ads(client, account_id, date_range, pushed, local)
+    _row_cache.set(key, (pushed, rows))
+    return matches
+
+
+def underperforming_ads(client, account_id: str, date_range: Dict, threshold_roas: float = 1.0,
+                        min_spend: float = 100) -> List[Dict]:
+    """Ads with at least min_spend and ROAS under threshold_roas, worst ROAS first"""
+    predicates = [
+        Predicate('spend', 'GREATER_THAN_OR_EQUAL', float(min_spend)),
+        Predicate('roas', 'LESS_THAN', float(threshold_roas))
+    ]
+    ads = filter_ads(client, account_id, date_range, predicates)
+    ads.sort(key=lambda ad: (ad['roas'], -ad['spend']))
+    return ads
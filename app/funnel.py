@@ -0,0 +1,126 @@
+"""
+Conversion funnel
+Graph reports the same event under several action types (omni_purchase,
+purchase, offsite_conversion.fb_pixel_purchase, ...). The step taxonomy is
+compiled once into an action type -> (step, rank) dict; per row the
+lowest-ranked alias present wins, so an event is never counted twice.
+Rows are aggregated in one pass, optionally per campaign or per adset from
+a single insights query.
+"""
+
+import logging
+from typing import Dict, List, Optional
+
+from app.actions import compile_events
+
+logger = logging.getLogger(__name__)
+
+# Funnel steps in order, as (output key, event in app.actions.EVENT_ALIASES)
+TAXONOMY = (
+    ('landing_page_views', 'landing_page_view'),
+    ('add_to_cart', 'add_to_cart'),
+    ('initiate_checkout', 'initiate_checkout'),
+    ('purchases', 'purchase')
+)
+STEPS = tuple(step for step, _ in TAXONOMY)
+
+ACTION_INDEX: Dict[str, tuple] = compile_events(event for _, event in TAXONOMY)
+
+GROUP_LEVELS = {
+    'campaign': ('campaign_id', 'campaign_name'),
+    'adset': ('adset_id', 'adset_name')
+}
+
+
+def step_counts(actions: Optional[List[Dict]]) -> List[float]:
+    """Count per funnel step for one row's actions list"""
+    best = [None] * len(STEPS)
+    for action in actions or ():
+        entry = ACTION_INDEX.get(action.get('action_type'))
+        if entry is None:
+            continue
+        step, rank = entry
+        if best[step] is None or rank < best[step][0]:
+            best[step] = (rank, float(action.get('value', 0)))
+    return [found[1] if found else 0.0 for found in best]
+
+
+class _Totals:
+    __slots__ = ('impressions', 'clicks', 'steps')
+
+    def __init__(self):
+        self.impressions = 0
+        self.clicks = 0
+        self.steps = [0.0] * len(STEPS)
+
+    def add(self, row: Dict) -> None:
+        self.impressions += int(row.get('impressions', 0))
+        self.clicks += int(row.get('clicks', 0))
+        for index, count in enumerate(step_counts(row.get('actions'))):
+            self.steps[index] += count
+
+    def summary(self) -> Dict:
+        purchases = int(self.steps[-1])
+        funnel = {
+            'impressions': self.impressions,
+            'clicks': self.clicks,
+            'click_rate': round((self.clicks / self.impressions * 100), 2) if self.impressions > 0 else 0,
+            'conversions': purchases,
+            'conversion_rate': round((purchases / self.clicks * 100), 2) if self.clicks > 0 else 0
+        }
+        previous = self.clicks
+        drop_off = []
+        for step, count in zip(STEPS, self.steps):
+            funnel[step] = int(count)
+            drop_off.append({
+                'step': step,
+                'count': int(count),
+                'rate_from_previous': round(count / previous * 100, 2) if previous else 0
+            })
+            previous = count
+        funnel['steps'] = drop_off
+        return funnel
+
+
+def conversion_funnel(client, account_id: str, date_range: Dict, campaign_id: Optional[str] = None,
+                      group_by: Optional[str] = None) -> Dict:
+    """Account (or campaign) funnel, plus one funnel per campaign or adset when group_by is set"""
+    if group_by and group_by not in GROUP_LEVELS:
+        raise ValueError(f"group_by must be one of: {', '.join(GROUP_LEVELS)}")
+
+    fields = ['impressions', 'clicks', 'actions']
+    level = group_by or ('campaign' if campaign_id else 'account')
+    if group_by:
+        fields.extend(GROUP_LEVELS[group_by])
+    params = {
+        'fields': ','.join(fields),
+        'time_range': f'{{"since":"{date_range["since"]}","until":"{date_range["until"]}"}}',
+        'level': level,
+        'action_breakdowns': 'action_type',
+        'limit': 500
+    }
+    if campaign_id:
+        params['filtering'] = f'[{{"field":"campaign.id","operator":"EQUAL","value":"{campaign_id}"}}]'
+
+    total = _Totals()
+    groups: Dict[str, _Totals] = {}
+    names: Dict[str, str] = {}
+    for row in client._iter_pages(f'/act_{account_id}/insights', params):
+        total.add(row)
+        if group_by:
+            id_field, name_field = GROUP_LEVELS[group_by]
+            group_id = row.get(id_field)
+            if group_id not in groups:
+                groups[group_id] = _Totals()
+                names[group_id] = row.get(name_field)
+            groups[group_id].add(row)
+
+    funnel = total.summary()
+    if group_by:
+        id_field, name_field = GROUP_LEVELS[group_by]
+        funnel[f'{group_by}s'] = sorted(
+            ({id_field: group_id, name_field: names[group_id], **totals.summary()}
+             for group_id, totals in groups.items()),
+            key=lambda item: item['purchases'], reverse=True
+        )
+    return funnel
@@ -0,0 +1,385 @@
+"""
+Record and replay Graph API traffic
+GRAPH_TRANSPORT=record sends requests to Graph as usual and appends every
+response to GRAPH_CAPTURE; GRAPH_TRANSPORT=replay serves responses from it
+without touching the network.
+
+A capture is a gzip file with one member per JSON record. Members are
+appended with a single write each, so several gunicorn workers can record
+into the same file. The sidecar <capture>.idx holds fixed-size entries
+(key digest, offset, length) sorted by digest. Replay memory-maps both files
+and binary-searches the index, so opening a large capture is instant. The
+index header records how many capture bytes it covers; a missing index, or
+one whose size no longer matches the capture, is rebuilt by scanning it.
+
+Records are keyed by the normalized request: method, path without the API
+version, and sorted params with JSON values canonicalized. Access tokens and
+other secrets are never stored.
+
+    python -m app.graph_capture index graph_capture.ndjson.gz
+    python -m app.graph_capture stats graph_capture.ndjson.gz
+    python -m app.graph_capture dump graph_capture.ndjson.gz [path-substring]
+"""
+
+import bisect
+import gzip
+import hashlib
+import io
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+INDEX_MAGIC = b'GRIX2\n'
+_HEADER = struct.Struct('>Q')  # capture bytes covered by the index
+_ENTRIES_AT = len(INDEX_MAGIC) + _HEADER.size
+_ENTRY = struct.Struct('>16sQI')
+
+# Never part of a key and never written to disk
+SECRET_PARAMS = frozenset(['access_token', 'appsecret_proof', 'client_secret', 'code', 'fb_exchange_token'])
+# Response headers worth keeping for replay (throttling and content type)
+KEPT_HEADERS = ('content-type', 'x-app-usage', 'x-business-use-case-usage', 'x-ad-account-usage',
+                'x-fb-ads-insights-throttle')
+
+_SECRET_IN_TEXT = re.compile(r'((?:access_token|appsecret_proof|client_secret)(?:=|%3D|"\s*:\s*"))[^&"\s]+')
+_VERSION_PREFIX = re.compile(r'^/?v\d+\.\d+(?=/)')
+
+
+def _canonical_value(value: str) -> str:
+    if value[:1] in ('{', '['):
+        try:
+            return json.dumps(json.loads(value), sort_keys=True, separators=(',', ':'))
+        except ValueError:
+            pass
+    return value
+
+
+def request_key(method: str, url: str, body: Optional[str] = None) -> str:
+    """Stable key for a Graph request, independent of token, version and param order"""
+    parts = urlsplit(url)
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    if body:
+        params += parse_qsl(body, keep_blank_values=True)
+    params = sorted((name, _canonical_value(value)) for name, value in params if name not in SECRET_PARAMS)
+    path = _VERSION_PREFIX.sub('', parts.path) or '/'
+    return f'{method.upper()} {path}?{urlencode(params)}'
+
+
+def _digest(key: str) -> bytes:
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+
+def redact(text: str) -> str:
+    return _SECRET_IN_TEXT.sub(r'\1REDACTED', text)
+
+
+def _index_path(capture_path: str) -> str:
+    return capture_path + '.idx'
+
+
+def iter_members(capture_path: str, limit: Optional[int] = None) -> Iterator[Tuple[int, int, bytes]]:
+    """(offset, length, decompressed bytes) for every gzip member in the first `limit` bytes of a capture"""
+    with open(capture_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if limit is not None:
+            size = min(size, limit)
+        if not size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offset = 0
+            while offset < size:
+                decompressor = zlib.decompressobj(wbits=31)
+                chunks, position = [], offset
+                while not decompressor.eof and position < size:
+                    block = data[position:position + 65536]
+                    chunks.append(decompressor.decompress(block))
+                    position += len(block)
+                if not decompressor.eof:
+                    logger.warning(f"Truncated record at offset {offset} in {capture_path}, ignoring the rest")
+                    return
+                length = position - offset - len(decompressor.unused_data)
+                yield offset, length, b''.join(chunks)
+                offset += length
+
+
+def build_index(capture_path: str) -> int:
+    """Scan a capture and write its sorted sidecar index; returns the record count"""
+    # Captures only grow, so indexing exactly this many bytes makes the header size accurate
+    size = os.path.getsize(capture_path)
+    entries = []
+    for offset, length, raw in iter_members(capture_path, size):
+        try:
+            key = json.loads(raw)['key']
+        except (ValueError, KeyError):
+            continue
+        entries.append((_digest(key), offset, length))
+    _write_index(capture_path, size, entries)
+    return len(entries)
+
+
+def _indexed_size(index_path: str) -> Optional[int]:
+    """Capture size an index was built from; None for a missing or old-format index"""
+    try:
+        with open(index_path, 'rb') as f:
+            header = f.read(_ENTRIES_AT)
+    except OSError:
+        return None
+    if len(header) < _ENTRIES_AT or header[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+        return None
+    return _HEADER.unpack_from(header, len(INDEX_MAGIC))[0]
+
+
+def _write_index(capture_path: str, size: int, entries: List[Tuple[bytes, int, int]]) -> None:
+    # Stable sort keeps recording order among duplicates, so lookups can walk back from the newest
+    entries.sort(key=lambda entry: entry[0])
+    temp_path = _index_path(capture_path) + f'.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(INDEX_MAGIC)
+        f.write(_HEADER.pack(size))
+        for entry in entries:
+            f.write(_ENTRY.pack(*entry))
+    os.replace(temp_path, _index_path(capture_path))
+
+
+class CaptureWriter:
+    """Appends records to a capture; safe across threads and processes"""
+
+    def __init__(self, capture_path: str):
+        self.capture_path = capture_path
+        self._fd = os.open(capture_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict) -> None:
+        line = json.dumps(record, separators=(',', ':'), ensure_ascii=False).encode('utf-8') + b'\n'
+        member = gzip.compress(line, compresslevel=6, mtime=0)
+        with self._lock:
+            os.write(self._fd, member)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+class CaptureReader:
+    """Memory-mapped, indexed lookup of recorded responses.
+
+    A miss re-checks the capture size and re-indexes when records were
+    appended since the reader was opened.
+    """
+
+    def __init__(self, capture_path: str):
+        self.capture_path = capture_path
+        self._lock = threading.Lock()
+        self._maps = None
+        self._open()
+
+    def _open(self) -> None:
+        index_path = _index_path(self.capture_path)
+        if _indexed_size(index_path) != os.path.getsize(self.capture_path):
+            count = build_index(self.capture_path)
+            logger.info(f"Indexed {count} Graph records in {self.capture_path}")
+
+        with open(self.capture_path, 'rb') as data_file, open(index_path, 'rb') as index_file:
+            data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ) \
+                if os.fstat(data_file.fileno()).st_size else b''
+            index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if index[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError(f'{index_path} is not a Graph capture index')
+        size = _HEADER.unpack_from(index, len(INDEX_MAGIC))[0]
+        count = (len(index) - _ENTRIES_AT) // _ENTRY.size
+        # Swapped as one tuple; lookups in flight keep using the maps they started with
+        self._maps = (data, index, _DigestView(index, count), size)
+        self.count = count
+
+    def lookup(self, key: str) -> Optional[Dict]:
+        """The most recent successful record for a request key, else the most recent error"""
+        maps = self._maps
+        record = self._find(maps, key)
+        if record is None and os.path.getsize(self.capture_path) != maps[3]:
+            with self._lock:
+                if self._maps is maps:
+                    self._open()
+            record = self._find(self._maps, key)
+        return record
+
+    @staticmethod
+    def _find(maps: tuple, key: str) -> Optional[Dict]:
+        data, index, digests, _ = maps
+        digest = _digest(key)
+        position = bisect.bisect_right(digests, digest) - 1
+        latest_error = None
+        while position >= 0:
+            found, offset, length = _ENTRY.unpack_from(index, _ENTRIES_AT + position * _ENTRY.size)
+            if found != digest:
+                break
+            position -= 1
+            record = json.loads(zlib.decompress(data[offset:offset + length], wbits=31))
+            if record.get('key') != key:
+                continue  # digest collision
+            if record.get('status', 200) < 400:
+                return record
+            latest_error = latest_error or record
+        return latest_error
+
+    def close(self) -> None:
+        data, index, _, _ = self._maps
+        if isinstance(data, mmap.mmap):
+            data.close()
+        index.close()
+
+
+class _DigestView:
+    """Sequence of index digests read straight from the mmap, for bisect"""
+
+    def __init__(self, index, count: int):
+        self._index = index
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, position: int) -> bytes:
+        start = _ENTRIES_AT + position * _ENTRY.size
+        return self._index[start:start + 16]
+
+
+class RecordingAdapter(metrics.InstrumentedHTTPAdapter):
+    """Sends requests to Graph and appends each response to a capture"""
+
+    def __init__(self, writer: CaptureWriter, **kwargs):
+        super().__init__(**kwargs)
+        self.writer = writer
+
+    def send(self, request, **kwargs):
+        started = time.perf_counter()
+        response = super().send(request, **kwargs)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        try:
+            body = request.body.decode('utf-8') if isinstance(request.body, bytes) else request.body
+            self.writer.write({
+                'key': request_key(request.method, request.url, body),
+                'method': request.method,
+                'url': redact(_VERSION_PREFIX.sub('', urlsplit(request.url).path)),
+                'status': response.status_code,
+                'headers': {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers},
+                'body': redact(response.text),
+                'elapsed_ms': round(elapsed_ms, 1),
+                'recorded_at': time.time()
+            })
+        except Exception as e:
+            logger.warning(f"Could not record Graph response: {e}")
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """Answers Graph requests from a capture instead of the network"""
+
+    def __init__(self, reader: CaptureReader, replay_latency: bool = False):
+        super().__init__()
+        self.reader = reader
+        self.replay_latency = replay_latency
+        self.hits = 0
+        self.misses = 0
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        body = request.body.decode('utf-8') if isinstance(request.body, bytes) else request.body
+        key = request_key(request.method, request.url, body)
+        record = self.reader.lookup(key)
+
+        response = requests.Response()
+        response.url = request.url
+        response.request = request
+        response.encoding = 'utf-8'
+        if record is None:
+            self.misses += 1
+            logger.warning(f"No recorded Graph response for {key}")
+            response.status_code = 404
+            response.reason = 'Not Recorded'
+            response.headers['Content-Type'] = 'application/json'
+            response._content = json.dumps({'error': {
+                'message': f'No recorded response for {key}',
+                'type': 'GraphReplayMiss',
+                'code': 0
+            }}).encode('utf-8')
+        else:
+            self.hits += 1
+            if self.replay_latency and record.get('elapsed_ms'):
+                time.sleep(record['elapsed_ms'] / 1000.0)
+            response.status_code = record['status']
+            response.reason = 'OK' if record['status'] == 200 else 'Recorded Error'
+            response.headers.update(record.get('headers') or {})
+            response._content = record['body'].encode('utf-8')
+        response.raw = io.BytesIO(response._content)
+        return response
+
+    def close(self):
+        pass
+
+
+def install(mode: str, capture_path: str) -> BaseAdapter:
+    """Mount a recording or replaying transport on MetaAdsClient's session"""
+    import atexit
+    from app import meta_client
+
+    if mode == 'record':
+        writer = CaptureWriter(capture_path)
+        adapter = RecordingAdapter(writer, pool_connections=4,
+                                   pool_maxsize=int(os.getenv('GRAPH_POOL_SIZE', '20')))
+        atexit.register(writer.close)
+    elif mode == 'replay':
+        adapter = ReplayAdapter(CaptureReader(capture_path),
+                                replay_latency=os.getenv('GRAPH_REPLAY_LATENCY', '').lower() in ('1', 'true', 'yes'))
+    else:
+        raise ValueError(f'Unknown capture mode: {mode}')
+    meta_client.use_transport(adapter)
+    logger.info(f"Graph transport: {mode} {capture_path}")
+    return adapter
+
+
+def _main(argv: List[str]) -> int:
+    if len(argv) < 2 or argv[0] not in ('index', 'stats', 'dump'):
+        print(__doc__.strip().split('\n\n')[-1])
+        return 2
+    command, capture_path = argv[0], argv[1]
+    if command == 'index':
+        print(f'{build_index(capture_path)} records indexed')
+    elif command == 'stats':
+        records = compressed = raw_bytes = 0
+        paths: Dict[str, int] = {}
+        for _, length, raw in iter_members(capture_path):
+            records += 1
+            compressed += length
+            raw_bytes += len(raw)
+            path = metrics.normalize_endpoint(json.loads(raw).get('url', '?'))
+            paths[path] = paths.get(path, 0) + 1
+        print(f'{records} records, {raw_bytes} bytes raw, {compressed} bytes compressed')
+        for path, count in sorted(paths.items(), key=lambda item: -item[1]):
+            print(f'{count:8} {path}')
+    else:
+        needle = argv[2] if len(argv) > 2 else ''
+        for _, _, raw in iter_members(capture_path):
+            record = json.loads(raw)
+            if needle in record['key']:
+                print(json.dumps({k: record[k] for k in ('key', 'status', 'elapsed_ms')}))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(_main(sys.argv[1:]))
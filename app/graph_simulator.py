@@ -0,0 +1,993 @@
+"""
+Local stand-in for the Meta Graph API
+Serves deterministic synthetic ad accounts so MetaAdsClient can be exercised
+without Facebook credentials or network access.
+
+In process (mounts a requests transport on the MetaAdsClient session):
+
+    from app.graph_simulator import GraphSimulator, install
+    install(GraphSimulator(accounts=3, ads_per_account=10000, latency_ms=80))
+
+or set GRAPH_TRANSPORT=simulator (see GraphSimulator.from_env).
+
+As a server (point GRAPH_API_BASE_URL at it):
+
+    python -m app.graph_simulator --port 8089 --accounts 3 --ads 10000
+
+Supported: /me/adaccounts, /act_{id}, /act_{id}/{insights,campaigns,adsets,ads},
+/{campaign|adset|ad id}, /?ids=a,b, POST / batch=[...] of GETs and
+/{id}/insights with fields, level, time_range / date_preset, time_increment,
+breakdowns, filtering, sort and cursor pagination (limit/after, paging.next). Responses carry the throttling
+headers real accounts see, and error codes 17 (rate limit), 190 (expired
+token) and 100 (invalid parameter) can be scheduled or injected at random.
+"""
+
+import base64
+import io
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+
+DEFAULT_LIMIT = 25
+MAX_LIMIT = 5000
+
+# Per-ad daily base metrics, stored as tuples indexed by these positions
+SPEND, IMPRESSIONS, REACH, CLICKS, LINK_CLICKS, LANDING_VIEWS, ADD_TO_CART, CHECKOUTS, PURCHASES, REVENUE, LEADS = range(11)
+_METRIC_COUNT = 11
+
+BREAKDOWN_VALUES = {
+    'age': [('18-24', 0.16), ('25-34', 0.31), ('35-44', 0.24), ('45-54', 0.15), ('55-64', 0.09), ('65+', 0.05)],
+    'gender': [('female', 0.52), ('male', 0.45), ('unknown', 0.03)],
+    'publisher_platform': [('facebook', 0.55), ('instagram', 0.38), ('audience_network', 0.04), ('messenger', 0.03)],
+    'device_platform': [('mobile', 0.86), ('desktop', 0.14)],
+    'impression_device': [('iphone', 0.41), ('android_smartphone', 0.43), ('desktop', 0.12), ('ipad', 0.04)],
+    'country': [('US', 0.62), ('GB', 0.12), ('CA', 0.1), ('AU', 0.08), ('DE', 0.08)],
+    'region': [('California', 0.14), ('Texas', 0.1), ('Florida', 0.08), ('New York', 0.08), ('England', 0.1),
+               ('Ontario', 0.06), ('New South Wales', 0.05), ('Bavaria', 0.04), ('Unknown', 0.35)],
+    'dma': [('New York', 0.11), ('Los Angeles', 0.09), ('Chicago', 0.05), ('Dallas-Ft. Worth', 0.04),
+            ('Houston', 0.03), ('Unknown', 0.68)]
+}
+
+# platform_position values per publisher_platform, used for the 'placement' breakdown
+PLACEMENTS = {
+    'facebook': [('feed', 0.58), ('facebook_stories', 0.14), ('facebook_reels', 0.12),
+                 ('marketplace', 0.08), ('right_hand_column', 0.05), ('video_feeds', 0.03)],
+    'instagram': [('feed', 0.46), ('instagram_stories', 0.28), ('instagram_reels', 0.2), ('instagram_explore', 0.06)],
+    'audience_network': [('classic', 0.7), ('rewarded_video', 0.3)],
+    'messenger': [('messenger_inbox', 0.6), ('messenger_stories', 0.4)]
+}
+
+INSIGHTS_FIELDS = frozenset([
+    'account_id', 'account_name', 'account_currency', 'campaign_id', 'campaign_name',
+    'adset_id', 'adset_name', 'ad_id', 'ad_name', 'objective', 'spend', 'impressions', 'reach',
+    'frequency', 'clicks', 'inline_link_clicks', 'ctr', 'cpm', 'cpc', 'actions', 'action_values',
+    'purchase_roas', 'cost_per_action_type', 'conversions', 'conversion_values',
+    'date_start', 'date_stop'
+])
+
+_WEEKDAY_SCALE = (1.0, 1.03, 1.05, 1.02, 0.97, 0.88, 0.9)
+_PURCHASE_TYPES = ('purchase', 'omni_purchase', 'offsite_conversion.fb_pixel_purchase')
+
+
+class GraphError(Exception):
+    """Graph API error; rendered as the usual {"error": {...}} body"""
+
+    MESSAGES = {
+        17: '(#17) User request limit reached',
+        100: '(#100) Invalid parameter',
+        190: 'Error validating access token: Session has expired.'
+    }
+
+    def __init__(self, code: int, message: Optional[str] = None, status: int = 400, subcode: Optional[int] = None):
+        super().__init__(message or self.MESSAGES.get(code, 'An unknown error has occurred.'))
+        self.code = code
+        self.status = status
+        self.subcode = subcode
+
+    def body(self) -> Dict:
+        error = {
+            'message': str(self),
+            'type': 'OAuthException',
+            'code': self.code,
+            'fbtrace_id': base64.b32encode(os.urandom(10)).decode('ascii')
+        }
+        if self.subcode:
+            error['error_subcode'] = self.subcode
+        return {'error': error}
+
+
+class _Account:
+    """Synthetic account: campaigns > adsets > ads with per-ad daily base metrics"""
+
+    def __init__(self, number: int, account_id: str, name: str, currency: str, ads: int,
+                 ads_per_adset: int, adsets_per_campaign: int, seed: int, custom_conversions: bool):
+        rng = random.Random(f'{seed}:{account_id}')
+        self.account_id = account_id
+        self.name = name
+        self.currency = currency
+        self.custom_conversions = custom_conversions
+        self.seed = rng.random()
+        self.created = date.today() - timedelta(days=730)
+        self._group_cache: Dict = {}
+        self._lock = threading.Lock()
+
+        base = 120200000000000000 + number * 10 ** 8
+        adsets = max(1, -(-ads // ads_per_adset))
+        campaigns = max(1, -(-adsets // adsets_per_campaign))
+
+        self.campaigns = []
+        for c in range(campaigns):
+            roll = rng.random()
+            objective = 'OUTCOME_SALES' if roll < 0.7 else 'OUTCOME_LEADS' if roll < 0.85 else 'OUTCOME_TRAFFIC'
+            created = self.created + timedelta(days=rng.randrange(0, 600))
+            campaign = {
+                'id': str(base + c),
+                'name': f'{name} - Campaign {c + 1}',
+                'objective': objective,
+                'status': 'ACTIVE' if rng.random() < 0.8 else 'PAUSED',
+                'created_time': _timestamp(created),
+                'updated_time': _timestamp(created + timedelta(days=rng.randrange(0, 90))),
+                'start_time': _timestamp(created)
+            }
+            campaign['effective_status'] = campaign['status']
+            if rng.random() < 0.5:
+                campaign['daily_budget'] = str(rng.randrange(20, 500) * 100)
+            self.campaigns.append(campaign)
+
+        self.adsets = []
+        for s in range(adsets):
+            campaign = self.campaigns[s // adsets_per_campaign]
+            adset = {
+                'id': str(base + 10 ** 7 + s),
+                'name': f'{campaign["name"]} - Ad Set {s % adsets_per_campaign + 1}',
+                'campaign_id': campaign['id'],
+                'status': 'ACTIVE' if rng.random() < 0.85 else 'PAUSED',
+                'created_time': campaign['created_time'],
+                'updated_time': campaign['updated_time'],
+                'optimization_goal': 'OFFSITE_CONVERSIONS' if campaign['objective'] == 'OUTCOME_SALES' else 'LINK_CLICKS',
+                'billing_event': 'IMPRESSIONS'
+            }
+            adset['effective_status'] = adset['status'] if campaign['status'] == 'ACTIVE' else 'CAMPAIGN_PAUSED'
+            if 'daily_budget' not in campaign:
+                adset['daily_budget'] = str(rng.randrange(10, 200) * 100)
+            self.adsets.append(adset)
+
+        self.ads = []
+        self.base_metrics: List[Tuple[float, ...]] = []
+        object_types = (('VIDEO', 0.35), ('PHOTO', 0.25), ('SHARE', 0.3), ('STATUS', 0.1))
+        for i in range(ads):
+            s = min(i // ads_per_adset, adsets - 1)
+            adset = self.adsets[s]
+            c = s // adsets_per_campaign
+            campaign = self.campaigns[c]
+            status = 'ACTIVE' if rng.random() < 0.8 else 'PAUSED'
+            if adset['effective_status'] != 'ACTIVE':
+                effective_status = 'ADSET_PAUSED' if campaign['status'] == 'ACTIVE' else 'CAMPAIGN_PAUSED'
+            else:
+                effective_status = status
+            updated = datetime.strptime(adset['created_time'][:10], '%Y-%m-%d') + timedelta(
+                days=rng.randrange(0, 120), seconds=rng.randrange(0, 86400))
+            self.ads.append({
+                'id': str(base + 2 * 10 ** 7 + i),
+                'name': f'Ad {i + 1}',
+                'adset_id': adset['id'],
+                'campaign_id': campaign['id'],
+                'status': status,
+                'effective_status': effective_status,
+                'created_time': adset['created_time'],
+                'updated_time': updated.strftime('%Y-%m-%dT%H:%M:%S+0000'),
+                'creative': {'id': str(base + 3 * 10 ** 7 + i), 'object_type': _weighted(rng, object_types)},
+                '_adset': s,
+                '_campaign': c
+            })
+            self.base_metrics.append(_ad_base_metrics(rng, campaign['objective'], effective_status == 'ACTIVE'))
+
+        self.campaign_index = {campaign['id']: n for n, campaign in enumerate(self.campaigns)}
+        self.adset_index = {adset['id']: n for n, adset in enumerate(self.adsets)}
+        self.ad_index = {ad['id']: n for n, ad in enumerate(self.ads)}
+
+        self.breakdown_weights = {}
+        for dimension, values in BREAKDOWN_VALUES.items():
+            skewed = [(value, weight * (0.8 + 0.4 * rng.random())) for value, weight in values]
+            total = sum(weight for _, weight in skewed)
+            self.breakdown_weights[dimension] = [(value, weight / total) for value, weight in skewed]
+
+    def day_scale(self, day: date) -> float:
+        """Delivery multiplier for a day; deterministic and shared by every ad"""
+        if day < self.created:
+            return 0.0
+        jitter = random.Random(day.toordinal() + self.seed).random()
+        return _WEEKDAY_SCALE[day.weekday()] * (0.8 + 0.4 * jitter)
+
+    def node(self) -> Dict:
+        spent = sum(metrics[SPEND] for metrics in self.base_metrics) * 365
+        return {
+            'id': f'act_{self.account_id}',
+            'account_id': self.account_id,
+            'name': self.name,
+            'currency': self.currency,
+            'account_status': 1,
+            'timezone_name': 'America/Los_Angeles',
+            'amount_spent': str(int(spent * 100)),
+            'business_name': f'{self.name} Business'
+        }
+
+    def group_sums(self, level: str, ad_filter: Optional[frozenset]) -> List[Tuple[int, List[float]]]:
+        """Per-group sums of ad base metrics, cached per level and id filter"""
+        key = (level, ad_filter)
+        with self._lock:
+            cached = self._group_cache.get(key)
+        if cached is not None:
+            return cached
+
+        groups: Dict[int, List[float]] = {}
+        for n, metrics in enumerate(self.base_metrics):
+            if not metrics[SPEND] or (ad_filter is not None and n not in ad_filter):
+                continue
+            ad = self.ads[n]
+            group = 0 if level == 'account' else ad['_campaign'] if level == 'campaign' else ad['_adset'] if level == 'adset' else n
+            sums = groups.get(group)
+            if sums is None:
+                groups[group] = list(metrics)
+            else:
+                for m in range(_METRIC_COUNT):
+                    sums[m] += metrics[m]
+        result = sorted(groups.items())
+        with self._lock:
+            if len(self._group_cache) > 64:
+                self._group_cache.clear()
+            self._group_cache[key] = result
+        return result
+
+
+def _timestamp(day) -> str:
+    return day.strftime('%Y-%m-%dT00:00:00+0000')
+
+
+def _weighted(rng: random.Random, values) -> str:
+    roll = rng.random()
+    for value, weight in values:
+        roll -= weight
+        if roll <= 0:
+            return value
+    return values[-1][0]
+
+
+def _ad_base_metrics(rng: random.Random, objective: str, delivering: bool) -> Tuple[float, ...]:
+    if not delivering:
+        return (0.0,) * _METRIC_COUNT
+    spend = rng.lognormvariate(3.0, 1.0)
+    impressions = spend / rng.uniform(6.0, 25.0) * 1000
+    reach = impressions / rng.uniform(1.1, 2.4)
+    clicks = impressions * rng.uniform(0.004, 0.03)
+    link_clicks = clicks * rng.uniform(0.55, 0.9)
+    landing_views = link_clicks * rng.uniform(0.6, 0.9)
+    purchases = leads = add_to_cart = checkouts = revenue = 0.0
+    if objective == 'OUTCOME_SALES':
+        add_to_cart = landing_views * rng.uniform(0.05, 0.2)
+        checkouts = add_to_cart * rng.uniform(0.3, 0.7)
+        purchases = checkouts * rng.uniform(0.3, 0.8)
+        revenue = purchases * rng.uniform(25.0, 140.0)
+    elif objective == 'OUTCOME_LEADS':
+        leads = landing_views * rng.uniform(0.03, 0.15)
+    return (spend, impressions, reach, clicks, link_clicks, landing_views,
+            add_to_cart, checkouts, purchases, revenue, leads)
+
+
+def _encode_cursor(offset: int) -> str:
+    return base64.b64encode(str(offset).encode('ascii')).decode('ascii')
+
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.b64decode(cursor.encode('ascii')).decode('ascii'))
+    except (ValueError, UnicodeError):
+        raise GraphError(100, '(#100) Invalid cursor')
+
+
+def _parse_list(value) -> List[str]:
+    if value is None:
+        return []
+    value = value.strip()
+    if value.startswith('['):
+        try:
+            return [str(item) for item in json.loads(value)]
+        except ValueError:
+            raise GraphError(100, f'(#100) Invalid list parameter: {value}')
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def _split_fields(fields: str) -> List[str]:
+    """Split a fields list, keeping nested selections like creative{object_type} intact"""
+    result, depth, current = [], 0, ''
+    for char in fields or '':
+        if char == ',' and depth == 0:
+            if current.strip():
+                result.append(current.strip())
+            current = ''
+            continue
+        depth += char == '{'
+        depth -= char == '}'
+        current += char
+    if current.strip():
+        result.append(current.strip())
+    return result
+
+
+_OPERATORS = {
+    'EQUAL': lambda a, b: str(a) == str(b),
+    'NOT_EQUAL': lambda a, b: str(a) != str(b),
+    'GREATER_THAN': lambda a, b: float(a or 0) > float(b),
+    'GREATER_THAN_OR_EQUAL': lambda a, b: float(a or 0) >= float(b),
+    'LESS_THAN': lambda a, b: float(a or 0) < float(b),
+    'LESS_THAN_OR_EQUAL': lambda a, b: float(a or 0) <= float(b),
+    'IN': lambda a, b: str(a) in {str(v) for v in b},
+    'NOT_IN': lambda a, b: str(a) not in {str(v) for v in b},
+    'CONTAIN': lambda a, b: str(b).lower() in str(a or '').lower(),
+    'NOT_CONTAIN': lambda a, b: str(b).lower() not in str(a or '').lower()
+}
+
+
+def _parse_filtering(value: Optional[str]) -> List[Tuple[str, str, object]]:
+    if not value:
+        return []
+    try:
+        clauses = json.loads(value)
+        parsed = []
+        for clause in clauses:
+            operator = clause['operator'].upper()
+            if operator not in _OPERATORS:
+                raise GraphError(100, f'(#100) Filtering operator {operator} is not supported')
+            parsed.append((clause['field'].replace('.', '_'), operator, clause['value']))
+        return parsed
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise GraphError(100, '(#100) param filtering must be an array of {field, operator, value}')
+
+
+def _matches(record: Dict, clauses) -> bool:
+    for field, operator, value in clauses:
+        actual = record.get(field)
+        if field.endswith('_time') and isinstance(actual, str):
+            # *_time filters compare unix timestamps, as Graph does
+            actual = datetime.strptime(actual, '%Y-%m-%dT%H:%M:%S%z').timestamp()
+        try:
+            if not _OPERATORS[operator](actual, value):
+                return False
+        except (TypeError, ValueError):
+            return False
+    return True
+
+
+class GraphSimulator:
+    """Synthetic Graph API; thread-safe and deterministic for a given seed"""
+
+    def __init__(self, accounts=3, ads_per_account: int = 100, ads_per_adset: int = 5,
+                 adsets_per_campaign: int = 3, seed: int = 42, latency_ms: float = 0.0,
+                 latency_jitter_ms: float = 0.0, latency_per_row_ms: float = 0.0,
+                 call_budget: int = 600, window_seconds: float = 300.0,
+                 error_rates: Optional[Dict[int, float]] = None, expired_tokens=(),
+                 strict_fields: bool = False, custom_conversions: bool = False, currency: str = 'USD'):
+        """accounts is a count, or a {account_id: number_of_ads} mapping"""
+        self.seed = seed
+        self.ads_per_adset = ads_per_adset
+        self.adsets_per_campaign = adsets_per_campaign
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.latency_per_row_ms = latency_per_row_ms
+        self.call_budget = call_budget
+        self.window_seconds = window_seconds
+        self.error_rates = dict(error_rates or {})
+        self.expired_tokens = set(expired_tokens)
+        self.strict_fields = strict_fields
+        self.custom_conversions = custom_conversions
+        self.currency = currency
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._calls: Dict[str, deque] = {}
+        self._scheduled: List[Dict] = []
+        self._specs: Dict[str, Tuple[int, int, str, str]] = {}
+        self._accounts: Dict[str, _Account] = {}
+        self.request_count = 0
+
+        if isinstance(accounts, dict):
+            for account_id, ads in accounts.items():
+                self.add_account(str(account_id), ads=ads)
+        else:
+            for n in range(accounts):
+                self.add_account(str(1000000001 + n), ads=ads_per_account)
+
+    @classmethod
+    def from_env(cls) -> 'GraphSimulator':
+        """Build from GRAPH_SIM_* variables"""
+        return cls(
+            accounts=int(os.getenv('GRAPH_SIM_ACCOUNTS', '3')),
+            ads_per_account=int(os.getenv('GRAPH_SIM_ADS', '100')),
+            seed=int(os.getenv('GRAPH_SIM_SEED', '42')),
+            latency_ms=float(os.getenv('GRAPH_SIM_LATENCY_MS', '0')),
+            latency_jitter_ms=float(os.getenv('GRAPH_SIM_LATENCY_JITTER_MS', '0')),
+            latency_per_row_ms=float(os.getenv('GRAPH_SIM_LATENCY_PER_ROW_MS', '0')),
+            call_budget=int(os.getenv('GRAPH_SIM_CALL_BUDGET', '600'))
+        )
+
+    def add_account(self, account_id: str, ads: int = 100, name: Optional[str] = None,
+                    currency: Optional[str] = None) -> str:
+        """Register an account; its structure is generated on first use"""
+        with self._lock:
+            number = len(self._specs) + 1
+            self._specs[account_id] = (number, ads, name or f'Account {number}', currency or self.currency)
+            self._accounts.pop(account_id, None)
+        return account_id
+
+    def account_ids(self) -> List[str]:
+        return list(self._specs)
+
+    def account(self, account_id: str) -> _Account:
+        account = self._accounts.get(account_id)
+        if account is not None:
+            return account
+        spec = self._specs.get(account_id)
+        if spec is None:
+            raise GraphError(100, f'(#100) Ad account owner has NOT grant ads_management or ads_read permission',
+                             subcode=33)
+        number, ads, name, currency = spec
+        account = _Account(number, account_id, name, currency, ads, self.ads_per_adset,
+                           self.adsets_per_campaign, self.seed, self.custom_conversions)
+        with self._lock:
+            return self._accounts.setdefault(account_id, account)
+
+    def fail(self, code: int, times: int = 1, path_contains: Optional[str] = None,
+             message: Optional[str] = None) -> None:
+        """Make the next matching request(s) fail with the given Graph error code"""
+        with self._lock:
+            self._scheduled.append({'code': code, 'times': times, 'path': path_contains, 'message': message})
+
+    # Request handling
+
+    def handle(self, method: str, path: str, params: Dict[str, str], url: str = '') -> Tuple[int, Dict, Dict]:
+        """Serve one request; returns (status, headers, body)"""
+        path = path.strip('/')
+        if path.startswith('v') and path.split('/', 1)[0][1:].replace('.', '').isdigit():
+            path = path.split('/', 1)[1] if '/' in path else ''
+        parts = path.split('/') if path else []
+
+        if not parts and method.upper() == 'POST' and params.get('batch'):
+            return self._batch(params, url)
+
+        headers = {'Content-Type': 'application/json; charset=UTF-8'}
+        rows = 0
+        try:
+            self._check_token(params.get('access_token'))
+            self._check_scheduled(path)
+            account_id = self._account_for_path(parts)
+            headers.update(self._throttle(account_id))
+            if method.upper() != 'GET':
+                raise GraphError(100, f'(#100) Unsupported {method} request')
+            body = self._route(parts, params, url)
+            rows = len(body.get('data', ())) if isinstance(body.get('data'), list) else 1
+            status = 200
+        except GraphError as e:
+            status, body = e.status, e.body()
+            headers['WWW-Authenticate'] = f'OAuth "Facebook Platform" "invalid_token" "{e}"'
+        self._sleep(rows)
+        with self._lock:
+            self.request_count += 1
+        return status, headers, body
+
+    def _batch(self, params: Dict[str, str], url: str) -> Tuple[int, Dict, object]:
+        """POST / with batch=[{method, relative_url}]: each GET is served (and throttled) on its own"""
+        headers = {'Content-Type': 'application/json; charset=UTF-8'}
+        try:
+            requests_ = json.loads(params['batch'])
+            if not isinstance(requests_, list) or len(requests_) > 50:
+                raise ValueError
+        except (ValueError, TypeError):
+            error = GraphError(100, '(#100) param batch must be a JSON array of at most 50 requests')
+            return error.status, headers, error.body()
+
+        origin = urlsplit(url)
+        results = []
+        for item in requests_:
+            path, _, query = str(item.get('relative_url', '')).partition('?')
+            item_params = dict(parse_qsl(query, keep_blank_values=True))
+            item_params.setdefault('access_token', params.get('access_token'))
+            status, item_headers, body = self.handle(item.get('method', 'GET'), path, item_params,
+                                                     f'{origin.scheme}://{origin.netloc}/{path.lstrip("/")}?{query}')
+            results.append({
+                'code': status,
+                'headers': [{'name': name, 'value': value} for name, value in item_headers.items()],
+                'body': json.dumps(body)
+            })
+        return 200, headers, results
+
+    def _check_token(self, token: Optional[str]) -> None:
+        if not token:
+            raise GraphError(190, 'An active access token must be used to query information about the current user.')
+        if token in self.expired_tokens or token.startswith('expired'):
+            raise GraphError(190, subcode=463)
+
+    def _check_scheduled(self, path: str) -> None:
+        with self._lock:
+            for entry in self._scheduled:
+                if entry['path'] is None or entry['path'] in path:
+                    entry['times'] -= 1
+                    if entry['times'] <= 0:
+                        self._scheduled.remove(entry)
+                    raise GraphError(entry['code'], entry['message'])
+            for code, rate in self.error_rates.items():
+                if rate and self._rng.random() < rate:
+                    raise GraphError(code)
+
+    def _account_for_path(self, parts: List[str]) -> Optional[str]:
+        if parts and parts[0].startswith('act_'):
+            return parts[0][4:]
+        return None
+
+    def _throttle(self, account_id: Optional[str]) -> Dict[str, str]:
+        """Count calls per account in a sliding window and report usage like Graph does"""
+        key = account_id or 'app'
+        now = time.monotonic()
+        with self._lock:
+            calls = self._calls.setdefault(key, deque())
+            while calls and calls[0] < now - self.window_seconds:
+                calls.popleft()
+            calls.append(now)
+            used = len(calls)
+        pct = min(100, int(used * 100 / max(1, self.call_budget)))
+        regain = 0 if used <= self.call_budget else int(self.window_seconds / 60) or 1
+        headers = {
+            'x-app-usage': json.dumps({'call_count': pct, 'total_cputime': pct // 2, 'total_time': pct // 2}),
+            'x-fb-ads-insights-throttle': json.dumps({'app_id_util_pct': pct // 2, 'acc_id_util_pct': pct,
+                                                      'ads_api_access_tier': 'standard_access'})
+        }
+        if account_id:
+            headers['x-business-use-case-usage'] = json.dumps({account_id: [{
+                'type': 'ads_insights', 'call_count': pct, 'total_cputime': pct // 2,
+                'total_time': pct // 2, 'estimated_time_to_regain_access': regain
+            }]})
+        if used > self.call_budget:
+            raise GraphError(17)
+        return headers
+
+    def _sleep(self, rows: int) -> None:
+        delay = self.latency_ms + self.latency_per_row_ms * rows
+        if self.latency_jitter_ms:
+            with self._lock:
+                delay += self._rng.uniform(0, self.latency_jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def _route(self, parts: List[str], params: Dict[str, str], url: str) -> Dict:
+        if not parts and params.get('ids'):
+            return self._multi_get(_parse_list(params['ids']), params.get('fields') or 'id,name')
+        if parts == ['me', 'adaccounts']:
+            records = [self.account(account_id).node() for account_id in self._specs]
+            return self._page(records, params, url, default_fields='id')
+        if len(parts) not in (1, 2):
+            raise GraphError(100, f'(#100) Unknown path components: /{"/".join(parts[2:])}')
+
+        node, edge = parts[0], parts[1] if len(parts) == 2 else None
+        if node.startswith('act_'):
+            account = self.account(node[4:])
+            if edge is None:
+                return self._project(account.node(), params.get('fields') or 'id')
+            if edge == 'insights':
+                return self._insights(account, None, 'account', params, url)
+            if edge in ('campaigns', 'adsets', 'ads'):
+                records = getattr(account, edge)
+                return self._page(records, params, url, default_fields='id')
+            raise GraphError(100, f'(#100) Tried accessing nonexisting field ({edge}) on node type (AdAccount)')
+
+        account, kind, index = self._find_object(node)
+        if edge is None:
+            record = getattr(account, kind + 's')[index]
+            return self._project(record, params.get('fields') or 'id,name')
+        if edge == 'insights':
+            if kind == 'campaign':
+                ads = frozenset(n for n, ad in enumerate(account.ads) if ad['_campaign'] == index)
+            elif kind == 'adset':
+                ads = frozenset(n for n, ad in enumerate(account.ads) if ad['_adset'] == index)
+            else:
+                ads = frozenset([index])
+            return self._insights(account, ads, kind, params, url)
+        if edge in ('adsets', 'ads') and kind in ('campaign', 'adset'):
+            key = 'campaign_id' if kind == 'campaign' else 'adset_id'
+            records = [record for record in getattr(account, edge) if record.get(key) == node]
+            return self._page(records, params, url, default_fields='id')
+        raise GraphError(100, f'(#100) Tried accessing nonexisting field ({edge})')
+
+    def _multi_get(self, object_ids: List[str], fields: str) -> Dict:
+        """GET /?ids=a,b: one node per id, keyed by id; any unknown id fails the request"""
+        result = {}
+        for object_id in object_ids:
+            account, kind, index = self._find_object(object_id)
+            record = dict(getattr(account, kind + 's')[index], account_id=account.account_id)
+            result[object_id] = self._project(record, fields)
+        return result
+
+    def _find_object(self, object_id: str):
+        for account_id in self._specs:
+            account = self.account(account_id)
+            for kind, index in (('campaign', account.campaign_index), ('adset', account.adset_index),
+                                ('ad', account.ad_index)):
+                if object_id in index:
+                    return account, kind, index[object_id]
+        raise GraphError(100, f"(#100) Unsupported get request. Object with ID '{object_id}' does not exist")
+
+    def _project(self, record: Dict, fields: str) -> Dict:
+        result = {}
+        for field in _split_fields(fields):
+            name, _, nested = field.partition('{')
+            if name not in record:
+                continue
+            value = record[name]
+            if nested and isinstance(value, dict):
+                value = self._project(value, nested.rstrip('}') + ',id')
+            result[name] = value
+        result.setdefault('id', record.get('id'))
+        return result
+
+    def _page(self, records: List[Dict], params: Dict[str, str], url: str, default_fields: str) -> Dict:
+        clauses = _parse_filtering(params.get('filtering'))
+        statuses = _parse_list(params.get('effective_status'))
+        if clauses or statuses:
+            records = [r for r in records if _matches(r, clauses)
+                       and (not statuses or r.get('effective_status') in statuses)]
+        fields = params.get('fields') or default_fields
+        return self._paginate((self._project(r, fields) for r in records), params, url)
+
+    def _paginate(self, rows: Iterator[Dict], params: Dict[str, str], url: str) -> Dict:
+        try:
+            limit = min(int(params.get('limit') or DEFAULT_LIMIT), MAX_LIMIT)
+        except ValueError:
+            raise GraphError(100, '(#100) param limit must be an integer')
+        offset = _decode_cursor(params['after']) if params.get('after') else 0
+
+        page = []
+        for n, row in enumerate(rows):
+            if n < offset:
+                continue
+            if len(page) == limit:
+                break
+            page.append(row)
+        else:
+            n = None  # exhausted
+
+        body = {'data': page}
+        if page:
+            paging = {'cursors': {'before': _encode_cursor(offset), 'after': _encode_cursor(offset + len(page))}}
+            if n is not None and url:
+                next_params = dict(params)
+                next_params['after'] = paging['cursors']['after']
+                next_params.pop('before', None)
+                paging['next'] = f'{url.split("?", 1)[0]}?{urlencode(next_params)}'
+            body['paging'] = paging
+        return body
+
+    # Insights
+
+    def insights_rows(self, account_id: str, **params) -> List[Dict]:
+        """Every insights row an /act_{id}/insights request would page through"""
+        params = {key: value if isinstance(value, str) else json.dumps(value) if isinstance(value, (dict, list))
+                  else str(value) for key, value in params.items()}
+        return list(self._insight_rows(self.account(account_id), None, 'account', params))
+
+    def _insights(self, account: _Account, ads: Optional[frozenset], node_level: str,
+                  params: Dict[str, str], url: str) -> Dict:
+        return self._paginate(self._insight_rows(account, ads, node_level, params), params, url)
+
+    def _insight_rows(self, account: _Account, ads: Optional[frozenset], node_level: str,
+                      params: Dict[str, str]) -> Iterator[Dict]:
+        level = params.get('level') or node_level
+        if level not in ('account', 'campaign', 'adset', 'ad'):
+            raise GraphError(100, f'(#100) param level must be one of {{ad, adset, campaign, account}}')
+
+        fields = _split_fields(params.get('fields') or 'spend,impressions,date_start,date_stop')
+        unknown = [field for field in fields if field not in INSIGHTS_FIELDS]
+        if unknown and self.strict_fields:
+            raise GraphError(100, f'(#100) {unknown[0]} is not valid for fields param')
+        fields = [field for field in fields if field in INSIGHTS_FIELDS]
+
+        breakdowns = _parse_list(params.get('breakdowns'))
+        for breakdown in breakdowns:
+            if breakdown not in BREAKDOWN_VALUES and breakdown not in ('placement', 'platform_position'):
+                raise GraphError(100, f'(#100) {breakdown} is not a valid breakdown')
+
+        since, until = self._time_range(params)
+        buckets = self._buckets(account, since, until, params.get('time_increment', 'all_days'))
+
+        clauses = _parse_filtering(params.get('filtering'))
+        id_clauses = [c for c in clauses if c[0] in ('campaign_id', 'adset_id', 'ad_id')]
+        metric_clauses = [c for c in clauses if c not in id_clauses]
+        if id_clauses:
+            selected = frozenset(n for n, ad in enumerate(account.ads)
+                                 if _matches({'campaign_id': ad['campaign_id'], 'adset_id': ad['adset_id'],
+                                              'ad_id': ad['id']}, id_clauses))
+            ads = selected if ads is None else ads & selected
+        groups = account.group_sums(level, ads)
+        combos = self._combos(account, breakdowns)
+
+        def generate():
+            for date_start, date_stop, scale in buckets:
+                if not scale:
+                    continue
+                for group, sums in groups:
+                    for dimensions, weight in combos:
+                        factor = scale * weight
+                        metrics = [value * factor for value in sums]
+                        row = self._insight_row(account, level, group, metrics, fields, date_start, date_stop)
+                        row.update(dimensions)
+                        if metric_clauses:
+                            candidate = self._numeric(metrics)
+                            candidate.update(dimensions)
+                            if not _matches(candidate, metric_clauses):
+                                continue
+                        yield row
+
+        rows = generate()
+        sort = _parse_list(params.get('sort'))
+        if sort:
+            field, _, direction = sort[0].rpartition('_')
+            rows = iter(sorted(rows, key=lambda r: float(r.get(field) or 0), reverse=direction == 'descending'))
+        return rows
+
+    def _time_range(self, params: Dict[str, str]) -> Tuple[date, date]:
+        today = date.today()
+        if params.get('time_range'):
+            try:
+                time_range = json.loads(params['time_range'])
+                since = datetime.strptime(time_range['since'], '%Y-%m-%d').date()
+                until = datetime.strptime(time_range['until'], '%Y-%m-%d').date()
+            except (ValueError, KeyError, TypeError):
+                raise GraphError(100, '(#100) param time_range must be {"since":"YYYY-MM-DD","until":"YYYY-MM-DD"}')
+            if since > until:
+                raise GraphError(100, '(#100) time_range since must be before until')
+            return since, until
+        preset = params.get('date_preset', 'last_30d')
+        presets = {'today': 0, 'yesterday': 1, 'last_3d': 3, 'last_7d': 7, 'last_14d': 14,
+                   'last_28d': 28, 'last_30d': 30, 'last_90d': 90, 'maximum': 37 * 30}
+        if preset not in presets:
+            raise GraphError(100, f'(#100) date_preset {preset} is not supported')
+        if preset == 'today':
+            return today, today
+        if preset == 'yesterday':
+            day = today - timedelta(days=1)
+            return day, day
+        return today - timedelta(days=presets[preset]), today - timedelta(days=1)
+
+    def _buckets(self, account: _Account, since: date, until: date, increment) -> List[Tuple[str, str, float]]:
+        days = [since + timedelta(days=n) for n in range((until - since).days + 1)]
+        if increment in (None, '', 'all_days'):
+            chunks = [days]
+        elif increment == 'monthly':
+            chunks = []
+            for day in days:
+                if not chunks or (chunks[-1][0].year, chunks[-1][0].month) != (day.year, day.month):
+                    chunks.append([])
+                chunks[-1].append(day)
+        else:
+            try:
+                step = int(increment)
+            except ValueError:
+                raise GraphError(100, '(#100) param time_increment must be an integer 1-90, monthly or all_days')
+            if not 1 <= step <= 90:
+                raise GraphError(100, '(#100) param time_increment must be an integer 1-90, monthly or all_days')
+            chunks = [days[n:n + step] for n in range(0, len(days), step)]
+        return [(chunk[0].isoformat(), chunk[-1].isoformat(), sum(account.day_scale(day) for day in chunk))
+                for chunk in chunks if chunk]
+
+    def _combos(self, account: _Account, breakdowns: List[str]) -> List[Tuple[Dict, float]]:
+        combos = [({}, 1.0)]
+        for breakdown in breakdowns:
+            expanded = []
+            for dimensions, weight in combos:
+                if breakdown in ('placement', 'platform_position'):
+                    platform = dimensions.get('publisher_platform')
+                    platforms = [(platform, 1.0)] if platform else account.breakdown_weights['publisher_platform']
+                    for name, platform_weight in platforms:
+                        for position, position_weight in PLACEMENTS[name]:
+                            values = dict(dimensions, **{breakdown: position})
+                            if not platform:
+                                values['publisher_platform'] = name
+                            expanded.append((values, weight * platform_weight * position_weight))
+                    continue
+                for value, value_weight in account.breakdown_weights[breakdown]:
+                    expanded.append((dict(dimensions, **{breakdown: value}), weight * value_weight))
+            combos = expanded
+        return combos
+
+    @staticmethod
+    def _numeric(metrics: List[float]) -> Dict:
+        spend, impressions, clicks = metrics[SPEND], metrics[IMPRESSIONS], metrics[CLICKS]
+        return {
+            'spend': spend,
+            'impressions': impressions,
+            'clicks': clicks,
+            'reach': metrics[REACH],
+            'ctr': clicks / impressions * 100 if impressions else 0,
+            'cpm': spend / impressions * 1000 if impressions else 0,
+            'cpc': spend / clicks if clicks else 0,
+            'purchase_roas': metrics[REVENUE] / spend if spend else 0
+        }
+
+    def _insight_row(self, account: _Account, level: str, group: int, metrics: List[float],
+                     fields: List[str], date_start: str, date_stop: str) -> Dict:
+        spend = metrics[SPEND]
+        impressions = int(metrics[IMPRESSIONS])
+        clicks = int(metrics[CLICKS])
+        reach = int(metrics[REACH])
+        purchases = int(round(metrics[PURCHASES]))
+        revenue = metrics[REVENUE]
+
+        if level == 'ad':
+            ad = account.ads[group]
+            adset, campaign = account.adsets[ad['_adset']], account.campaigns[ad['_campaign']]
+        elif level == 'adset':
+            ad, adset = None, account.adsets[group]
+            campaign = account.campaigns[account.campaign_index[adset['campaign_id']]]
+        elif level == 'campaign':
+            ad = adset = None
+            campaign = account.campaigns[group]
+        else:
+            ad = adset = campaign = None
+
+        row = {}
+        for field in fields:
+            if field == 'spend':
+                row[field] = f'{spend:.2f}'
+            elif field == 'impressions':
+                row[field] = str(impressions)
+            elif field == 'clicks':
+                row[field] = str(clicks)
+            elif field == 'inline_link_clicks':
+                row[field] = str(int(metrics[LINK_CLICKS]))
+            elif field == 'reach':
+                row[field] = str(reach)
+            elif field == 'frequency':
+                row[field] = f'{impressions / reach:.6f}' if reach else '0'
+            elif field == 'ctr':
+                row[field] = f'{clicks / impressions * 100:.6f}' if impressions else '0'
+            elif field == 'cpm':
+                row[field] = f'{spend / impressions * 1000:.6f}' if impressions else '0'
+            elif field == 'cpc':
+                row[field] = f'{spend / clicks:.6f}' if clicks else '0'
+            elif field == 'actions':
+                actions = self._actions(metrics)
+                if actions:
+                    row[field] = actions
+            elif field == 'action_values':
+                if purchases:
+                    row[field] = [{'action_type': action_type, 'value': f'{revenue:.2f}'}
+                                  for action_type in _PURCHASE_TYPES]
+            elif field == 'purchase_roas':
+                if purchases and spend:
+                    row[field] = [{'action_type': 'omni_purchase', 'value': f'{revenue / spend:.6f}'}]
+            elif field == 'cost_per_action_type':
+                costs = [{'action_type': action['action_type'], 'value': f'{spend / int(action["value"]):.6f}'}
+                         for action in self._actions(metrics) if int(action['value'])]
+                if costs:
+                    row[field] = costs
+            elif field == 'conversions':
+                if account.custom_conversions and purchases:
+                    row[field] = [{'action_type': 'offsite_conversion.custom.1000', 'value': str(purchases)}]
+            elif field == 'conversion_values':
+                if account.custom_conversions and purchases:
+                    row[field] = [{'action_type': 'offsite_conversion.custom.1000', 'value': f'{revenue:.2f}'}]
+            elif field == 'account_id':
+                row[field] = account.account_id
+            elif field == 'account_name':
+                row[field] = account.name
+            elif field == 'account_currency':
+                row[field] = account.currency
+            elif field in ('campaign_id', 'campaign_name', 'objective') and campaign is not None:
+                row[field] = campaign['id' if field == 'campaign_id' else 'name' if field == 'campaign_name' else 'objective']
+            elif field in ('adset_id', 'adset_name') and adset is not None:
+                row[field] = adset['id' if field == 'adset_id' else 'name']
+            elif field in ('ad_id', 'ad_name') and ad is not None:
+                row[field] = ad['id' if field == 'ad_id' else 'name']
+        row['date_start'] = date_start
+        row['date_stop'] = date_stop
+        return row
+
+    @staticmethod
+    def _actions(metrics: List[float]) -> List[Dict]:
+        counts = (
+            ('link_click', metrics[LINK_CLICKS]),
+            ('landing_page_view', metrics[LANDING_VIEWS]),
+            ('add_to_cart', metrics[ADD_TO_CART]),
+            ('initiate_checkout', metrics[CHECKOUTS]),
+            ('lead', metrics[LEADS])
+        )
+        actions = [{'action_type': action_type, 'value': str(int(round(value)))}
+                   for action_type, value in counts if round(value) >= 1]
+        purchases = int(round(metrics[PURCHASES]))
+        if purchases:
+            actions.extend({'action_type': action_type, 'value': str(purchases)} for action_type in _PURCHASE_TYPES)
+        return actions
+
+    # Transports
+
+    def wsgi_app(self, environ, start_response):
+        """WSGI entry point so the simulator can run as a standalone server"""
+        from werkzeug.wrappers import Request, Response
+        request = Request(environ)
+        params = dict(request.args)
+        if request.method == 'POST':
+            params.update(request.form)
+        status, headers, body = self.handle(request.method, request.path, params, request.base_url)
+        response = Response(json.dumps(body), status=status, headers=headers)
+        return response(environ, start_response)
+
+
+class SimulatorAdapter(BaseAdapter):
+    """requests transport that answers from a GraphSimulator instead of the network"""
+
+    def __init__(self, simulator: GraphSimulator):
+        super().__init__()
+        self.simulator = simulator
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        parts = urlsplit(request.url)
+        params = dict(parse_qsl(parts.query, keep_blank_values=True))
+        if request.body:
+            body = request.body.decode('utf-8') if isinstance(request.body, bytes) else request.body
+            params.update(parse_qsl(body, keep_blank_values=True))
+        started = time.perf_counter()
+        status, headers, body = self.simulator.handle(request.method, parts.path, params, request.url)
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        if read_timeout is not None and time.perf_counter() - started > read_timeout:
+            raise requests.exceptions.ReadTimeout(f'Simulated read timed out (read timeout={read_timeout})')
+
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response._content = json.dumps(body).encode('utf-8')
+        response.raw = io.BytesIO(response._content)
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.reason = 'OK' if status == 200 else 'Bad Request'
+        return response
+
+    def close(self):
+        pass
+
+
+def install(simulator: Optional[GraphSimulator] = None) -> GraphSimulator:
+    """Route MetaAdsClient's Graph requests to a simulator in this process"""
+    from app import meta_client
+    simulator = simulator or GraphSimulator.from_env()
+    meta_client.use_transport(SimulatorAdapter(simulator))
+    return simulator
+
+
+if __name__ == '__main__':
+    import argparse
+    from werkzeug.serving import run_simple
+
+    parser = argparse.ArgumentParser(description='Local Graph API simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--accounts', type=int, default=3)
+    parser.add_argument('--ads', type=int, default=100, help='ads per account')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--call-budget', type=int, default=600)
+    args = parser.parse_args()
+
+    simulator = GraphSimulator(accounts=args.accounts, ads_per_account=args.ads, seed=args.seed,
+                               latency_ms=args.latency_ms, latency_jitter_ms=args.jitter_ms,
+                               call_budget=args.call_budget)
+    print(f'Graph simulator on http://{args.host}:{args.port} with accounts {", ".join(simulator.account_ids())}')
+    print(f'Set GRAPH_API_BASE_URL=http://{args.host}:{args.port}')
+    run_simple(args.host, args.port, simulator.wsgi_app, threaded=True)
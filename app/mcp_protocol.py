@@ -4,25 +4,68 @@ Provides SSE endpoint for Claude integration
 """
 
 import json
+import os
 import uuid
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
 from app.models import User, AdAccount, MCPSession
-from app.meta_client import MetaAdsClient
+from app.meta_client import MetaAdsClient, parallel_map, rank_and_compare
+from app import filtering, funnel, pacing, portfolio, serialization
+from app.scheduler import GraphCapacityError, INTERACTIVE, graph_scheduler
+from app.result_cursors import cursor_store, PAGING_PROPERTIES
+from app.tool_registry import ToolRegistry, InitializeResults, UnknownToolError
+
+# Tools are registered on MCPHandler methods below; schemas are built once
+# per process and tools/list reuses the cached result. The oauth registry's
+# auth, account and caching middleware is not shared: the /mcp route has
+# already authenticated the user and MCPHandler loads their accounts and
+# clients once per handler, and handle_message maps errors to JSON-RPC.
+protocol_tools = ToolRegistry(default_timeout=float(os.getenv('TOOL_TIMEOUT_SECONDS', '90')))
+
+
+@protocol_tools.use
+def _apply_defaults(spec, handler, arguments, call_next):
+    """Fill in date range and account for tools that declare them"""
+    properties = spec.input_schema.get('properties', {})
+    
+    # Set default dates if not provided
+    if 'since' in properties and 'since' not in arguments:
+        arguments['since'] = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+    if 'until' in properties and 'until' not in arguments:
+        arguments['until'] = datetime.now().strftime('%Y-%m-%d')
+    
+    # Get default account if not specified
+    if 'account_id' in properties and 'account_id' not in arguments:
+        if handler.ad_accounts:
+            arguments['account_id'] = handler.ad_accounts[0].account_id
+        else:
+            # Use demo account ID when no real accounts exist
+            arguments['account_id'] = 'demo_account'
+    
+    return call_next(handler, arguments)
+
+initialize_results = InitializeResults({
+    'name': 'Zane - Meta Ads Connector',
+    'version': '1.0.0'
+})
 
 class MCPHandler:
     """Handles MCP protocol messages and tool execution"""
     
-    def __init__(self, user: User):
+    def __init__(self, user: User, json_style: Optional[str] = None):
         self.user = user
+        self.json_style = json_style  # Client preference for tool result formatting
         self.meta_clients = {}
+        self.ad_accounts = []
         print(f"MCP Handler initialized for user: {user.email if user else 'None'}")
         self._initialize_clients()
     
     def _initialize_clients(self):
         """Initialize Meta API clients for all user's ad accounts"""
         try:
-            for account in self.user.ad_accounts:
+            # Accounts are loaded once per handler and shared by every tool call
+            self.ad_accounts = self.user.get_ad_accounts()
+            for account in self.ad_accounts:
                 if account.is_active:
                     self.meta_clients[account.account_id] = MetaAdsClient(
                         access_token=account.access_token
@@ -69,6 +112,10 @@ class MCPHandler:
                 if tools_count > 0:
                     print(f"MCP Protocol: First tool: {result['tools'][0]['name']}")
             
+            return response
+        except GraphCapacityError as e:
+            response = self._error_response(message_id, str(e), -32000)
+            response['error']['data'] = {'retry_after': e.retry_after}
             return response
         except Exception as e:
             print(f"MCP Protocol: Error handling {method}: {e}")
@@ -80,220 +127,11 @@ class MCPHandler:
         """Initialize MCP session"""
         # Use the same protocol version that Claude sent
         client_protocol = params.get('protocolVersion', '2024-11-05')
-        
-        return {
-            'protocolVersion': client_protocol,  # Match Claude's protocol version
-            'capabilities': {
-                'tools': {},  # We support tools
-            },
-            'serverInfo': {
-                'name': 'Zane - Meta Ads Connector',
-                'version': '1.0.0'
-            }
-        }
+        return initialize_results.get(client_protocol).data
     
     def _handle_list_tools(self, params: Dict) -> Dict:
         """Return list of available tools"""
-        # Start with minimal tools to ensure they load
-        tools = [
-            {
-                'name': 'get_meta_ads_overview',
-                'description': 'Get Meta Ads account overview with key metrics',
-                'inputSchema': {
-                    'type': 'object',
-                    'properties': {},
-                    'required': []
-                }
-            },
-            {
-                'name': 'get_account_overview',
-                'description': 'Get comprehensive overview of ad account performance including spend, revenue, ROAS, CTR, CPC, and CPM',
-                'inputSchema': {
-                    'type': 'object',
-                    'properties': {
-                        'account_id': {
-                            'type': 'string',
-                            'description': 'Meta Ad Account ID (optional, uses default if not provided)'
-                        },
-                        'since': {
-                            'type': 'string',
-                            'description': 'Start date YYYY-MM-DD (optional, defaults to 30 days ago)'
-                        },
-                        'until': {
-                            'type': 'string',
-                            'description': 'End date YYYY-MM-DD (optional, defaults to today)'
-                        }
-                    },
-                    'required': [],
-                    'additionalProperties': False
-                }
-            },
-            {
-                'name': 'get_campaigns_performance',
-                'description': 'Get detailed performance metrics for all campaigns including ROAS, spend, impressions, clicks, and conversions',
-                'inputSchema': {
-                    'type': 'object',
-                    'properties': {
-                        'account_id': {
-                            'type': 'string',
-                            'description': 'Meta Ad Account ID (optional)'
-                        },
-                        'since': {
-                            'type': 'string',
-                            'description': 'Start date YYYY-MM-DD'
-                        },
-                        'until': {
-                            'type': 'string',
-                            'description': 'End date YYYY-MM-DD'
-                        }
-                    },
-                    'required': [],
-                    'additionalProperties': False
-                }
-            },
-            {
-                'name': 'get_adsets_performance',
-                'description': 'Get performance metrics for all ad sets including targeting, budget, and results',
-                'inputSchema': {
-                    'type': 'object',
-                    'properties': {
-                        'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
-                        'campaign_id': {'type': 'string', 'description': 'Filter by specific campaign (optional)'},
-                        'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
-                        'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'}
-                    }
-                }
-            },
-            {
-                'name': 'get_top_performing_ads',
-                'description': 'Get top performing ads by ROAS, CTR, or conversions',
-                'inputSchema': {
-                    'type': 'object',
-                    'properties': {
-                        'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
-                        'metric': {'type': 'string', 'description': 'Metric to sort by: roas, ctr, conversions, spend (default: roas)'},
-                        'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
-                        'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'},
-                        'limit': {'type': 'number', 'description': 'Number of top ads (default: 10)'}
-                    }
-                }
-            },
-            {
-                'name': 'get_audience_insights',
-                'description': 'Get audience demographics and performance by age, gender, and location',
-                'inputSchema': {
-                    'type': 'object',
-                    'properties': {
-                        'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
-                        'breakdown': {'type': 'string', 'description': 'Breakdown by: age, gender, country, region (default: all)'},
-                        'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
-                        'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'}
-                    }
-                }
-            },
-            {
-                'name': 'get_daily_trends',
-                'description': 'Get daily performance trends showing spend, revenue, ROAS over time',
-                'inputSchema': {
-                    'type': 'object',
-                    'properties': {
-                        'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
-                        'metrics': {'type': 'array', 'description': 'Metrics to include (spend, impressions, clicks, conversions, revenue, roas)'},
-                        'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
-                        'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'}
-                    }
-                }
-            },
-            {
-                'name': 'compare_campaigns',
-                'description': 'Compare performance between multiple campaigns',
-                'inputSchema': {
-                    'type': 'object',
-                    'properties': {
-                        'campaign_ids': {'type': 'array', 'description': 'List of campaign IDs to compare'},
-                        'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
-                        'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'}
-                    }
-                }
-            },
-            {
-                'name': 'get_budget_utilization',
-                'description': 'Check budget utilization and pacing for campaigns and ad sets',
-                'inputSchema': {
-                    'type': 'object',
-                    'properties': {
-                        'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
-                        'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
-                        'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'}
-                    }
-                }
-            },
-            {
-                'name': 'get_creative_performance',
-                'description': 'Analyze performance by creative type (image, video, carousel)',
-                'inputSchema': {
-                    'type': 'object',
-                    'properties': {
-                        'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
-                        'creative_type': {'type': 'string', 'description': 'Filter by type: image, video, carousel (optional)'},
-                        'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
-                        'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'}
-                    }
-                }
-            },
-            {
-                'name': 'get_placement_performance',
-                'description': 'Get performance breakdown by placement (Facebook, Instagram, Audience Network)',
-                'inputSchema': {
-                    'type': 'object',
-                    'properties': {
-                        'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
-                        'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
-                        'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'}
-                    }
-                }
-            },
-            {
-                'name': 'get_conversion_funnel',
-                'description': 'Get conversion funnel metrics from impressions to purchases',
-                'inputSchema': {
-                    'type': 'object',
-                    'properties': {
-                        'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
-                        'campaign_id': {'type': 'string', 'description': 'Filter by campaign (optional)'},
-                        'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
-                        'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'}
-                    }
-                }
-            },
-            {
-                'name': 'get_underperforming_ads',
-                'description': 'Identify underperforming ads that need optimization',
-                'inputSchema': {
-                    'type': 'object',
-                    'properties': {
-                        'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
-                        'threshold_roas': {'type': 'number', 'description': 'ROAS threshold (default: 1.0)'},
-                        'min_spend': {'type': 'number', 'description': 'Minimum spend to consider (default: 100)'},
-                        'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
-                        'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'}
-                    }
-                }
-            },
-            {
-                'name': 'get_all_accounts_summary',
-                'description': 'Get summary for all connected Meta Ads accounts',
-                'inputSchema': {
-                    'type': 'object',
-                    'properties': {
-                        'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
-                        'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'}
-                    }
-                }
-            }
-        ]
-        
-        return {'tools': tools}
+        return protocol_tools.tools_list().data
     
     def _handle_call_tool(self, params: Dict) -> Dict:
         """Execute a tool and return results"""
@@ -303,64 +141,39 @@ class MCPHandler:
         print(f"=== TOOL CALLED: {tool_name} ===")
         print(f"=== ARGUMENTS: {arguments} ===")
         
-        # Set default dates if not provided
-        if 'since' not in arguments:
-            arguments['since'] = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-        if 'until' not in arguments:
-            arguments['until'] = datetime.now().strftime('%Y-%m-%d')
-        
-        # Get default account if not specified
-        if 'account_id' not in arguments:
-            if self.user.ad_accounts:
-                default_account = self.user.ad_accounts[0]
-                arguments['account_id'] = default_account.account_id
-            else:
-                # Use demo account ID when no real accounts exist
-                arguments['account_id'] = 'demo_account'
-        
-        tool_handlers = {
-            'get_meta_ads_overview': self._get_simple_overview,
-            'get_account_overview': self._get_account_overview,
-            'get_campaigns_performance': self._get_campaigns_performance,
-            'get_adsets_performance': self._get_adsets_performance,
-            'get_top_performing_ads': self._get_top_performing_ads,
-            'get_audience_insights': self._get_audience_insights,
-            'get_daily_trends': self._get_daily_trends,
-            'compare_campaigns': self._compare_campaigns,
-            'get_budget_utilization': self._get_budget_utilization,
-            'get_creative_performance': self._get_creative_performance,
-            'get_placement_performance': self._get_placement_performance,
-            'get_conversion_funnel': self._get_conversion_funnel,
-            'get_underperforming_ads': self._get_underperforming_ads,
-            'get_all_accounts_summary': self._get_all_accounts_summary
-        }
-        
-        handler = tool_handlers.get(tool_name)
-        if not handler:
+        try:
+            graph_scheduler.check_admission(self.user.email)
+            with graph_scheduler.work(self.user.email, INTERACTIVE):
+                result = protocol_tools.dispatch(tool_name, arguments, self)
+        except UnknownToolError:
             raise ValueError(f"Unknown tool: {tool_name}")
         
-        result = handler(**arguments)
+        spec = protocol_tools.get(tool_name)
+        style = serialization.resolve_style(self.json_style, spec.options.get('json_style'))
+        content = serialization.tool_result(result, style)
         
         print(f"=== RESULT BEING RETURNED ===")
-        print(json.dumps(result, indent=2)[:500])  # First 500 chars to avoid log spam
+        print(content['content'][0]['text'][:500])  # First 500 chars to avoid log spam
         print("=== END RESULT ===")
         
-        return {
-            'content': [
-                {
-                    'type': 'text',
-                    'text': json.dumps(result, indent=2)
-                }
-            ]
-        }
+        return content
     
+    @protocol_tools.tool(
+        'get_meta_ads_overview',
+        'Get Meta Ads account overview with key metrics',
+        {
+            'type': 'object',
+            'properties': {},
+            'required': []
+        }
+    )
     def _get_simple_overview(self, **kwargs) -> Dict:
         """Simple overview that always works - for testing"""
         return {
             "status": "connected",
             "account": "Zane Meta Ads Connector",
             "message": "Successfully connected to Meta Ads",
-            "total_accounts": len(self.user.ad_accounts) if hasattr(self.user, 'ad_accounts') else 0,
+            "total_accounts": len(self.ad_accounts),
             "demo_data": {
                 "total_spend": "563.67",
                 "total_revenue": "845.50",
@@ -369,6 +182,20 @@ class MCPHandler:
             }
         }
     
+    @protocol_tools.tool(
+        'get_account_overview',
+        'Get comprehensive overview of ad account performance including spend, revenue, ROAS, CTR, CPC, and CPM',
+        {
+            'type': 'object',
+            'properties': {
+                'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional, uses default if not provided)'},
+                'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD (optional, defaults to 30 days ago)'},
+                'until': {'type': 'string', 'description': 'End date YYYY-MM-DD (optional, defaults to today)'}
+            },
+            'required': [],
+            'additionalProperties': False
+        }
+    )
     def _get_account_overview(self, account_id: str, since: str, until: str) -> Dict:
         """Get comprehensive account overview"""
         client = self.meta_clients.get(account_id)
@@ -399,6 +226,21 @@ class MCPHandler:
         
         return client.get_account_overview(account_id, {'since': since, 'until': until})
     
+    @protocol_tools.tool(
+        'get_campaigns_performance',
+        'Get detailed performance metrics for all campaigns including ROAS, spend, impressions, clicks, and conversions',
+        {
+            'type': 'object',
+            'properties': {
+                'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
+                'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
+                'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'}
+            },
+            'required': [],
+            'additionalProperties': False
+        },
+        json_style=serialization.COMPACT
+    )
     def _get_campaigns_performance(self, account_id: str, since: str, until: str) -> Dict:
         """Get detailed campaigns performance metrics - returns Meta Ads API format"""
         client = self.meta_clients.get(account_id)
@@ -486,7 +328,22 @@ class MCPHandler:
         
         return client.get_campaign_roas(account_id, {'since': since, 'until': until})
     
-    def _get_top_performing_ads(self, account_id: str, since: str, until: str, limit: int = 10) -> Dict:
+    @protocol_tools.tool(
+        'get_top_performing_ads',
+        'Get top performing ads by ROAS, CTR, or conversions',
+        {
+            'type': 'object',
+            'properties': {
+                'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
+                'metric': {'type': 'string', 'description': 'Metric to sort by: roas, ctr, conversions, spend (default: roas)'},
+                'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
+                'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'},
+                'limit': {'type': 'number', 'description': 'Number of top ads (default: 10)'}
+            }
+        },
+        json_style=serialization.COMPACT
+    )
+    def _get_top_performing_ads(self, account_id: str, since: str, until: str, limit: int = 10, metric: str = 'roas') -> Dict:
         """Get top performing ads - returns Meta Ads API format"""
         client = self.meta_clients.get(account_id)
         if not client:
@@ -562,38 +419,43 @@ class MCPHandler:
                 }
             }
         
-        return client.get_top_performing_ads(account_id, {'since': since, 'until': until}, limit)
+        return client.get_top_performing_ads(account_id, {'since': since, 'until': until}, limit, sort_by=metric)
     
-    def _get_all_accounts_summary(self, since: str, until: str) -> Dict:
-        """Get summary for all accounts"""
-        summary = {
-            'accounts': [],
-            'total_spend': 0,
-            'total_revenue': 0,
-            'overall_roas': 0,
-            'date_range': {'since': since, 'until': until}
+    @protocol_tools.tool(
+        'get_all_accounts_summary',
+        'Get summary for all connected Meta Ads accounts: spend share, blended ROAS and top campaigns across accounts',
+        {
+            'type': 'object',
+            'properties': {
+                'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
+                'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'},
+                'top_k': {'type': 'integer', 'description': 'Number of top campaigns across all accounts (default: 10)'},
+                'sort_by': {'type': 'string', 'enum': list(portfolio.SORT_METRICS),
+                            'description': 'Metric to rank campaigns by (default: roas)'}
+            }
         }
-        
-        for account in self.user.ad_accounts:
-            if account.is_active and account.account_id in self.meta_clients:
-                try:
-                    client = self.meta_clients[account.account_id]
-                    account_data = client.get_account_roas(
-                        account.account_id, 
-                        {'since': since, 'until': until}
-                    )
-                    summary['accounts'].append(account_data)
-                    summary['total_spend'] += account_data.get('spend', 0)
-                    summary['total_revenue'] += account_data.get('revenue', 0)
-                except Exception as e:
-                    # Log error but continue with other accounts
-                    print(f"Error fetching data for account {account.account_id}: {e}")
-        
-        if summary['total_spend'] > 0:
-            summary['overall_roas'] = round(summary['total_revenue'] / summary['total_spend'], 2)
-        
-        return summary
+    )
+    def _get_all_accounts_summary(self, since: str, until: str, top_k: int = 10, sort_by: str = 'roas') -> Dict:
+        """Get summary for all accounts"""
+        clients = {account.account_id: self.meta_clients[account.account_id] for account in self.ad_accounts
+                   if account.is_active and account.account_id in self.meta_clients}
+        names = {account.account_id: account.account_name for account in self.ad_accounts}
+        return portfolio.portfolio_summary(clients, {'since': since, 'until': until}, int(top_k), sort_by, names)
     
+    @protocol_tools.tool(
+        'get_adsets_performance',
+        'Get performance metrics for all ad sets including targeting, budget, and results',
+        {
+            'type': 'object',
+            'properties': {
+                'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
+                'campaign_id': {'type': 'string', 'description': 'Filter by specific campaign (optional)'},
+                'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
+                'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'}
+            }
+        },
+        json_style=serialization.COMPACT
+    )
     def _get_adsets_performance(self, account_id: str, since: str, until: str, campaign_id: str = None) -> List[Dict]:
         """Get ad sets performance metrics"""
         client = self.meta_clients.get(account_id)
@@ -602,6 +464,19 @@ class MCPHandler:
         
         return client.get_adsets_performance(account_id, {'since': since, 'until': until}, campaign_id)
     
+    @protocol_tools.tool(
+        'get_audience_insights',
+        'Get audience demographics and performance by age, gender, and location',
+        {
+            'type': 'object',
+            'properties': {
+                'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
+                'breakdown': {'type': 'string', 'description': 'Breakdown by: age, gender, country, region (default: all)'},
+                'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
+                'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'}
+            }
+        }
+    )
     def _get_audience_insights(self, account_id: str, since: str, until: str, breakdown: str = 'all') -> Dict:
         """Get audience demographic insights"""
         client = self.meta_clients.get(account_id)
@@ -620,51 +495,142 @@ class MCPHandler:
         
         return client.get_audience_insights(account_id, {'since': since, 'until': until}, api_breakdown)
     
+    @protocol_tools.tool(
+        'get_daily_trends',
+        'Get daily performance trends showing spend, revenue, ROAS over time',
+        {
+            'type': 'object',
+            'properties': {
+                'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
+                'metrics': {'type': 'array', 'items': {'type': 'string'},
+                            'description': 'Metrics to include (spend, impressions, clicks, conversions, revenue, roas, ctr, cpm); all by default'},
+                'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
+                'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'}
+            }
+        }
+    )
     def _get_daily_trends(self, account_id: str, since: str, until: str, metrics: List[str] = None) -> List[Dict]:
         """Get daily performance trends"""
         client = self.meta_clients.get(account_id)
         if not client:
             raise ValueError(f"Account {account_id} not found or not active")
         
-        return client.get_daily_trends(account_id, {'since': since, 'until': until})
+        return client.get_daily_trends(account_id, {'since': since, 'until': until}, metrics)
     
-    def _compare_campaigns(self, campaign_ids: List[str], since: str, until: str) -> List[Dict]:
-        """Compare multiple campaigns performance"""
-        results = []
+    @protocol_tools.tool(
+        'compare_campaigns',
+        'Compare performance between multiple campaigns, with ranks, differences from the group average and optional trends',
+        {
+            'type': 'object',
+            'properties': {
+                'campaign_ids': {'type': 'array', 'description': 'List of campaign IDs to compare'},
+                'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
+                'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'},
+                'time_increment': {'type': 'string', 'description': "Optional trend buckets: days per bucket (e.g. 1 or 7) or 'monthly'"}
+            },
+            'required': ['campaign_ids']
+        }
+    )
+    def _compare_campaigns(self, campaign_ids: List[str], since: str, until: str,
+                           time_increment: Optional[str] = None) -> Dict:
+        """Compare multiple campaigns with one filtered insights query per ad account"""
+        campaign_ids = list(dict.fromkeys(str(campaign_id) for campaign_id in campaign_ids))
+        if not campaign_ids:
+            raise ValueError("campaign_ids must list at least one campaign")
+        if not self.meta_clients:
+            raise ValueError("No active ad accounts connected")
+        date_range = {'since': since, 'until': until}
+
+        def fetch(item):
+            account_id, ids = item
+            return self.meta_clients[account_id].compare_campaigns(account_id, ids, date_range, time_increment)
+
+        campaigns = [row for rows in parallel_map(fetch, self._campaigns_by_account(campaign_ids).items())
+                     for row in rows]
+        leaders = rank_and_compare(campaigns)
+        campaigns.sort(key=lambda row: row['spend'], reverse=True)
+        found = {row['campaign_id'] for row in campaigns}
+        return {
+            'date_range': date_range,
+            'campaigns': campaigns,
+            'leaders': leaders,
+            # Campaigns without delivery in the period have no insights rows
+            'no_data': [campaign_id for campaign_id in campaign_ids if campaign_id not in found]
+        }
+
+    def _campaigns_by_account(self, campaign_ids: List[str]) -> Dict[str, List[str]]:
+        """Group campaign ids by owning account; ids that cannot be placed are asked of every account"""
+        if len(self.meta_clients) == 1:
+            return {next(iter(self.meta_clients)): campaign_ids}
+        try:
+            owners = next(iter(self.meta_clients.values())).get_object_accounts(campaign_ids)
+        except Exception as e:
+            print(f"Campaign owner lookup failed, querying every account: {e}")
+            owners = {}
+
+        groups: Dict[str, List[str]] = {}
+        unplaced = []
         for campaign_id in campaign_ids:
-            # Mock implementation
-            results.append({
-                'campaign_id': campaign_id,
-                'name': f'Campaign {campaign_id}',
-                'spend': 1500,
-                'revenue': 4500,
-                'roas': 3.0,
-                'ctr': 2.3,
-                'conversion_rate': 3.5
-            })
-        return results
+            owner = owners.get(campaign_id)
+            if owner in self.meta_clients:
+                groups.setdefault(owner, []).append(campaign_id)
+            else:
+                unplaced.append(campaign_id)
+        if unplaced:
+            for account_id in self.meta_clients:
+                groups.setdefault(account_id, [])
+                groups[account_id].extend(unplaced)
+        return groups
     
+    @protocol_tools.tool(
+        'get_budget_utilization',
+        'Check budget utilization and pacing for campaigns and ad sets: spend vs daily or lifetime budget, projected end-of-period spend and over/under-pacing',
+        {
+            'type': 'object',
+            'properties': {
+                'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
+                'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
+                'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'}
+            }
+        },
+        json_style=serialization.COMPACT
+    )
     def _get_budget_utilization(self, account_id: str, since: str, until: str) -> Dict:
         """Check budget utilization and pacing"""
         client = self.meta_clients.get(account_id)
         if not client:
             raise ValueError(f"Account {account_id} not found or not active")
         
-        # Get campaign budgets and spend
-        campaigns = client.get_campaign_roas(account_id, {'since': since, 'until': until})
+        # Budgets (cached) and daily spend, fetched together in one batch on a cold cache
+        report = pacing.budget_pacing(client, account_id, {'since': since, 'until': until})
         
-        total_spend = sum(c.get('spend', 0) for c in campaigns)
+        total_spend = report['total_spend']
         days_in_range = (datetime.strptime(until, '%Y-%m-%d') - datetime.strptime(since, '%Y-%m-%d')).days + 1
         daily_avg = total_spend / days_in_range if days_in_range > 0 else 0
         
         return {
             'total_spend': total_spend,
             'daily_average_spend': round(daily_avg, 2),
-            'campaigns_count': len(campaigns),
+            'campaigns_count': len(report['campaigns']),
             'date_range': {'since': since, 'until': until},
-            'days_in_period': days_in_range
+            'days_in_period': days_in_range,
+            'pacing_summary': report['pacing_summary'],
+            'campaigns': report['campaigns']
         }
     
+    @protocol_tools.tool(
+        'get_creative_performance',
+        'Analyze performance by creative type (image, video, carousel)',
+        {
+            'type': 'object',
+            'properties': {
+                'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
+                'creative_type': {'type': 'string', 'description': 'Filter by type: image, video, carousel (optional)'},
+                'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
+                'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'}
+            }
+        }
+    )
     def _get_creative_performance(self, account_id: str, since: str, until: str, creative_type: str = None) -> List[Dict]:
         """Analyze performance by creative type"""
         client = self.meta_clients.get(account_id)
@@ -673,103 +639,95 @@ class MCPHandler:
         
         return client.get_creative_performance(account_id, {'since': since, 'until': until})
     
-    def _get_placement_performance(self, account_id: str, since: str, until: str) -> List[Dict]:
+    @protocol_tools.tool(
+        'get_placement_performance',
+        'Get performance breakdown by placement (Facebook, Instagram, Audience Network), device, or both',
+        {
+            'type': 'object',
+            'properties': {
+                'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
+                'group_by': {'type': 'string', 'enum': ['placement', 'device', 'placement_device'],
+                             'description': 'Group by placement (default), device, or placement and device'},
+                'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
+                'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'}
+            }
+        }
+    )
+    def _get_placement_performance(self, account_id: str, since: str, until: str,
+                                   group_by: str = 'placement') -> List[Dict]:
         """Get performance by placement"""
         client = self.meta_clients.get(account_id)
         if not client:
             raise ValueError(f"Account {account_id} not found or not active")
         
-        return client.get_placement_performance(account_id, {'since': since, 'until': until})
+        return client.get_placement_performance(account_id, {'since': since, 'until': until}, group_by)
     
-    def _get_conversion_funnel(self, account_id: str, since: str, until: str, campaign_id: str = None) -> Dict:
+    @protocol_tools.tool(
+        'get_conversion_funnel',
+        'Get conversion funnel metrics from impressions to purchases, optionally per campaign or ad set',
+        {
+            'type': 'object',
+            'properties': {
+                'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
+                'campaign_id': {'type': 'string', 'description': 'Filter by campaign (optional)'},
+                'group_by': {'type': 'string', 'enum': ['campaign', 'adset'],
+                             'description': 'Also return one funnel per campaign or ad set (optional)'},
+                'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
+                'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'}
+            }
+        }
+    )
+    def _get_conversion_funnel(self, account_id: str, since: str, until: str, campaign_id: str = None,
+                               group_by: str = None) -> Dict:
         """Get conversion funnel metrics"""
         client = self.meta_clients.get(account_id)
         if not client:
             raise ValueError(f"Account {account_id} not found or not active")
         
-        # Get funnel metrics from API
-        fields = 'impressions,clicks,reach,conversions,actions'
-        params = {
-            'fields': fields,
-            'time_range': f'{{"since":"{since}","until":"{until}"}}',
-            'level': 'account' if not campaign_id else 'campaign',
-            'action_breakdowns': 'action_type'
-        }
-        
-        if campaign_id:
-            params['filtering'] = f'[{{"field":"campaign_id","operator":"EQUAL","value":"{campaign_id}"}}]'
-        
-        try:
-            data = client._make_request(f'/act_{account_id}/insights', params)
-            result = data.get('data', [{}])[0]
-            
-            impressions = int(result.get('impressions', 0))
-            clicks = int(result.get('clicks', 0))
-            conversions = int(result.get('conversions', 0))
-            
-            # Parse actions for funnel steps
-            actions = result.get('actions', [])
-            funnel_data = {
-                'impressions': impressions,
-                'clicks': clicks,
-                'click_rate': round((clicks / impressions * 100), 2) if impressions > 0 else 0,
-                'conversions': conversions,
-                'conversion_rate': round((conversions / clicks * 100), 2) if clicks > 0 else 0
-            }
-            
-            # Extract specific action types
-            for action in actions:
-                action_type = action.get('action_type', '')
-                value = int(action.get('value', 0))
-                
-                if 'landing_page_view' in action_type:
-                    funnel_data['landing_page_views'] = value
-                elif 'add_to_cart' in action_type:
-                    funnel_data['add_to_cart'] = value
-                elif 'initiate_checkout' in action_type:
-                    funnel_data['initiate_checkout'] = value
-                elif 'purchase' in action_type:
-                    funnel_data['purchases'] = value
-            
-            return funnel_data
-        except Exception:
-            # Return basic funnel if detailed data not available
-            return {
-                'impressions': 0,
-                'clicks': 0,
-                'click_rate': 0,
-                'conversions': 0,
-                'conversion_rate': 0
-            }
+        return funnel.conversion_funnel(client, account_id, {'since': since, 'until': until},
+                                        campaign_id=campaign_id, group_by=group_by)
     
-    def _get_underperforming_ads(self, account_id: str, since: str, until: str, threshold_roas: float = 1.0, min_spend: float = 100) -> List[Dict]:
-        """Identify underperforming ads"""
+    @protocol_tools.tool(
+        'get_underperforming_ads',
+        'Identify underperforming ads that need optimization',
+        {
+            'type': 'object',
+            'properties': {
+                'account_id': {'type': 'string', 'description': 'Meta Ad Account ID (optional)'},
+                'threshold_roas': {'type': 'number', 'description': 'ROAS threshold (default: 1.0)'},
+                'min_spend': {'type': 'number', 'description': 'Minimum spend to consider (default: 100)'},
+                'since': {'type': 'string', 'description': 'Start date YYYY-MM-DD'},
+                'until': {'type': 'string', 'description': 'End date YYYY-MM-DD'},
+                **PAGING_PROPERTIES
+            }
+        },
+        json_style=serialization.COMPACT
+    )
+    def _get_underperforming_ads(self, account_id: str, since: str, until: str, threshold_roas: float = 1.0, min_spend: float = 100,
+                                 page_size: int = None, cursor: str = None) -> Dict:
+        """Identify underperforming ads, one page at a time"""
         client = self.meta_clients.get(account_id)
         if not client:
             raise ValueError(f"Account {account_id} not found or not active")
         
-        # Get all ads performance
-        all_ads = client.get_top_performing_ads(account_id, {'since': since, 'until': until}, limit=500)
-        
-        # Filter underperforming ads
-        underperforming = []
-        for ad in all_ads:
-            if ad.get('spend', 0) >= min_spend and ad.get('roas', 0) < threshold_roas:
-                # Add recommendation based on metrics
-                recommendation = ''
-                if ad.get('roas', 0) < 0.5:
-                    recommendation = 'Very low ROAS - consider pausing immediately'
-                elif ad.get('ctr', 0) < 1.0:
-                    recommendation = 'Low CTR - test new creative or audience'
-                elif ad.get('conversions', 0) < 1:
-                    recommendation = 'No conversions - review landing page and offer'
-                else:
-                    recommendation = 'Below threshold - optimize bid strategy or creative'
-                
-                ad['recommendation'] = recommendation
-                underperforming.append(ad)
-        
-        return underperforming
+        page = cursor_store.paginate(
+            self.user.email,
+            lambda: self._find_underperforming_ads(client, account_id, since, until, threshold_roas, min_spend),
+            cursor=cursor,
+            page_size=page_size
+        )
+        return {
+            'ads': page['rows'],
+            'total_underperforming': page['total'],
+            'offset': page['offset'],
+            'next_cursor': page['next_cursor']
+        }
+    
+    def _find_underperforming_ads(self, client: MetaAdsClient, account_id: str, since: str, until: str,
+                                  threshold_roas: float, min_spend: float) -> List[Dict]:
+        # min_spend is pushed down to Graph; ROAS is checked while streaming, over cached rows on re-runs
+        return filtering.underperforming_ads(client, account_id, {'since': since, 'until': until},
+                                             threshold_roas, min_spend)
     
     def _handle_ping(self, params: Dict) -> Dict:
         """Handle ping request - returns empty object per MCP spec"""
@@ -785,12 +743,12 @@ class MCPHandler:
             response['id'] = message_id
         return response
     
-    def _error_response(self, message_id: Optional[Any], error: str) -> Dict:
+    def _error_response(self, message_id: Optional[Any], error: str, code: int = -32603) -> Dict:
         """Create error response"""
         response = {
             'jsonrpc': '2.0',
             'error': {
-                'code': -32603,
+                'code': code,
                 'message': error
             }
         }
@@ -3,58 +3,471 @@ Meta Ads API Client
 """
 
 import requests
+import contextvars
+import hashlib
+import json
 import logging
-from typing import Dict, List, Any
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Any, Optional
+from urllib.parse import urlencode
+
+from app import actions, audience, metrics, placements, tracing, trends
+from app.creatives import creative_index
+from app.scheduler import estimate_cost, graph_scheduler
+from app.tool_registry import ToolTimeoutError, remaining_budget
 
 logger = logging.getLogger(__name__)
 
+# Point at a local simulator or proxy with e.g. GRAPH_API_BASE_URL=http://127.0.0.1:8089
+GRAPH_API_BASE_URL = os.getenv('GRAPH_API_BASE_URL', 'https://graph.facebook.com').rstrip('/')
+
+# One pooled session per process so Graph connections are reused across calls
+_session = requests.Session()
+for _scheme in ('https://', 'http://'):
+    _session.mount(_scheme, metrics.InstrumentedHTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=int(os.getenv('GRAPH_POOL_SIZE', '20'))
+    ))
+
+
+def use_transport(adapter) -> None:
+    """Serve Graph requests through a requests adapter (simulator, recorder, ...)"""
+    _session.mount(GRAPH_API_BASE_URL + '/', adapter)
+
+
+# (connect, read) timeouts in seconds per endpoint class; insights reads can legitimately take a while
+CONNECT_TIMEOUT = float(os.getenv('GRAPH_CONNECT_TIMEOUT', '3.05'))
+READ_TIMEOUTS = {
+    'insights': float(os.getenv('GRAPH_INSIGHTS_READ_TIMEOUT', '60')),
+    'default': float(os.getenv('GRAPH_READ_TIMEOUT', '20'))
+}
+
+
+
+def request_timeout(endpoint_cls: str) -> tuple:
+    """(connect, read) timeouts for an endpoint class, cut to what is left of the calling tool's budget"""
+    connect, read = CONNECT_TIMEOUT, READ_TIMEOUTS.get(endpoint_cls, READ_TIMEOUTS['default'])
+    remaining = remaining_budget()
+    if remaining is None:
+        return connect, read
+    return min(connect, remaining), min(read, remaining)
+
+
+# Graph error codes that mean "Facebook is struggling", not "your request is wrong"
+TRANSIENT_ERROR_CODES = frozenset([1, 2, 4, 17, 32, 341, 613, 80000, 80003, 80004, 80014])
+
+_ACCOUNT_IN_PATH = re.compile(r'act_(\d+)')
+
+
+def endpoint_class(endpoint: str) -> str:
+    """Last path segment with ids collapsed: insights, campaigns, adaccounts, account, ..."""
+    last = metrics.normalize_endpoint(endpoint).rstrip('/').rsplit('/', 1)[-1]
+    return {'act_{id}': 'account', '{id}': 'node', '': 'root'}.get(last, last)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised without calling Graph while a breaker is open and no earlier response is kept"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open for `cooldown` seconds -> one half-open probe"""
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.probing = True
+            return True
+
+    def retry_after(self) -> int:
+        with self._lock:
+            if self.opened_at is None:
+                return 0
+            return max(1, int(self.cooldown - (time.monotonic() - self.opened_at)) + 1)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self) -> bool:
+        """Count a failure; returns True when this failure opened the breaker"""
+        with self._lock:
+            self.failures += 1
+            was_open = self.opened_at is not None
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+            return self.opened_at is not None and not was_open
+
+    def abandon(self) -> None:
+        """The call never reached Facebook; let another request probe"""
+        with self._lock:
+            self.probing = False
+
+
+class _LatencyWindow:
+    """Recent latencies of one endpoint class, for the hedging threshold"""
+
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct: float, min_samples: int = 20) -> Optional[float]:
+        with self._lock:
+            if len(self.samples) < min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+
+class _Resilience:
+    """Per-process breakers, last good responses and hedging state shared by all clients"""
+
+    def __init__(self):
+        self.failure_threshold = int(os.getenv('GRAPH_BREAKER_FAILURES', '5'))
+        self.cooldown = float(os.getenv('GRAPH_BREAKER_COOLDOWN', '30'))
+        self.stale_entries = int(os.getenv('GRAPH_STALE_ENTRIES', '256'))
+        self.hedge_percentile = float(os.getenv('GRAPH_HEDGE_PERCENTILE', '0'))  # 0 disables hedging
+        self.hedge_min_delay = float(os.getenv('GRAPH_HEDGE_MIN_DELAY', '0.25'))
+        self.breakers: Dict[tuple, CircuitBreaker] = {}
+        self.latencies: Dict[str, _LatencyWindow] = {}
+        self.last_good: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._hedge_executor = None
+        self._hedge_slots = threading.BoundedSemaphore(int(os.getenv('GRAPH_HEDGE_MAX_INFLIGHT', '4')))
+
+    def breaker(self, account: str, endpoint_cls: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self.breakers.get((account, endpoint_cls))
+            if breaker is None:
+                breaker = self.breakers[(account, endpoint_cls)] = CircuitBreaker(self.failure_threshold, self.cooldown)
+            return breaker
+
+    def latency(self, endpoint_cls: str) -> _LatencyWindow:
+        with self._lock:
+            window = self.latencies.get(endpoint_cls)
+            if window is None:
+                window = self.latencies[endpoint_cls] = _LatencyWindow()
+            return window
+
+    def remember(self, key: str, data: Dict) -> None:
+        with self._lock:
+            self.last_good[key] = data
+            self.last_good.move_to_end(key)
+            while len(self.last_good) > self.stale_entries:
+                self.last_good.popitem(last=False)
+
+    def recall(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            return self.last_good.get(key)
+
+    def hedge_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._hedge_executor is None:
+                workers = 2 * int(os.getenv('GRAPH_POOL_SIZE', '20'))
+                self._hedge_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='graph-hedge')
+            return self._hedge_executor
+
+    def try_hedge(self) -> bool:
+        return self._hedge_slots.acquire(blocking=False)
+
+    def hedge_done(self, _future=None) -> None:
+        self._hedge_slots.release()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.breakers.clear()
+            self.latencies.clear()
+            self.last_good.clear()
+
+
+resilience = _Resilience()
+
+
+def _query_key(endpoint: str, params: Dict) -> str:
+    """Identity of a query for the last-good store; the token is hashed so users never share entries"""
+    token = hashlib.sha256(params.get('access_token', '').encode('utf-8')).hexdigest()[:16]
+    query = sorted((k, str(v)) for k, v in params.items() if k != 'access_token')
+    return f'{token}:{endpoint}?{json.dumps(query, separators=(",", ":"))}'
+
+
+# Insights fields each client output is derived from; tools declare the outputs they show
+# and only those fields are requested from Graph
+OUTPUT_SOURCES = {
+    'account_name': ('account_name',),
+    'currency': ('account_currency',),
+    'campaign_name': ('campaign_name',),
+    'ad_name': ('ad_name',),
+    'status': ('status',),
+    'spend': ('spend',),
+    'revenue': ('action_values',),
+    'roas': ('purchase_roas', 'spend', 'action_values'),
+    'purchase_roas': ('purchase_roas', 'spend', 'action_values'),
+    'impressions': ('impressions',),
+    'clicks': ('clicks',),
+    'conversions': ('actions',),
+    'ctr': ('ctr',),
+    'cpm': ('cpm',),
+    'cpc': ('cpc',),
+    'reach': ('reach',),
+    'frequency': ('frequency',)
+}
+
+# Row identity fields per level, always requested so results can be joined and sorted
+LEVEL_FIELDS = {
+    'account': (),
+    'campaign': ('campaign_id',),
+    'ad': ('ad_id', 'adset_id', 'campaign_id')
+}
+
+ACTION_FIELDS = frozenset(['actions', 'action_values', 'purchase_roas'])
+ATTRIBUTION_WINDOWS = os.getenv('GRAPH_ATTRIBUTION_WINDOWS', '')
+
+
+def project_fields(level: str, default_fields: str, outputs=None) -> Dict:
+    """Smallest insights params (fields plus action params) that produce `outputs`.
+
+    With no declaration the method's full default field list is used.
+    """
+    if outputs is None:
+        fields = default_fields.split(',')
+    else:
+        fields = list(LEVEL_FIELDS.get(level, ()))
+        for output in outputs:
+            for field in OUTPUT_SOURCES.get(output, (output,)):
+                if field not in fields:
+                    fields.append(field)
+    params = {'fields': ','.join(fields)}
+    if ACTION_FIELDS.intersection(fields):
+        params['action_breakdowns'] = 'action_type'
+        if ATTRIBUTION_WINDOWS:
+            params['action_attribution_windows'] = ATTRIBUTION_WINDOWS
+    return params
+
+
+COMPARE_METRICS = ('spend', 'revenue', 'roas', 'impressions', 'clicks', 'ctr', 'cpc',
+                   'conversions', 'conversion_rate')
+# Metrics where a smaller value ranks higher
+LOWER_IS_BETTER = frozenset(['cpc'])
+
+_fanout_executor = ThreadPoolExecutor(max_workers=int(os.getenv('ACCOUNT_FANOUT_WORKERS', '4')),
+                                      thread_name_prefix='account-fanout')
+
+
+def fanout_submit(func, *args):
+    """Submit func to the fan-out pool, keeping the caller's context"""
+    return _fanout_executor.submit(contextvars.copy_context().run, func, *args)
+
+
+def parallel_map(func, items) -> List:
+    """Run func over items on the fan-out pool, in order, keeping the caller's context"""
+    items = list(items)
+    if len(items) < 2:
+        return [func(item) for item in items]
+    futures = [fanout_submit(func, item) for item in items]
+    return [future.result() for future in futures]
+
+
+def rank_and_compare(rows: List[Dict], metrics=COMPARE_METRICS) -> Dict[str, str]:
+    """Add rank, vs_average_pct and share_of_spend to each row, one column at a time.
+
+    Returns the leading row id per metric.
+    """
+    leaders = {}
+    if not rows:
+        return leaders
+    total_spend = sum(row['spend'] for row in rows)
+    for row in rows:
+        row['rank'] = {}
+        row['vs_average_pct'] = {}
+        row['share_of_spend'] = round(row['spend'] / total_spend * 100, 2) if total_spend else 0
+    for metric in metrics:
+        column = [row[metric] for row in rows]
+        average = sum(column) / len(column)
+        order = sorted(range(len(rows)), key=column.__getitem__, reverse=metric not in LOWER_IS_BETTER)
+        for rank, index in enumerate(order, 1):
+            row = rows[index]
+            row['rank'][metric] = rank
+            row['vs_average_pct'][metric] = round((column[index] - average) / average * 100, 1) if average else 0
+        leaders[metric] = rows[order[0]].get('campaign_id')
+    return leaders
+
+
 class MetaAdsClient:
     def __init__(self, access_token: str, api_version: str = 'v18.0'):
         """Initialize Meta Marketing API client with latest version"""
         self.access_token = access_token
         self.api_version = api_version
-        self.base_url = f'https://graph.facebook.com/{api_version}'
+        self.base_url = f'{GRAPH_API_BASE_URL}/{api_version}'
     
     def _calculate_roas(self, spend: float, revenue: float) -> float:
         if spend == 0:
             return 0
         return round(revenue / spend, 2)
     
-    def _make_request(self, endpoint: str, params: Dict = None) -> Dict:
+    def _make_request(self, endpoint: str, params: Dict = None, method: str = 'GET') -> Dict:
         if params is None:
             params = {}
         params['access_token'] = self.access_token
 
-        response = requests.get(f'{self.base_url}{endpoint}', params=params)
+        endpoint_cls = endpoint_class(endpoint)
+        account = _ACCOUNT_IN_PATH.search(endpoint)
+        breaker = resilience.breaker(account.group(1) if account else 'none', endpoint_cls)
+        key = _query_key(endpoint, params)
+
+        if not breaker.allow():
+            # Fail fast while Facebook is unhealthy; the last answer beats a hung worker
+            stale = resilience.recall(key)
+            metrics.observe_circuit(endpoint_cls, 'served_stale' if stale is not None else 'rejected')
+            if stale is not None:
+                logger.warning(f"Circuit open for {endpoint_cls} on {endpoint}; serving last good response")
+                return stale
+            raise CircuitOpenError(f"Facebook API temporarily unavailable for {endpoint_cls} requests; "
+                                   f"retry in {breaker.retry_after()}s", breaker.retry_after())
+
+        try:
+            data = self._send(endpoint, params, endpoint_cls, method)
+        except Exception as e:
+            if isinstance(e, requests.exceptions.Timeout):
+                try:
+                    remaining_budget()
+                except ToolTimeoutError:
+                    # Cut short by the calling tool's deadline, not a Facebook failure
+                    breaker.abandon()
+                    raise
+            if self._is_transient(e):
+                if breaker.record_failure():
+                    metrics.observe_circuit(endpoint_cls, 'opened')
+                    logger.warning(f"Circuit opened for {endpoint_cls} on {endpoint} after {breaker.failures} failures")
+            elif isinstance(e, requests.exceptions.HTTPError):
+                breaker.record_success()  # Facebook answered; the request itself was wrong
+            else:
+                breaker.abandon()
+            raise
+        breaker.record_success()
+        resilience.remember(key, data)
+        return data
+
+    @staticmethod
+    def _is_transient(error: Exception) -> bool:
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return True
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+        if status is not None and status >= 500:
+            return True
+        return getattr(error, 'graph_code', None) in TRANSIENT_ERROR_CODES
 
-        # Better error handling with detailed messages
-        if response.status_code != 200:
+    def _send(self, endpoint: str, params: Dict, endpoint_cls: str, method: str = 'GET') -> Dict:
+        with graph_scheduler.slot(self.access_token, estimate_cost(params)), \
+                tracing.span('graph.request', endpoint=metrics.normalize_endpoint(endpoint),
+                             level=params.get('level')) as span:
+            started = time.perf_counter()
+            code = 'exception'
             try:
-                error_data = response.json()
-                error_msg = error_data.get('error', {}).get('message', 'Unknown error')
-                error_code = error_data.get('error', {}).get('code', '')
-                error_type = error_data.get('error', {}).get('type', '')
+                if method == 'GET':
+                    response = self._get(f'{self.base_url}{endpoint}', params, endpoint_cls, span)
+                else:
+                    response = _session.request(method, f'{self.base_url}{endpoint}', data=params,
+                                                timeout=request_timeout('default'))
+                code = response.status_code
 
-                logger.error(f"Facebook API Error - Endpoint: {endpoint}, Code: {error_code}, Type: {error_type}, Message: {error_msg}")
+                # Better error handling with detailed messages
+                if response.status_code != 200:
+                    try:
+                        error_data = response.json()
+                        error_msg = error_data.get('error', {}).get('message', 'Unknown error')
+                        error_code = error_data.get('error', {}).get('code', '')
+                        error_type = error_data.get('error', {}).get('type', '')
+                        code = error_code or code
 
-                # Raise with detailed error message
-                raise requests.exceptions.HTTPError(f"Facebook API Error ({error_code}): {error_msg}")
-            except ValueError:
-                # If response is not JSON
-                response.raise_for_status()
+                        logger.error(f"Facebook API Error - Endpoint: {endpoint}, Code: {error_code}, Type: {error_type}, Message: {error_msg}")
 
-        return response.json()
-    
-    def get_account_overview(self, account_id: str, date_range: Dict) -> Dict:
+                        # Raise with detailed error message
+                        error = requests.exceptions.HTTPError(f"Facebook API Error ({error_code}): {error_msg}",
+                                                              response=response)
+                        error.graph_code = error_code
+                        raise error
+                    except ValueError:
+                        # If response is not JSON
+                        response.raise_for_status()
+
+                return response.json()
+            finally:
+                span.set_attribute('code', code)
+                metrics.observe_graph_request(endpoint, params.get('level', ''), code, time.perf_counter() - started)
+
+    def _get(self, url: str, params: Dict, endpoint_cls: str, span) -> requests.Response:
+        """GET with per-class timeouts, hedged once when the first try passes the latency percentile"""
+        timeout = request_timeout(endpoint_cls)
+        window = resilience.latency(endpoint_cls)
+        hedge_after = None
+        if resilience.hedge_percentile:
+            threshold = window.percentile(resilience.hedge_percentile)
+            if threshold is not None:
+                hedge_after = max(threshold, resilience.hedge_min_delay)
+
+        def attempt() -> requests.Response:
+            started = time.perf_counter()
+            response = _session.get(url, params=params, timeout=timeout)
+            window.add(time.perf_counter() - started)
+            return response
+
+        if hedge_after is None:
+            return attempt()
+
+        executor = resilience.hedge_executor()
+        pending = {executor.submit(contextvars.copy_context().run, attempt)}
+        done, pending = wait(pending, timeout=hedge_after)
+        if not done and resilience.try_hedge():
+            span.set_attribute('hedged', True)
+            metrics.observe_circuit(endpoint_cls, 'hedged')
+            hedge = executor.submit(contextvars.copy_context().run, attempt)
+            hedge.add_done_callback(resilience.hedge_done)
+            pending.add(hedge)
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # Prefer a response over an exception when the first finisher failed
+            if all(f.exception() is not None for f in done) and pending:
+                done, pending = wait(pending)
+        elif not done:
+            done, pending = wait(pending)
+        winner = next((f for f in done if f.exception() is None), next(iter(done)))
+        return winner.result()
+
+    def get_account_overview(self, account_id: str, date_range: Dict, outputs=None) -> Dict:
         """Get comprehensive account overview with ROAS metrics using Marketing API"""
         # Updated fields for Marketing API including purchase_roas
-        # Removed currency field as it's not valid for insights endpoint
-        fields = 'account_name,spend,impressions,clicks,ctr,cpm,cpc,reach,frequency,purchase_roas,actions,action_values'
-        params = {
-            'fields': fields,
+        # (insights has no currency field; account_currency is the account's billing currency)
+        fields = 'account_name,account_currency,spend,impressions,clicks,ctr,cpm,cpc,reach,frequency,purchase_roas,actions,action_values'
+        params = project_fields('account', fields, outputs)
+        params.update({
             'time_range': f'{{"since":"{date_range["since"]}","until":"{date_range["until"]}"}}',
             'level': 'account'
-        }
+        })
 
         data = self._make_request(f'/act_{account_id}/insights', params)
         
@@ -73,13 +486,7 @@ class MetaAdsClient:
         
         account_data = data['data'][0]
         spend = float(account_data.get('spend', 0))
-        
-        # Parse action values for revenue (purchases, conversions)
-        action_values = account_data.get('action_values', [])
-        revenue = 0
-        for action in action_values:
-            if action.get('action_type') in ['purchase', 'omni_purchase', 'offsite_conversion.fb_pixel_purchase']:
-                revenue += float(action.get('value', 0))
+        revenue, conversions = actions.classifier_for(account_id).classify(account_data)
         
         # Get purchase ROAS from API or calculate
         purchase_roas_data = account_data.get('purchase_roas', [])
@@ -88,17 +495,10 @@ class MetaAdsClient:
         else:
             roas = self._calculate_roas(spend, revenue)
         
-        # Parse actions for conversions count
-        actions = account_data.get('actions', [])
-        conversions = 0
-        for action in actions:
-            if action.get('action_type') in ['purchase', 'omni_purchase', 'lead', 'complete_registration']:
-                conversions += int(action.get('value', 0))
-        
         return {
             'account_id': account_id,
             'account_name': account_data.get('account_name', 'Unknown'),
-            'currency': 'USD',  # Default to USD for now
+            'currency': account_data.get('account_currency', 'USD'),
             'spend': spend,
             'revenue': revenue,
             'roas': roas,
@@ -140,27 +540,23 @@ class MetaAdsClient:
             logger.error(f"Error getting all campaigns: {e}")
             return []
 
-    def get_campaign_roas(self, account_id: str, date_range: Dict) -> List[Dict]:
+    def get_campaign_roas(self, account_id: str, date_range: Dict, outputs=None) -> List[Dict]:
         """Get campaign ROAS metrics using Marketing API"""
-        fields = 'campaign_id,campaign_name,spend,impressions,clicks,status,purchase_roas,actions,action_values,ctr,cpm,cpc'
-        params = {
-            'fields': fields,
+        fields = 'campaign_id,campaign_name,account_currency,spend,impressions,clicks,status,purchase_roas,actions,action_values,ctr,cpm,cpc'
+        params = project_fields('campaign', fields, outputs)
+        params.update({
             'time_range': f'{{"since":"{date_range["since"]}","until":"{date_range["until"]}"}}',
             'level': 'campaign'
             # Removed filtering to include ALL campaigns, even with 0 impressions
-        }
+        })
         
         data = self._make_request(f'/act_{account_id}/insights', params)
         
         campaigns = []
-        for campaign in data.get('data', []):
+        rows = data.get('data', [])
+        revenues, conversion_counts = actions.classifier_for(account_id).classify_page(rows)
+        for campaign, revenue, conversions in zip(rows, revenues, conversion_counts):
             spend = float(campaign.get('spend', 0))
-            # Parse action values for revenue
-            action_values = campaign.get('action_values', [])
-            revenue = 0
-            for action in action_values:
-                if action.get('action_type') in ['purchase', 'omni_purchase', 'offsite_conversion.fb_pixel_purchase']:
-                    revenue += float(action.get('value', 0))
             
             # Get purchase ROAS
             purchase_roas_data = campaign.get('purchase_roas', [])
@@ -169,17 +565,11 @@ class MetaAdsClient:
             else:
                 roas = self._calculate_roas(spend, revenue)
             
-            # Count conversions
-            actions = campaign.get('actions', [])
-            conversions = 0
-            for action in actions:
-                if action.get('action_type') in ['purchase', 'omni_purchase', 'lead']:
-                    conversions += int(action.get('value', 0))
-            
             campaigns.append({
                 'campaign_id': campaign.get('campaign_id'),
                 'campaign_name': campaign.get('campaign_name', 'Unknown'),
                 'status': campaign.get('status', 'UNKNOWN'),
+                'currency': campaign.get('account_currency', 'USD'),
                 'spend': spend,
                 'revenue': revenue,
                 'roas': roas,
@@ -193,28 +583,27 @@ class MetaAdsClient:
         
         return campaigns
     
-    def get_top_performing_ads(self, account_id: str, date_range: Dict, limit: int = 10) -> List[Dict]:
-        """Get top performing ads by ROAS using Marketing API"""
+    def get_top_performing_ads(self, account_id: str, date_range: Dict, limit: int = 10, sort_by: str = 'roas',
+                               outputs=None) -> List[Dict]:
+        """Get top performing ads by ROAS (or another numeric metric) using Marketing API"""
         fields = 'ad_id,ad_name,adset_id,campaign_id,spend,impressions,clicks,status,purchase_roas,actions,action_values,ctr,cpm,cpc'
-        params = {
-            'fields': fields,
+        if outputs is not None and sort_by not in outputs:
+            outputs = list(outputs) + [sort_by]
+        params = project_fields('ad', fields, outputs)
+        params.update({
             'time_range': f'{{"since":"{date_range["since"]}","until":"{date_range["until"]}"}}',
             'level': 'ad',
             'limit': 500
             # Removed filtering to include ALL ads, even with 0 impressions
-        }
+        })
         
         data = self._make_request(f'/act_{account_id}/insights', params)
         
         ads = []
-        for ad in data.get('data', []):
+        rows = data.get('data', [])
+        revenues, conversion_counts = actions.classifier_for(account_id).classify_page(rows)
+        for ad, revenue, conversions in zip(rows, revenues, conversion_counts):
             spend = float(ad.get('spend', 0))
-            # Parse action values for revenue
-            action_values = ad.get('action_values', [])
-            revenue = 0
-            for action in action_values:
-                if action.get('action_type') in ['purchase', 'omni_purchase', 'offsite_conversion.fb_pixel_purchase']:
-                    revenue += float(action.get('value', 0))
             
             # Get purchase ROAS
             purchase_roas_data = ad.get('purchase_roas', [])
@@ -223,13 +612,6 @@ class MetaAdsClient:
             else:
                 roas = self._calculate_roas(spend, revenue)
             
-            # Count conversions
-            actions = ad.get('actions', [])
-            conversions = 0
-            for action in actions:
-                if action.get('action_type') in ['purchase', 'omni_purchase', 'lead']:
-                    conversions += int(action.get('value', 0))
-            
             ads.append({
                 'ad_id': ad.get('ad_id'),
                 'ad_name': ad.get('ad_name', 'Unknown'),
@@ -247,21 +629,120 @@ class MetaAdsClient:
                 'cpc': float(ad.get('cpc', 0))
             })
         
-        # Sort by ROAS and return top performers
-        ads.sort(key=lambda x: x['roas'], reverse=True)
+        # Sort by the requested metric (ROAS by default) and return top performers
+        if sort_by not in ('roas', 'spend', 'revenue', 'ctr', 'conversions', 'clicks', 'impressions'):
+            sort_by = 'roas'
+        ads.sort(key=lambda x: x[sort_by], reverse=True)
         return ads[:limit]
     
+    def _iter_pages(self, endpoint: str, params: Dict, first_page: Optional[Dict] = None):
+        """Yield rows from every page of a Graph edge, following the after cursor.
+
+        first_page is an already fetched first response (e.g. from a batch).
+        """
+        params = dict(params)
+        while True:
+            data, first_page = first_page or self._make_request(endpoint, params), None
+            for row in data.get('data', []):
+                yield row
+            paging = data.get('paging', {})
+            after = paging.get('cursors', {}).get('after')
+            if not paging.get('next') or not after:
+                return
+            params['after'] = after
+
+    def _batch(self, calls: List[tuple]) -> List[Dict]:
+        """Run several (endpoint, params) GETs as one Graph batch request; results keep call order"""
+        batch = [{'method': 'GET', 'relative_url': endpoint.lstrip('/') + '?' + urlencode(params)}
+                 for endpoint, params in calls]
+        results = []
+        for (endpoint, _), item in zip(calls, self._make_request('/', {'batch': json.dumps(batch)}, 'POST')):
+            body = json.loads(item.get('body') or '{}') if item else {}
+            if not item or item.get('code') != 200:
+                error = body.get('error', {})
+                raise requests.exceptions.HTTPError(
+                    f"Facebook API Error ({error.get('code', '')}): {error.get('message', 'Batch request failed')} "
+                    f"[{endpoint}]")
+            results.append(body)
+        return results
+
+    def get_object_accounts(self, object_ids: List[str]) -> Dict[str, str]:
+        """Map campaign/adset/ad ids to their ad account ids with one multi-id lookup"""
+        data = self._make_request('/', {'ids': ','.join(object_ids), 'fields': 'account_id'})
+        return {object_id: node.get('account_id') for object_id, node in data.items()
+                if isinstance(node, dict) and node.get('account_id')}
+
+    def compare_campaigns(self, account_id: str, campaign_ids: List[str], date_range: Dict,
+                          time_increment=None) -> List[Dict]:
+        """Totals (and optionally a per-bucket trend) for the given campaigns from one filtered query"""
+        params = {
+            'fields': 'campaign_id,campaign_name,spend,impressions,clicks,actions,action_values',
+            'time_range': f'{{"since":"{date_range["since"]}","until":"{date_range["until"]}"}}',
+            'level': 'campaign',
+            'filtering': json.dumps([{'field': 'campaign.id', 'operator': 'IN', 'value': list(campaign_ids)}]),
+            'action_breakdowns': 'action_type',
+            'limit': 500
+        }
+        if time_increment:
+            params['time_increment'] = time_increment
+
+        classifier = actions.classifier_for(account_id)
+        campaigns: Dict[str, Dict] = {}
+        for row in self._iter_pages(f'/act_{account_id}/insights', params):
+            revenue, conversions = classifier.classify(row)
+            bucket = {
+                'date_start': row.get('date_start'),
+                'spend': float(row.get('spend', 0)),
+                'revenue': revenue,
+                'impressions': int(row.get('impressions', 0)),
+                'clicks': int(row.get('clicks', 0)),
+                'conversions': conversions
+            }
+            campaign = campaigns.get(row.get('campaign_id'))
+            if campaign is None:
+                campaign = campaigns[row.get('campaign_id')] = {
+                    'campaign_id': row.get('campaign_id'),
+                    'campaign_name': row.get('campaign_name', 'Unknown'),
+                    'account_id': account_id,
+                    'spend': 0.0, 'revenue': 0.0, 'impressions': 0, 'clicks': 0, 'conversions': 0
+                }
+                if time_increment:
+                    campaign['trend'] = []
+            for key in ('spend', 'revenue', 'impressions', 'clicks', 'conversions'):
+                campaign[key] += bucket[key]
+            if time_increment:
+                bucket['roas'] = self._calculate_roas(bucket['spend'], bucket['revenue'])
+                campaign['trend'].append(bucket)
+
+        for campaign in campaigns.values():
+            spend, clicks = campaign['spend'], campaign['clicks']
+            campaign['spend'] = round(spend, 2)
+            campaign['revenue'] = round(campaign['revenue'], 2)
+            campaign['roas'] = self._calculate_roas(spend, campaign['revenue'])
+            campaign['ctr'] = round(clicks / campaign['impressions'] * 100, 2) if campaign['impressions'] else 0
+            campaign['cpc'] = round(spend / clicks, 2) if clicks else 0
+            campaign['conversion_rate'] = round(campaign['conversions'] / clicks * 100, 2) if clicks else 0
+            trend = campaign.get('trend')
+            if trend and len(trend) > 1:
+                first, last = trend[0], trend[-1]
+                campaign['trend_change_pct'] = {
+                    key: round((last[key] - first[key]) / first[key] * 100, 1) if first[key] else None
+                    for key in ('spend', 'revenue', 'roas')
+                }
+        return list(campaigns.values())
+
     def get_account_roas(self, account_id: str, date_range: Dict) -> Dict:
         """Alias for get_account_overview for backward compatibility"""
         return self.get_account_overview(account_id, date_range)
     
     def get_adsets_performance(self, account_id: str, date_range: Dict, campaign_id: str = None) -> List[Dict]:
         """Get ad sets performance with real data"""
-        fields = 'adset_id,adset_name,campaign_id,campaign_name,spend,impressions,clicks,conversions,conversion_values,ctr,cpm,daily_budget,lifetime_budget,status'
+        fields = 'adset_id,adset_name,campaign_id,campaign_name,spend,impressions,clicks,actions,action_values,ctr,cpm,daily_budget,lifetime_budget,status'
         params = {
             'fields': fields,
             'time_range': f'{{"since":"{date_range["since"]}","until":"{date_range["until"]}"}}',
-            'level': 'adset'
+            'level': 'adset',
+            'action_breakdowns': 'action_type'
         }
         
         if campaign_id:
@@ -270,12 +751,10 @@ class MetaAdsClient:
         data = self._make_request(f'/act_{account_id}/insights', params)
         
         adsets = []
-        for adset in data.get('data', []):
+        rows = data.get('data', [])
+        revenues, conversion_counts = actions.classifier_for(account_id).classify_page(rows)
+        for adset, revenue, conversions in zip(rows, revenues, conversion_counts):
             spend = float(adset.get('spend', 0))
-            conversion_values = adset.get('conversion_values', [])
-            revenue = 0
-            if conversion_values:
-                revenue = float(conversion_values[0].get('value', 0))
             
             adsets.append({
                 'adset_id': adset.get('adset_id'),
@@ -288,7 +767,7 @@ class MetaAdsClient:
                 'roas': self._calculate_roas(spend, revenue),
                 'impressions': int(adset.get('impressions', 0)),
                 'clicks': int(adset.get('clicks', 0)),
-                'conversions': int(adset.get('conversions', 0)),
+                'conversions': conversions,
                 'ctr': float(adset.get('ctr', 0)),
                 'cpm': float(adset.get('cpm', 0)),
                 'budget': float(adset.get('daily_budget', adset.get('lifetime_budget', 0)))
@@ -298,207 +777,51 @@ class MetaAdsClient:
     
     def get_audience_insights(self, account_id: str, date_range: Dict, breakdown: str = 'age,gender') -> Dict:
         """Get audience demographic insights with breakdowns"""
-        fields = 'spend,impressions,clicks,conversions,conversion_values,ctr'
-        params = {
-            'fields': fields,
-            'time_range': f'{{"since":"{date_range["since"]}","until":"{date_range["until"]}"}}',
-            'level': 'account',
-            'breakdowns': breakdown
-        }
-        
-        data = self._make_request(f'/act_{account_id}/insights', params)
-        
-        insights = {
-            'age_breakdown': {},
-            'gender_breakdown': {},
-            'total_metrics': {'spend': 0, 'conversions': 0, 'revenue': 0}
-        }
-        
-        for segment in data.get('data', []):
-            spend = float(segment.get('spend', 0))
-            conversions = int(segment.get('conversions', 0))
-            conversion_values = segment.get('conversion_values', [])
-            revenue = float(conversion_values[0].get('value', 0)) if conversion_values else 0
-            
-            age = segment.get('age', 'unknown')
-            gender = segment.get('gender', 'unknown')
-            
-            # Age breakdown
-            if age != 'unknown':
-                if age not in insights['age_breakdown']:
-                    insights['age_breakdown'][age] = {'spend': 0, 'conversions': 0, 'revenue': 0}
-                insights['age_breakdown'][age]['spend'] += spend
-                insights['age_breakdown'][age]['conversions'] += conversions
-                insights['age_breakdown'][age]['revenue'] += revenue
-                insights['age_breakdown'][age]['roas'] = self._calculate_roas(
-                    insights['age_breakdown'][age]['spend'],
-                    insights['age_breakdown'][age]['revenue']
-                )
-            
-            # Gender breakdown
-            if gender != 'unknown':
-                if gender not in insights['gender_breakdown']:
-                    insights['gender_breakdown'][gender] = {'spend': 0, 'conversions': 0, 'revenue': 0}
-                insights['gender_breakdown'][gender]['spend'] += spend
-                insights['gender_breakdown'][gender]['conversions'] += conversions
-                insights['gender_breakdown'][gender]['revenue'] += revenue
-                insights['gender_breakdown'][gender]['roas'] = self._calculate_roas(
-                    insights['gender_breakdown'][gender]['spend'],
-                    insights['gender_breakdown'][gender]['revenue']
-                )
-            
-            insights['total_metrics']['spend'] += spend
-            insights['total_metrics']['conversions'] += conversions
-            insights['total_metrics']['revenue'] += revenue
-        
-        return insights
+        # age and gender views share one cached age x gender fetch (see app/audience.py)
+        return audience.audience_insights(self, account_id, date_range, breakdown)
     
-    def get_daily_trends(self, account_id: str, date_range: Dict) -> List[Dict]:
-        """Get daily performance trends"""
-        fields = 'spend,impressions,clicks,conversions,conversion_values,ctr,cpm'
-        params = {
-            'fields': fields,
-            'time_range': f'{{"since":"{date_range["since"]}","until":"{date_range["until"]}"}}',
-            'time_increment': '1',  # Daily breakdown
-            'level': 'account'
-        }
-        
-        data = self._make_request(f'/act_{account_id}/insights', params)
-        
-        trends = []
-        for day in data.get('data', []):
-            spend = float(day.get('spend', 0))
-            conversion_values = day.get('conversion_values', [])
-            revenue = float(conversion_values[0].get('value', 0)) if conversion_values else 0
-            
-            trends.append({
-                'date': day.get('date_start'),
-                'spend': spend,
-                'revenue': revenue,
-                'roas': self._calculate_roas(spend, revenue),
-                'impressions': int(day.get('impressions', 0)),
-                'clicks': int(day.get('clicks', 0)),
-                'conversions': int(day.get('conversions', 0)),
-                'ctr': float(day.get('ctr', 0)),
-                'cpm': float(day.get('cpm', 0))
-            })
-        
-        return sorted(trends, key=lambda x: x['date'])
+    def get_daily_trends(self, account_id: str, date_range: Dict, metrics: List[str] = None) -> List[Dict]:
+        """Get daily performance trends with 7-day averages, week-over-week change and anomaly flags"""
+        # served from the account's cached daily series (see app/trends.py)
+        return trends.daily_trends(self, account_id, date_range, metrics)
     
-    def get_placement_performance(self, account_id: str, date_range: Dict) -> List[Dict]:
-        """Get performance by placement (Facebook, Instagram, etc)"""
-        fields = 'spend,impressions,clicks,conversions,conversion_values,ctr,cpm'
-        params = {
-            'fields': fields,
-            'time_range': f'{{"since":"{date_range["since"]}","until":"{date_range["until"]}"}}',
-            'level': 'account',
-            'breakdowns': 'publisher_platform,placement'
-        }
-        
-        data = self._make_request(f'/act_{account_id}/insights', params)
-        
-        placements = {}
-        for item in data.get('data', []):
-            platform = item.get('publisher_platform', 'unknown')
-            placement = item.get('placement', platform)
-            
-            spend = float(item.get('spend', 0))
-            conversion_values = item.get('conversion_values', [])
-            revenue = float(conversion_values[0].get('value', 0)) if conversion_values else 0
-            
-            if placement not in placements:
-                placements[placement] = {
-                    'placement': placement,
-                    'platform': platform,
-                    'spend': 0,
-                    'revenue': 0,
-                    'impressions': 0,
-                    'clicks': 0,
-                    'conversions': 0
-                }
-            
-            placements[placement]['spend'] += spend
-            placements[placement]['revenue'] += revenue
-            placements[placement]['impressions'] += int(item.get('impressions', 0))
-            placements[placement]['clicks'] += int(item.get('clicks', 0))
-            placements[placement]['conversions'] += int(item.get('conversions', 0))
-        
-        # Calculate ROAS for each placement
-        result = []
-        for placement_data in placements.values():
-            placement_data['roas'] = self._calculate_roas(placement_data['spend'], placement_data['revenue'])
-            result.append(placement_data)
-        
-        return sorted(result, key=lambda x: x['spend'], reverse=True)
+    def get_placement_performance(self, account_id: str, date_range: Dict, group_by: str = 'placement') -> List[Dict]:
+        """Get performance by placement (Facebook, Instagram, etc), by device, or both"""
+        # served from cached per-day placement x device partitions (see app/placements.py)
+        return placements.placement_performance(self, account_id, date_range, group_by)
     
     def get_creative_performance(self, account_id: str, date_range: Dict) -> List[Dict]:
         """Get performance by creative type"""
-        # First get all ads with their creative info
-        ads_endpoint = f'/act_{account_id}/ads'
-        ads_params = {
-            'fields': 'id,name,creative{object_type}',
-            'limit': 500
-        }
-        
-        ads_data = self._make_request(ads_endpoint, ads_params)
-        
-        # Map ad IDs to creative types
-        ad_creative_types = {}
-        for ad in ads_data.get('data', []):
-            ad_id = ad.get('id')
-            creative = ad.get('creative', {})
-            object_type = creative.get('object_type', 'UNKNOWN')
-            
-            # Map Facebook creative types to simple categories
-            if object_type in ['VIDEO', 'VIDEO_AUTOPLAY']:
-                creative_type = 'video'
-            elif object_type in ['LINK', 'IMAGE', 'PHOTO']:
-                creative_type = 'image'
-            elif object_type == 'CAROUSEL':
-                creative_type = 'carousel'
-            else:
-                creative_type = 'other'
-            
-            ad_creative_types[ad_id] = creative_type
-        
-        # Now get performance data
-        fields = 'ad_id,spend,impressions,clicks,conversions,conversion_values,ctr'
+        # ad id -> creative category comes from the incrementally refreshed creative index
+        ad_creative_types = creative_index.types_for(self, account_id)
+
+        # Stream every page of ad-level insights instead of the first 25 rows
+        fields = 'ad_id,spend,impressions,clicks,actions,action_values,ctr'
         params = {
             'fields': fields,
             'time_range': f'{{"since":"{date_range["since"]}","until":"{date_range["until"]}"}}',
-            'level': 'ad'
+            'level': 'ad',
+            'action_breakdowns': 'action_type',
+            'limit': 500
         }
-        
-        data = self._make_request(f'/act_{account_id}/insights', params)
-        
-        # Aggregate by creative type
+        rows = self._iter_pages(f'/act_{account_id}/insights', params)
+
+        # Aggregate by creative type; ads missing from the index are looked up once at the end
+        classifier = actions.classifier_for(account_id)
         creative_performance = {}
-        for ad in data.get('data', []):
-            ad_id = ad.get('ad_id')
-            creative_type = ad_creative_types.get(ad_id, 'unknown')
-            
-            if creative_type not in creative_performance:
-                creative_performance[creative_type] = {
-                    'type': creative_type,
-                    'count': 0,
-                    'spend': 0,
-                    'revenue': 0,
-                    'impressions': 0,
-                    'clicks': 0,
-                    'conversions': 0
-                }
-            
-            creative_performance[creative_type]['count'] += 1
-            creative_performance[creative_type]['spend'] += float(ad.get('spend', 0))
-            
-            conversion_values = ad.get('conversion_values', [])
-            revenue = float(conversion_values[0].get('value', 0)) if conversion_values else 0
-            creative_performance[creative_type]['revenue'] += revenue
-            
-            creative_performance[creative_type]['impressions'] += int(ad.get('impressions', 0))
-            creative_performance[creative_type]['clicks'] += int(ad.get('clicks', 0))
-            creative_performance[creative_type]['conversions'] += int(ad.get('conversions', 0))
-        
+        unresolved: Dict[str, List[Dict]] = {}
+        for ad in rows:
+            creative_type = ad_creative_types.get(ad.get('ad_id'))
+            if creative_type is None:
+                unresolved.setdefault(ad.get('ad_id'), []).append(ad)
+                continue
+            self._add_creative_row(creative_performance, creative_type, ad, classifier)
+        if unresolved:
+            resolved = creative_index.resolve(self, account_id, list(unresolved))
+            for ad_id, ads in unresolved.items():
+                for ad in ads:
+                    self._add_creative_row(creative_performance, resolved.get(ad_id, 'unknown'), ad, classifier)
+
         # Calculate metrics
         result = []
         for perf in creative_performance.values():
@@ -509,4 +832,37 @@ class MetaAdsClient:
                 perf['ctr'] = 0
             result.append(perf)
         
-        return sorted(result, key=lambda x: x['spend'], reverse=True)
\ No newline at end of file
+        return sorted(result, key=lambda x: x['spend'], reverse=True)
+
+    @staticmethod
+    def _add_creative_row(creative_performance: Dict, creative_type: str, ad: Dict,
+                          classifier: actions.ActionClassifier) -> None:
+        if creative_type not in creative_performance:
+            creative_performance[creative_type] = {
+                'type': creative_type,
+                'count': 0,
+                'spend': 0,
+                'revenue': 0,
+                'impressions': 0,
+                'clicks': 0,
+                'conversions': 0
+            }
+        
+        creative_performance[creative_type]['count'] += 1
+        creative_performance[creative_type]['spend'] += float(ad.get('spend', 0))
+        
+        revenue, conversions = classifier.classify(ad)
+        creative_performance[creative_type]['revenue'] += revenue
+        
+        creative_performance[creative_type]['impressions'] += int(ad.get('impressions', 0))
+        creative_performance[creative_type]['clicks'] += int(ad.get('clicks', 0))
+        creative_performance[creative_type]['conversions'] += conversions
+
+
+_transport = os.getenv('GRAPH_TRANSPORT')
+if _transport == 'simulator':
+    from app.graph_simulator import install
+    install()
+elif _transport in ('record', 'replay'):
+    from app import graph_capture
+    graph_capture.install(_transport, os.getenv('GRAPH_CAPTURE', 'graph_capture.ndjson.gz'))
@@ -0,0 +1,187 @@
+"""
+Prometheus metrics for MCP requests, tool calls, Graph API and Supabase
+When PROMETHEUS_MULTIPROC_DIR is set (see gunicorn.conf.py), /metrics
+aggregates the samples written by every gunicorn worker.
+"""
+
+import os
+import re
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from flask import Blueprint, Response, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# Graph and tool calls range from milliseconds to minutes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+MCP_METHODS = frozenset([
+    'initialize', 'initialized', 'notifications/initialized', 'tools/list', 'tools/call', 'ping'
+])
+
+MCP_REQUEST_LATENCY = Histogram(
+    'mcp_request_duration_seconds', 'MCP JSON-RPC request latency by method',
+    ['method', 'status'], buckets=LATENCY_BUCKETS
+)
+MCP_TOOL_LATENCY = Histogram(
+    'mcp_tool_duration_seconds', 'MCP tool execution latency by tool',
+    ['tool', 'status'], buckets=LATENCY_BUCKETS
+)
+GRAPH_REQUEST_LATENCY = Histogram(
+    'graph_api_request_duration_seconds', 'Graph API request latency by endpoint and level',
+    ['endpoint', 'level'], buckets=LATENCY_BUCKETS
+)
+GRAPH_REQUESTS = Counter(
+    'graph_api_requests_total', 'Graph API requests by endpoint, level and result code',
+    ['endpoint', 'level', 'code']
+)
+SUPABASE_QUERY_LATENCY = Histogram(
+    'supabase_query_duration_seconds', 'Supabase query latency by operation',
+    ['operation'], buckets=LATENCY_BUCKETS
+)
+SUPABASE_QUERIES = Counter(
+    'supabase_queries_total', 'Supabase queries by operation and status',
+    ['operation', 'status']
+)
+HTTP_CLIENT_REQUESTS = Counter(
+    'http_client_requests_total', 'Outbound HTTP requests by host',
+    ['host']
+)
+HTTP_CLIENT_CONNECTIONS = Counter(
+    'http_client_connections_opened_total',
+    'Outbound HTTP connections opened by host; requests minus opened connections were reused',
+    ['host']
+)
+
+GRAPH_QUEUE_WAIT = Histogram(
+    'graph_scheduler_wait_seconds', 'Time Graph requests waited for a scheduler slot by lane',
+    ['lane'], buckets=LATENCY_BUCKETS
+)
+GRAPH_QUEUE_REJECTIONS = Counter(
+    'graph_scheduler_rejections_total', 'Graph requests refused by the scheduler by lane and reason',
+    ['lane', 'reason']
+)
+GRAPH_RESILIENCE_EVENTS = Counter(
+    'graph_resilience_events_total',
+    'Graph circuit breaker and hedging events (opened, served_stale, rejected, hedged) by endpoint class',
+    ['endpoint_class', 'event']
+)
+
+_ACT_ID = re.compile(r'(?<![^/])act_\d+')
+_NUMERIC_ID = re.compile(r'(?<![^/])\d+(?=/|$)')
+
+
+def normalize_endpoint(endpoint: str) -> str:
+    """Collapse ids so Graph paths make low-cardinality labels"""
+    endpoint = _ACT_ID.sub('act_{id}', endpoint)
+    return _NUMERIC_ID.sub('{id}', endpoint)
+
+
+def mcp_method_label(method) -> str:
+    return method if method in MCP_METHODS else 'unknown'
+
+
+def observe_mcp_request(method, status, seconds: float) -> None:
+    MCP_REQUEST_LATENCY.labels(method=mcp_method_label(method), status=str(status)).observe(seconds)
+
+
+def observe_tool(tool: str, status: str, seconds: float) -> None:
+    MCP_TOOL_LATENCY.labels(tool=tool, status=status).observe(seconds)
+
+
+def observe_graph_request(endpoint: str, level: str, code, seconds: float) -> None:
+    endpoint = normalize_endpoint(endpoint)
+    level = level or 'none'
+    GRAPH_REQUEST_LATENCY.labels(endpoint=endpoint, level=level).observe(seconds)
+    GRAPH_REQUESTS.labels(endpoint=endpoint, level=level, code=str(code)).inc()
+
+
+def observe_scheduler_wait(lane: str, seconds: float) -> None:
+    GRAPH_QUEUE_WAIT.labels(lane=lane).observe(seconds)
+
+
+def observe_scheduler_rejection(lane: str, reason: str) -> None:
+    GRAPH_QUEUE_REJECTIONS.labels(lane=lane, reason=reason).inc()
+
+
+def observe_circuit(endpoint_class: str, event: str) -> None:
+    GRAPH_RESILIENCE_EVENTS.labels(endpoint_class=endpoint_class, event=event).inc()
+
+
+def track_mcp_requests(blueprint: Blueprint) -> None:
+    """Time requests on a blueprint whose handlers set g.mcp_method"""
+
+    @blueprint.before_request
+    def _start_timer():
+        g.mcp_started = time.perf_counter()
+
+    @blueprint.after_request
+    def _observe(response):
+        method = g.pop('mcp_method', None)
+        started = g.pop('mcp_started', None)
+        if method is not None and started is not None:
+            observe_mcp_request(method, response.status_code, time.perf_counter() - started)
+        return response
+
+
+@contextmanager
+def supabase_query(operation: str):
+    """Time a Supabase call: ``with supabase_query('users.select'): ...``"""
+    started = time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except Exception:
+        status = 'error'
+        raise
+    finally:
+        SUPABASE_QUERY_LATENCY.labels(operation=operation).observe(time.perf_counter() - started)
+        SUPABASE_QUERIES.labels(operation=operation, status=status).inc()
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        HTTP_CLIENT_CONNECTIONS.labels(host=self.host).inc()
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        HTTP_CLIENT_CONNECTIONS.labels(host=self.host).inc()
+        return super()._new_conn()
+
+
+class InstrumentedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that counts requests and newly opened connections per host"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool
+        }
+
+    def send(self, request, **kwargs):
+        HTTP_CLIENT_REQUESTS.labels(host=urlparse(request.url).hostname or 'unknown').inc()
+        return super().send(request, **kwargs)
+
+
+@metrics_bp.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint"""
+    token = os.getenv('METRICS_TOKEN')
+    if token and request.headers.get('Authorization', '') != f'Bearer {token}':
+        return Response('Unauthorized', status=401)
+
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
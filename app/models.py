@@ -62,7 +62,7 @@ class User(UserMixin):
         """Get user by ID from Supabase"""
         try:
             client = SupabaseClient.get_client()
-            result = client.table('users').select('*').eq('id', user_id).execute()
+            result = SupabaseClient.execute('users.select', client.table('users').select('*').eq('id', user_id))
             if result.data:
                 return cls(result.data[0])
         except Exception as e:
@@ -208,18 +208,18 @@ class MCPSession:
             }
             
             # Check if session exists
-            result = client.table('mcp_sessions').select('*').eq('session_token', self.session_token).execute()
+            result = SupabaseClient.execute('mcp_sessions.select', client.table('mcp_sessions').select('*').eq('session_token', self.session_token))
             
             if result.data:
                 # Update existing session
-                updated = client.table('mcp_sessions').update({
+                updated = SupabaseClient.execute('mcp_sessions.update', client.table('mcp_sessions').update({
                     'last_activity': 'now()',
                     'is_active': self.is_active
-                }).eq('session_token', self.session_token).execute()
+                }).eq('session_token', self.session_token))
                 return updated.data[0] if updated.data else None
             else:
                 # Create new session
-                created = client.table('mcp_sessions').insert(session_data).execute()
+                created = SupabaseClient.execute('mcp_sessions.insert', client.table('mcp_sessions').insert(session_data))
                 if created.data:
                     self.id = created.data[0].get('id')
                 return created.data[0] if created.data else None
@@ -232,7 +232,7 @@ class MCPSession:
         """Get session by token"""
         try:
             client = SupabaseClient.get_client()
-            result = client.table('mcp_sessions').select('*').eq('session_token', token).eq('is_active', True).execute()
+            result = SupabaseClient.execute('mcp_sessions.select', client.table('mcp_sessions').select('*').eq('session_token', token).eq('is_active', True))
             if result.data:
                 return cls(result.data[0])
         except Exception as e:
@@ -3,21 +3,31 @@ Fixed OAuth MCP implementation for Claude
 This version ensures tools are properly exposed after OAuth
 """
 
-from flask import Blueprint, jsonify, request, redirect, Response, make_response, render_template, session
+from flask import Blueprint, jsonify, request, redirect, Response, make_response, render_template, session, g
 from flask_login import current_user
 import json
 import jwt
 import os
+import re
 import uuid
 from datetime import datetime, timedelta
 from app.models import User, AdAccount
-from app.meta_client import MetaAdsClient
+from app.meta_client import MetaAdsClient, parallel_map
+from app import metrics, portfolio, serialization, tracing
+from app.scheduler import BACKGROUND, GraphCapacityError, INTERACTIVE, graph_scheduler
+from app.result_cursors import cursor_store, CursorError, PAGING_PROPERTIES
+from app.tool_registry import (ToolRegistry, InitializeResults, PrecomputedPayload, TTLCache,
+                               StaleWhileRevalidateCache, ToolArgumentError, ToolTimeoutError,
+                               UnknownToolError)
+import contextvars
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 
 logger = logging.getLogger(__name__)
 
 oauth_mcp_fixed_bp = Blueprint('oauth_mcp_fixed', __name__)
+metrics.track_mcp_requests(oauth_mcp_fixed_bp)
 
 JWT_SECRET = os.getenv('JWT_SECRET', 'your-jwt-secret-key')
 BASE_URL = os.getenv('BASE_URL', 'https://deep-audy-wotbix-9060bbad.koyeb.app')
@@ -32,670 +42,582 @@ def add_cors_headers(response):
     response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
     return response
 
-def get_tools_list():
-    """Return the list of available tools"""
-    return [
-        {
-            "name": "get_meta_ads_overview",
-            "description": "Get Meta Ads account overview and metrics for specified time period. Automatically selects account with data.",
-            "inputSchema": {
-                "type": "object",
-                "properties": {
-                    "days": {
-                        "type": "number",
-                        "description": "Number of days to look back (default: 60, recommended: 60-90 for better data coverage, max: 365)"
-                    },
-                    "account_name": {
-                        "type": "string",
-                        "description": "Optional: Specific account name to use (if not provided, uses account with data)"
-                    }
-                },
-                "required": []
-            }
-        },
-        {
-            "name": "get_campaigns",
-            "description": "Get list of Meta Ads campaigns with performance metrics for specified time period",
-            "inputSchema": {
-                "type": "object",
-                "properties": {
-                    "days": {
-                        "type": "number",
-                        "description": "Number of days to look back (default: 60, recommended: 60-90 for better data coverage, max: 365)"
-                    },
-                    "limit": {
-                        "type": "number",
-                        "description": "Number of campaigns to return (default: 10)"
-                    }
-                },
-                "required": []
-            }
-        },
-        {
-            "name": "get_account_metrics",
-            "description": "Get detailed account metrics including ROAS, CTR, and spend for specified time period",
-            "inputSchema": {
-                "type": "object",
-                "properties": {
-                    "days": {
-                        "type": "number",
-                        "description": "Number of days to look back (default: 60, recommended: 60-90 for better data coverage, max: 365)"
-                    }
-                },
-                "required": []
-            }
-        },
-        {
-            "name": "get_all_campaigns_list",
-            "description": "Get list of ALL campaigns in the account (including paused/inactive)",
-            "inputSchema": {
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        },
-        {
-            "name": "list_accounts",
-            "description": "List all connected Facebook ad accounts and their data availability status",
-            "inputSchema": {
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        }
-    ]
+# Tool calls are dispatched through the registry: auth, account resolution,
+# result caching and error mapping run once per call as shared middleware
+tool_registry = ToolRegistry(default_timeout=float(os.getenv('TOOL_TIMEOUT_SECONDS', '90')))
 
-def execute_tool(tool_name, arguments, user_email=None):
-    """Execute a tool and return results from real Facebook data"""
-    # IMPORTANT: No demo data - only real data or error messages
-    if not user_email:
-        return {
-            "status": "error",
-            "message": "Authentication required. Please reconnect Claude to your Zane account."
-        }
+# Supabase lookups and the account probe are shared by every tool call
+_user_cache = TTLCache(ttl=float(os.getenv('USER_CACHE_TTL', '60')))
+_account_choice_cache = TTLCache(ttl=float(os.getenv('ACCOUNT_PROBE_TTL', '300')))
+_tool_result_cache = StaleWhileRevalidateCache(max_entries=512)
 
-    if tool_name == "get_meta_ads_overview":
-        try:
-            # Get days parameter (default 30, max 365)
-            days = min(int(arguments.get("days", 30)), 365)
-
-            # Get user's ad accounts from database
-            user = User.get_by_email(user_email)
-            if not user:
-                return {
-                    "status": "error",
-                    "message": "User account not found. Please reconnect Claude to your Zane account."
-                }
-
-            ad_accounts = user.get_ad_accounts()
-            if not ad_accounts or len(ad_accounts) == 0:
-                return {
-                    "status": "error",
-                    "message": "No Facebook Ads account connected. Please connect your Facebook Ads account in Zane dashboard first."
-                }
-
-            # Check if specific account requested
-            account_name = arguments.get("account_name")
-            account = None
-
-            if account_name:
-                # Find the specific account by name
-                for acc in ad_accounts:
-                    if acc.account_name.lower() == account_name.lower():
-                        account = acc
-                        logger.info(f"Using requested account: {acc.account_name}")
-                        break
-
-                if not account:
-                    return {
-                        "status": "error",
-                        "message": f"Account '{account_name}' not found. Available accounts: {', '.join([a.account_name for a in ad_accounts])}"
-                    }
-            else:
-                # Try to find an account with data, otherwise use the first active account
-                # First, try to find an account that has data
-                for acc in ad_accounts:
-                    # Quick test to see if this account has data
-                    try:
-                        test_client = MetaAdsClient(acc.access_token)
-                        test_date_range = {
-                            'since': (datetime.now() - timedelta(days=90)).strftime('%Y-%m-%d'),
-                            'until': datetime.now().strftime('%Y-%m-%d')
-                        }
-                        test_data = test_client._make_request(f'/act_{acc.account_id}/insights', {
-                            'fields': 'spend',
-                            'time_range': f'{{"since":"{test_date_range["since"]}","until":"{test_date_range["until"]}"}}',
-                            'level': 'account'
-                        })
-
-                        if test_data.get('data') and len(test_data.get('data', [])) > 0:
-                            account = acc
-                            logger.info(f"Using account {acc.account_name} which has data")
-                            break
-                    except:
-                        continue
-
-                # If no account with data found, use the first active one
-                if not account:
-                    for acc in ad_accounts:
-                        if acc.is_active:
-                            account = acc
-                            logger.info(f"No accounts with data found, using first active account: {acc.account_name}")
-                            break
-
-                # If still no account, use the first one
-                if not account:
-                    account = ad_accounts[0]
-                    logger.info(f"Using first available account: {account.account_name}")
-
-            # Initialize Meta API client
-            client = MetaAdsClient(account.access_token)
-
-            # Get dynamic date range - default to 60 days for better coverage
-            end_date = datetime.now()
-            # Use 60 days as default if 30 is specified, to catch older campaigns
-            actual_days = days if days != 30 else 60
-            start_date = end_date - timedelta(days=actual_days)
-            date_range = {
-                'since': start_date.strftime('%Y-%m-%d'),
-                'until': end_date.strftime('%Y-%m-%d')
-            }
+# Interactive tools answer from a slightly stale result while it is refreshed in the background
+SWR_FRESH_TTL = float(os.getenv('TOOL_FRESH_TTL', '60'))
+SWR_STALE_TTL = float(os.getenv('TOOL_STALE_TTL', '900'))
+_refresh_executor = ThreadPoolExecutor(max_workers=int(os.getenv('TOOL_REFRESH_WORKERS', '2')),
+                                       thread_name_prefix='tool-refresh')
 
-            # Fetch real data from Facebook
-            overview = client.get_account_overview(account.account_id, date_range)
-
-            # Format the response with real data
-            return {
-                "status": "connected",
-                "account_name": account.account_name,
-                "account_id": account.account_id,
-                "currency": overview.get('currency', 'USD'),
-                "total_spend": f"${overview.get('spend', 0):,.2f}",
-                "total_revenue": f"${overview.get('revenue', 0):,.2f}",
-                "roas": f"{overview.get('roas', 0):.1f}x",
-                "impressions": f"{overview.get('impressions', 0):,}",
-                "clicks": f"{overview.get('clicks', 0):,}",
-                "conversions": overview.get('conversions', 0),
-                "ctr": f"{overview.get('ctr', 0):.2f}%",
-                "cpc": f"${overview.get('cpc', 0):.2f}",
-                "period": f"Last {days} days",
-                "date_range": f"{start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"
-            }
+DAYS_PROPERTY = {
+    "type": "number",
+    "description": "Number of days to look back (default: 60, recommended: 60-90 for better data coverage, max: 365)"
+}
 
-        except Exception as e:
-            logger.error(f"Error fetching Meta Ads overview: {str(e)}")
-            # Check if it's a requests exception with response
-            if hasattr(e, 'response') and e.response is not None:
-                try:
-                    error_data = e.response.json()
-                    error_msg = error_data.get('error', {}).get('message', str(e))
-                    error_code = error_data.get('error', {}).get('code', '')
-                    logger.error(f"Facebook API Error - Code: {error_code}, Message: {error_msg}")
-
-                    # Common error handling
-                    if error_code == 190 or "expired" in error_msg.lower():
-                        return {
-                            "status": "error",
-                            "message": "Facebook access token has expired. Please reconnect your Facebook account in the Zane dashboard."
-                        }
-                    elif error_code == 100:
-                        return {
-                            "status": "error",
-                            "message": "Invalid Facebook API request. This may be due to missing permissions or invalid parameters."
-                        }
-                except:
-                    pass
-
-            return {
-                "status": "error",
-                "message": f"Failed to fetch data from Facebook: {str(e)}"
-            }
-    
-    elif tool_name == "get_campaigns":
-        # Get parameters
-        days = min(int(arguments.get("days", 30)), 365)
-        limit = arguments.get("limit", 10)
-
-        if not user_email:
-            return {
-                "status": "error",
-                "message": "Authentication required. Please reconnect Claude to your Zane account."
-            }
 
-        try:
-            user = User.get_by_email(user_email)
-            if not user:
-                return {
-                    "status": "error",
-                    "message": "User account not found. Please reconnect Claude to your Zane account."
-                }
-
-            ad_accounts = user.get_ad_accounts()
-            if not ad_accounts or len(ad_accounts) == 0:
-                return {
-                    "status": "error",
-                    "message": "No Facebook Ads account connected. Please connect your Facebook Ads account in Zane dashboard first."
-                }
-
-            # Try to find an account with data - check last 90 days
-            account = None
-            test_end_date = datetime.now()
-            test_start_date = test_end_date - timedelta(days=90)
-
-            for acc in ad_accounts:
-                try:
-                    test_client = MetaAdsClient(acc.access_token)
-                    logger.info(f"Testing account {acc.account_name} (ID: {acc.account_id}) for data...")
-
-                    test_data = test_client._make_request(f'/act_{acc.account_id}/insights', {
-                        'fields': 'spend',
-                        'time_range': f'{{"since":"{test_start_date.strftime("%Y-%m-%d")}","until":"{test_end_date.strftime("%Y-%m-%d")}"}}',
-                        'level': 'account',
-                        'limit': 1
-                    })
-
-                    if test_data.get('data') and len(test_data.get('data', [])) > 0:
-                        spend = float(test_data['data'][0].get('spend', 0))
-                        logger.info(f"Found data in account {acc.account_name}: ${spend:.2f} spend")
-                        account = acc
-                        break
-                    else:
-                        logger.info(f"No data found in account {acc.account_name}")
-                except Exception as e:
-                    logger.warning(f"Error testing account {acc.account_name}: {str(e)}")
-                    continue
-
-            if not account:
-                logger.warning(f"No accounts with data found, using first account: {ad_accounts[0].account_name}")
-                account = ad_accounts[0]
-            else:
-                logger.info(f"Using account with data: {account.account_name} (ID: {account.account_id})")
-
-            client = MetaAdsClient(account.access_token)
-
-            # Get dynamic date range - default to 60 days for better coverage
-            end_date = datetime.now()
-            # Use 60 days as default if 30 is specified, to catch older campaigns
-            actual_days = days if days != 30 else 60
-            start_date = end_date - timedelta(days=actual_days)
-            date_range = {
-                'since': start_date.strftime('%Y-%m-%d'),
-                'until': end_date.strftime('%Y-%m-%d')
-            }
+class ToolContext:
+    """Per-call state filled in by the middleware and read by tool handlers"""
 
-            # Fetch real campaign data
-            campaigns_data = client.get_campaign_roas(account.account_id, date_range)
-
-            # Format campaigns with real data
-            campaigns = []
-            for camp in campaigns_data[:limit]:
-                campaigns.append({
-                    "name": camp.get('campaign_name', 'Unknown'),
-                    "spend": f"${camp.get('spend', 0):.2f}",
-                    "revenue": f"${camp.get('revenue', 0):.2f}",
-                    "roas": f"{camp.get('roas', 0):.1f}",
-                    "status": camp.get('status', 'Unknown'),
-                    "impressions": camp.get('impressions', 0),
-                    "clicks": camp.get('clicks', 0)
-                })
-
-            return {
-                "campaigns": campaigns,
-                "total": len(campaigns),
-                "currency": "USD",
-                "period": f"Last {days} days",
-                "date_range": f"{start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"
-            }
+    def __init__(self, user_email):
+        self.user_email = user_email
+        self.user = None
+        self.ad_accounts = []
+        self.account = None
+        self.client = None
+        self.outputs = None  # fields the tool shows, for Graph field projection
 
-        except Exception as e:
-            logger.error(f"Error fetching campaigns: {str(e)}")
-            # Check if it's a requests exception with response
-            if hasattr(e, 'response') and e.response is not None:
-                try:
-                    error_data = e.response.json()
-                    error_msg = error_data.get('error', {}).get('message', str(e))
-                    error_code = error_data.get('error', {}).get('code', '')
-                    error_type = error_data.get('error', {}).get('type', '')
-                    logger.error(f"Facebook API Error - Code: {error_code}, Type: {error_type}, Message: {error_msg}")
-
-                    return {
-                        "status": "error",
-                        "message": f"Facebook API Error ({error_code}): {error_msg}",
-                        "error_code": error_code,
-                        "error_type": error_type
-                    }
-                except:
-                    pass
-
-            return {
-                "status": "error",
-                "message": f"Failed to fetch campaigns from Facebook: {str(e)}"
-            }
-    
-    elif tool_name == "get_account_metrics":
-        days = arguments.get("days", 30)
 
-        if not user_email:
-            return {
-                "status": "error",
-                "message": "Authentication required. Please reconnect Claude to your Zane account."
-            }
+def _error(message, **extra):
+    result = {
+        "status": "error",
+        "message": message
+    }
+    result.update(extra)
+    return result
 
+
+def _facebook_error(e):
+    """Extract (code, type, message) from a Graph API failure"""
+    error_msg = str(e)
+    error_code = ''
+    error_type = ''
+    if hasattr(e, 'response') and e.response is not None:
         try:
-            user = User.get_by_email(user_email)
-            if not user:
-                return {
-                    "status": "error",
-                    "message": "User account not found. Please reconnect Claude to your Zane account."
-                }
-
-            ad_accounts = user.get_ad_accounts()
-            if not ad_accounts or len(ad_accounts) == 0:
-                return {
-                    "status": "error",
-                    "message": "No Facebook Ads account connected. Please connect your Facebook Ads account in Zane dashboard first."
-                }
-
-            # Try to find an account with data - check last 90 days
-            account = None
-            test_end_date = datetime.now()
-            test_start_date = test_end_date - timedelta(days=90)
-
-            for acc in ad_accounts:
-                try:
-                    test_client = MetaAdsClient(acc.access_token)
-                    logger.info(f"Testing account {acc.account_name} (ID: {acc.account_id}) for data...")
-
-                    test_data = test_client._make_request(f'/act_{acc.account_id}/insights', {
-                        'fields': 'spend',
-                        'time_range': f'{{"since":"{test_start_date.strftime("%Y-%m-%d")}","until":"{test_end_date.strftime("%Y-%m-%d")}"}}',
-                        'level': 'account',
-                        'limit': 1
-                    })
-
-                    if test_data.get('data') and len(test_data.get('data', [])) > 0:
-                        spend = float(test_data['data'][0].get('spend', 0))
-                        logger.info(f"Found data in account {acc.account_name}: ${spend:.2f} spend")
-                        account = acc
-                        break
-                    else:
-                        logger.info(f"No data found in account {acc.account_name}")
-                except Exception as e:
-                    logger.warning(f"Error testing account {acc.account_name}: {str(e)}")
-                    continue
-
-            if not account:
-                logger.warning(f"No accounts with data found, using first account: {ad_accounts[0].account_name}")
-                account = ad_accounts[0]
-            else:
-                logger.info(f"Using account with data: {account.account_name} (ID: {account.account_id})")
-
-            client = MetaAdsClient(account.access_token)
-
-            # Calculate date range
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=days)
-            date_range = {
-                'since': start_date.strftime('%Y-%m-%d'),
-                'until': end_date.strftime('%Y-%m-%d')
-            }
+            error_data = e.response.json().get('error', {})
+            error_msg = error_data.get('message', error_msg)
+            error_code = error_data.get('code', '')
+            error_type = error_data.get('type', '')
+        except ValueError:
+            pass
+    else:
+        # MetaAdsClient raises "Facebook API Error (<code>): <message>"
+        match = re.match(r'Facebook API Error \((\d*)\): (.*)', error_msg)
+        if match:
+            error_code = int(match.group(1)) if match.group(1) else ''
+            error_msg = match.group(2)
+    return error_code, error_type, error_msg
+
+
+def _date_range(days):
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=days)
+    return start_date, end_date, {
+        'since': start_date.strftime('%Y-%m-%d'),
+        'until': end_date.strftime('%Y-%m-%d')
+    }
 
-            # Fetch real metrics
-            metrics = client.get_account_overview(account.account_id, date_range)
-
-            # Calculate conversion rate
-            conv_rate = 0
-            if metrics.get('clicks', 0) > 0:
-                conv_rate = (metrics.get('conversions', 0) / metrics.get('clicks', 0)) * 100
-
-            return {
-                "period": f"Last {days} days",
-                "currency": metrics.get('currency', 'USD'),
-                "account_name": account.account_name,
-                "metrics": {
-                    "total_spend": f"${metrics.get('spend', 0):.2f}",
-                    "total_revenue": f"${metrics.get('revenue', 0):.2f}",
-                    "overall_roas": f"{metrics.get('roas', 0):.1f}",
-                    "avg_ctr": f"{metrics.get('ctr', 0):.2f}%",
-                    "avg_cpc": f"${metrics.get('cpc', 0):.2f}",
-                    "conversions": metrics.get('conversions', 0),
-                    "conversion_rate": f"{conv_rate:.2f}%",
-                    "impressions": metrics.get('impressions', 0),
-                    "clicks": metrics.get('clicks', 0)
-                }
-            }
 
+def _probe_account(acc, since, until):
+    """Return spend for the probe window, or None if the account has no data"""
+    test_client = MetaAdsClient(acc.access_token)
+    logger.info(f"Testing account {acc.account_name} (ID: {acc.account_id}) for data...")
+    test_data = test_client._make_request(f'/act_{acc.account_id}/insights', {
+        'fields': 'spend',
+        'time_range': f'{{"since":"{since}","until":"{until}"}}',
+        'level': 'account',
+        'limit': 1
+    })
+    if test_data.get('data') and len(test_data.get('data', [])) > 0:
+        return float(test_data['data'][0].get('spend', 0))
+    return None
+
+
+def _select_account(ctx, account_name=None):
+    """Pick the account a tool runs against, caching the probe result per user"""
+    ad_accounts = ctx.ad_accounts
+
+    if account_name:
+        for acc in ad_accounts:
+            if acc.account_name.lower() == account_name.lower():
+                logger.info(f"Using requested account: {acc.account_name}")
+                return acc
+        return None
+
+    cached_id = _account_choice_cache.get(ctx.user_email)
+    if cached_id is not None:
+        for acc in ad_accounts:
+            if acc.account_id == cached_id:
+                return acc
+
+    # Try to find an account with data - check last 90 days
+    _, _, probe_range = _date_range(90)
+    account = None
+    for acc in ad_accounts:
+        try:
+            spend = _probe_account(acc, probe_range['since'], probe_range['until'])
         except Exception as e:
-            logger.error(f"Error fetching account metrics: {str(e)}")
-            # Check if it's a requests exception with response
-            if hasattr(e, 'response') and e.response is not None:
-                try:
-                    error_data = e.response.json()
-                    error_msg = error_data.get('error', {}).get('message', str(e))
-                    error_code = error_data.get('error', {}).get('code', '')
-                    logger.error(f"Facebook API Error - Code: {error_code}, Message: {error_msg}")
-
-                    # Common error handling
-                    if error_code == 190 or "expired" in error_msg.lower():
-                        return {
-                            "status": "error",
-                            "message": "Facebook access token has expired. Please reconnect your Facebook account in the Zane dashboard."
-                        }
-                    elif error_code == 100:
-                        return {
-                            "status": "error",
-                            "message": "Invalid Facebook API request. This may be due to missing permissions or invalid parameters."
-                        }
-                except:
-                    pass
-
-            return {
-                "status": "error",
-                "message": f"Failed to fetch metrics from Facebook: {str(e)}"
-            }
-    
-    elif tool_name == "get_all_campaigns_list":
-        if not user_email:
-            return {
-                "status": "error",
-                "message": "Authentication required. Please reconnect Claude to your Zane account."
-            }
+            logger.warning(f"Error testing account {acc.account_name}: {str(e)}")
+            continue
+        if spend is not None:
+            logger.info(f"Found data in account {acc.account_name}: ${spend:.2f} spend")
+            account = acc
+            break
+        logger.info(f"No data found in account {acc.account_name}")
+
+    if account:
+        logger.info(f"Using account with data: {account.account_name} (ID: {account.account_id})")
+    else:
+        # If no account with data found, use the first active one
+        account = next((acc for acc in ad_accounts if acc.is_active), ad_accounts[0])
+        logger.warning(f"No accounts with data found, using account: {account.account_name}")
 
-        try:
-            user = User.get_by_email(user_email)
-            if not user:
-                return {
-                    "status": "error",
-                    "message": "User account not found. Please reconnect Claude to your Zane account."
-                }
-
-            ad_accounts = user.get_ad_accounts()
-            if not ad_accounts or len(ad_accounts) == 0:
-                return {
-                    "status": "error",
-                    "message": "No Facebook Ads account connected. Please connect your Facebook Ads account in Zane dashboard first."
-                }
-
-            # Try to find an account with data - check last 90 days
-            account = None
-            test_end_date = datetime.now()
-            test_start_date = test_end_date - timedelta(days=90)
-
-            for acc in ad_accounts:
-                try:
-                    test_client = MetaAdsClient(acc.access_token)
-                    logger.info(f"Testing account {acc.account_name} (ID: {acc.account_id}) for data...")
-
-                    test_data = test_client._make_request(f'/act_{acc.account_id}/insights', {
-                        'fields': 'spend',
-                        'time_range': f'{{"since":"{test_start_date.strftime("%Y-%m-%d")}","until":"{test_end_date.strftime("%Y-%m-%d")}"}}',
-                        'level': 'account',
-                        'limit': 1
-                    })
-
-                    if test_data.get('data') and len(test_data.get('data', [])) > 0:
-                        spend = float(test_data['data'][0].get('spend', 0))
-                        logger.info(f"Found data in account {acc.account_name}: ${spend:.2f} spend")
-                        account = acc
-                        break
-                    else:
-                        logger.info(f"No data found in account {acc.account_name}")
-                except Exception as e:
-                    logger.warning(f"Error testing account {acc.account_name}: {str(e)}")
-                    continue
-
-            if not account:
-                logger.warning(f"No accounts with data found, using first account: {ad_accounts[0].account_name}")
-                account = ad_accounts[0]
-            else:
-                logger.info(f"Using account with data: {account.account_name} (ID: {account.account_id})")
-
-            client = MetaAdsClient(account.access_token)
-
-            # Get ALL campaigns regardless of status
-            all_campaigns = client.get_all_campaigns(account.account_id)
-
-            return {
-                "total_campaigns": len(all_campaigns),
-                "campaigns": all_campaigns,
-                "message": f"Found {len(all_campaigns)} total campaigns (including paused/inactive)"
-            }
+    _account_choice_cache.set(ctx.user_email, account.account_id)
+    return account
 
-        except Exception as e:
-            logger.error(f"Error fetching all campaigns list: {str(e)}")
-            return {
-                "status": "error",
-                "message": f"Failed to fetch campaigns list: {str(e)}"
-            }
 
-    elif tool_name == "list_accounts":
-        if not user_email:
-            return {
-                "status": "error",
-                "message": "Authentication required. Please reconnect Claude to your Zane account."
+@tool_registry.use
+def _map_errors(spec, ctx, arguments, call_next):
+    """Turn exceptions into the error results Claude shows to the user"""
+    try:
+        return call_next(ctx, arguments)
+    except CursorError as e:
+        return _error(str(e))
+    except GraphCapacityError:
+        raise
+    except ToolTimeoutError as e:
+        logger.error(str(e))
+        return _error(f"{e}. Facebook is responding slowly, please try again.")
+    except Exception as e:
+        logger.error(f"Error in {spec.name}: {str(e)}")
+        error_code, error_type, error_msg = _facebook_error(e)
+        if error_code:
+            logger.error(f"Facebook API Error - Code: {error_code}, Type: {error_type}, Message: {error_msg}")
+        if error_code == 190 or "expired" in error_msg.lower():
+            return _error("Facebook access token has expired. Please reconnect your Facebook account in the Zane dashboard.")
+        if error_code == 100:
+            return _error("Invalid Facebook API request. This may be due to missing permissions or invalid parameters.")
+        if error_code:
+            return _error(f"Facebook API Error ({error_code}): {error_msg}",
+                          error_code=error_code, error_type=error_type)
+        return _error(f"{spec.options.get('error_message', 'Failed to fetch data from Facebook')}: {str(e)}")
+
+
+@tool_registry.use
+def _require_user(spec, ctx, arguments, call_next):
+    """Load the user and their ad accounts once per call"""
+    if not ctx.user_email:
+        return _error("Authentication required. Please reconnect Claude to your Zane account.")
+
+    def load():
+        user = User.get_by_email(ctx.user_email)
+        return user, (user.get_ad_accounts() if user else [])
+
+    cached = _user_cache.get(ctx.user_email)
+    if cached is None:
+        cached = load()
+        if cached[0] and cached[1]:
+            _user_cache.set(ctx.user_email, cached)
+    ctx.user, ctx.ad_accounts = cached
+
+    if not ctx.user:
+        return _error("User account not found. Please reconnect Claude to your Zane account.")
+    if not ctx.ad_accounts:
+        return _error("No Facebook Ads account connected. Please connect your Facebook Ads account in Zane dashboard first.")
+    return call_next(ctx, arguments)
+
+
+@tool_registry.use
+def _cache_results(spec, ctx, arguments, call_next):
+    """Serve repeated calls from cache for tools that opt in with cache_ttl.
+
+    Tools that also set stale_ttl get stale-while-revalidate: a stale result
+    is returned at once and refreshed in the background, and results carry
+    the time they were fetched as data_as_of. A cache_if predicate keeps
+    incomplete results (e.g. some accounts failed to load) out of the cache.
+    """
+    ttl = spec.options.get('cache_ttl')
+    if not ttl:
+        return call_next(ctx, arguments)
+    stale_ttl = spec.options.get('stale_ttl', 0)
+
+    key = (ctx.user_email, spec.name, tuple(sorted(arguments.items())))
+    result, _, state = _tool_result_cache.lookup(key)
+    if state == StaleWhileRevalidateCache.STALE and _tool_result_cache.begin_refresh(key):
+        # A fresh context: the refresh outlives this request and its trace
+        _refresh_executor.submit(contextvars.Context().run, _refresh_result,
+                                 spec, key, ctx, arguments, call_next)
+    if state is not None:
+        return dict(result, stale=True) if state == StaleWhileRevalidateCache.STALE else result
+    return _store_result(spec, key, call_next(ctx, arguments), ttl, stale_ttl)
+
+
+def _store_result(spec, key, result, ttl, stale_ttl):
+    if not isinstance(result, dict) or result.get('status') == 'error':
+        return result
+    if not spec.options.get('cache_if', bool)(result):
+        return result
+    if stale_ttl:
+        result = dict(result, data_as_of=datetime.utcnow().replace(microsecond=0).isoformat() + 'Z')
+    _tool_result_cache.set(key, result, ttl, stale_ttl)
+    return result
+
+
+def _refresh_result(spec, key, ctx, arguments, call_next):
+    """Re-run a tool for the cache; failures keep the stale entry"""
+    try:
+        with tracing.span('tool.refresh', tool=spec.name), graph_scheduler.work(ctx.user_email, BACKGROUND):
+            _store_result(spec, key, call_next(ctx, dict(arguments)),
+                          spec.options['cache_ttl'], spec.options.get('stale_ttl', 0))
+    except Exception as e:
+        logger.warning(f"Background refresh of {spec.name} failed: {e}")
+    finally:
+        _tool_result_cache.end_refresh(key)
+
+
+@tool_registry.use
+def _resolve_account(spec, ctx, arguments, call_next):
+    """Choose the ad account and build its client for tools that need one"""
+    if not spec.options.get('account'):
+        return call_next(ctx, arguments)
+
+    account_name = arguments.get('account_name')
+    ctx.account = _select_account(ctx, account_name)
+    if not ctx.account:
+        return _error(f"Account '{account_name}' not found. Available accounts: {', '.join([a.account_name for a in ctx.ad_accounts])}")
+    ctx.client = MetaAdsClient(ctx.account.access_token)
+    ctx.outputs = spec.options.get('outputs')
+    return call_next(ctx, arguments)
+
+
+@tool_registry.tool(
+    "get_meta_ads_overview",
+    "Get Meta Ads account overview and metrics for specified time period. Automatically selects account with data.",
+    {
+        "type": "object",
+        "properties": {
+            "days": DAYS_PROPERTY,
+            "account_name": {
+                "type": "string",
+                "description": "Optional: Specific account name to use (if not provided, uses account with data)"
             }
+        },
+        "required": []
+    },
+    account=True,
+    cache_ttl=SWR_FRESH_TTL,
+    stale_ttl=SWR_STALE_TTL,
+    outputs=('currency', 'spend', 'revenue', 'roas', 'impressions', 'clicks', 'conversions', 'ctr', 'cpc')
+)
+def get_meta_ads_overview(ctx, days=30, account_name=None):
+    days = min(int(days), 365)
+    account = ctx.account
+
+    # Use 60 days as default if 30 is specified, to catch older campaigns
+    actual_days = days if days != 30 else 60
+    start_date, end_date, date_range = _date_range(actual_days)
+
+    # Fetch real data from Facebook
+    overview = ctx.client.get_account_overview(account.account_id, date_range, ctx.outputs)
+
+    # Format the response with real data
+    currency = overview.get('currency', 'USD')
+    return {
+        "status": "connected",
+        "account_name": account.account_name,
+        "account_id": account.account_id,
+        "currency": currency,
+        "total_spend": portfolio.format_amount(overview.get('spend', 0), currency),
+        "total_revenue": portfolio.format_amount(overview.get('revenue', 0), currency),
+        "roas": f"{overview.get('roas', 0):.1f}x",
+        "impressions": f"{overview.get('impressions', 0):,}",
+        "clicks": f"{overview.get('clicks', 0):,}",
+        "conversions": overview.get('conversions', 0),
+        "ctr": f"{overview.get('ctr', 0):.2f}%",
+        "cpc": portfolio.format_amount(overview.get('cpc', 0), currency),
+        "period": f"Last {days} days",
+        "date_range": f"{start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"
+    }
 
-        try:
-            user = User.get_by_email(user_email)
-            if not user:
-                return {
-                    "status": "error",
-                    "message": "User account not found."
-                }
-
-            ad_accounts = user.get_ad_accounts()
-            if not ad_accounts or len(ad_accounts) == 0:
-                return {
-                    "status": "error",
-                    "message": "No Facebook Ads accounts connected."
-                }
-
-            accounts_info = []
-            for acc in ad_accounts:
-                account_info = {
-                    "name": acc.account_name,
-                    "id": acc.account_id,
-                    "is_active": acc.is_active,
-                    "has_data": False,
-                    "data_status": "unknown"
-                }
-
-                # Check if account has data
-                try:
-                    client = MetaAdsClient(acc.access_token)
-                    test_data = client._make_request(f'/act_{acc.account_id}/insights', {
-                        'fields': 'spend,impressions',
-                        'time_range': f'{{"since":"{(datetime.now() - timedelta(days=90)).strftime("%Y-%m-%d")}","until":"{datetime.now().strftime("%Y-%m-%d")}"}}',
-                        'level': 'account'
-                    })
-
-                    if test_data.get('data') and len(test_data.get('data', [])) > 0:
-                        account_info["has_data"] = True
-                        account_info["data_status"] = "Has campaign data"
-                        spend = test_data['data'][0].get('spend', 0)
-                        account_info["total_spend_90_days"] = f"${float(spend):,.2f}"
-                    else:
-                        account_info["data_status"] = "No campaign data in last 90 days"
-                except Exception as e:
-                    account_info["data_status"] = f"Error checking: {str(e)[:50]}"
-
-                accounts_info.append(account_info)
-
-            # Identify which account would be used by default
-            default_account = None
-            for acc in accounts_info:
-                if acc["has_data"]:
-                    default_account = acc["name"]
-                    break
-
-            return {
-                "total_accounts": len(accounts_info),
-                "accounts": accounts_info,
-                "default_account": default_account or "None with data",
-                "message": f"Found {len(accounts_info)} account(s). Default will use: {default_account or 'first available'}"
-            }
 
-        except Exception as e:
-            logger.error(f"Error listing accounts: {str(e)}")
-            return {
-                "status": "error",
-                "message": f"Failed to list accounts: {str(e)}"
+@tool_registry.tool(
+    "get_campaigns",
+    "Get list of Meta Ads campaigns with performance metrics for specified time period",
+    {
+        "type": "object",
+        "properties": {
+            "days": DAYS_PROPERTY,
+            "limit": {
+                "type": "number",
+                "description": "Number of campaigns to return (default: 10)"
             }
+        },
+        "required": []
+    },
+    account=True,
+    cache_ttl=SWR_FRESH_TTL,
+    stale_ttl=SWR_STALE_TTL,
+    outputs=('campaign_name', 'currency', 'spend', 'revenue', 'roas', 'status', 'impressions', 'clicks'),
+    error_message="Failed to fetch campaigns from Facebook"
+)
+def get_campaigns(ctx, days=30, limit=10):
+    days = min(int(days), 365)
+    limit = int(limit)
+
+    # Use 60 days as default if 30 is specified, to catch older campaigns
+    actual_days = days if days != 30 else 60
+    start_date, end_date, date_range = _date_range(actual_days)
+
+    # Fetch real campaign data
+    campaigns_data = ctx.client.get_campaign_roas(ctx.account.account_id, date_range, ctx.outputs)
+
+    # Format campaigns with real data, in the account's own currency
+    currency = campaigns_data[0]['currency'] if campaigns_data else 'USD'
+    campaigns = []
+    for camp in campaigns_data[:limit]:
+        campaigns.append({
+            "name": camp.get('campaign_name', 'Unknown'),
+            "spend": portfolio.format_amount(camp.get('spend', 0), currency),
+            "revenue": portfolio.format_amount(camp.get('revenue', 0), currency),
+            "roas": f"{camp.get('roas', 0):.1f}",
+            "status": camp.get('status', 'Unknown'),
+            "impressions": camp.get('impressions', 0),
+            "clicks": camp.get('clicks', 0)
+        })
 
-    else:
-        return {
-            "status": "error",
-            "message": f"Unknown tool: {tool_name}. Available tools: get_meta_ads_overview, get_campaigns, get_account_metrics, get_all_campaigns_list, list_accounts"
+    return {
+        "campaigns": campaigns,
+        "total": len(campaigns),
+        "currency": currency,
+        "period": f"Last {days} days",
+        "date_range": f"{start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"
+    }
+
+
+@tool_registry.tool(
+    "get_account_metrics",
+    "Get detailed account metrics including ROAS, CTR, and spend for specified time period",
+    {
+        "type": "object",
+        "properties": {
+            "days": DAYS_PROPERTY
+        },
+        "required": []
+    },
+    account=True,
+    cache_ttl=SWR_FRESH_TTL,
+    stale_ttl=SWR_STALE_TTL,
+    outputs=('currency', 'spend', 'revenue', 'roas', 'ctr', 'cpc', 'conversions', 'impressions', 'clicks'),
+    error_message="Failed to fetch metrics from Facebook"
+)
+def get_account_metrics(ctx, days=30):
+    _, _, date_range = _date_range(days)
+
+    # Fetch real metrics
+    metrics = ctx.client.get_account_overview(ctx.account.account_id, date_range, ctx.outputs)
+
+    # Calculate conversion rate
+    conv_rate = 0
+    if metrics.get('clicks', 0) > 0:
+        conv_rate = (metrics.get('conversions', 0) / metrics.get('clicks', 0)) * 100
+
+    currency = metrics.get('currency', 'USD')
+    return {
+        "period": f"Last {days} days",
+        "currency": currency,
+        "account_name": ctx.account.account_name,
+        "metrics": {
+            "total_spend": portfolio.format_amount(metrics.get('spend', 0), currency),
+            "total_revenue": portfolio.format_amount(metrics.get('revenue', 0), currency),
+            "overall_roas": f"{metrics.get('roas', 0):.1f}",
+            "avg_ctr": f"{metrics.get('ctr', 0):.2f}%",
+            "avg_cpc": portfolio.format_amount(metrics.get('cpc', 0), currency),
+            "conversions": metrics.get('conversions', 0),
+            "conversion_rate": f"{conv_rate:.2f}%",
+            "impressions": metrics.get('impressions', 0),
+            "clicks": metrics.get('clicks', 0)
         }
+    }
+
+
+@tool_registry.tool(
+    "get_all_campaigns_list",
+    "Get list of ALL campaigns in the account (including paused/inactive)",
+    {
+        "type": "object",
+        "properties": dict(PAGING_PROPERTIES),
+        "required": []
+    },
+    account=True,
+    cache_ttl=300,
+    json_style=serialization.COMPACT,
+    error_message="Failed to fetch campaigns list"
+)
+def get_all_campaigns_list(ctx, page_size=None, cursor=None):
+    # Get ALL campaigns regardless of status; later pages come from the cursor store
+    page = cursor_store.paginate(
+        ctx.user_email,
+        lambda: ctx.client.get_all_campaigns(ctx.account.account_id),
+        cursor=cursor,
+        page_size=page_size
+    )
+
+    result = {
+        "total_campaigns": page['total'],
+        "campaigns": page['rows'],
+        "returned": len(page['rows']),
+        "offset": page['offset'],
+        "message": f"Found {page['total']} total campaigns (including paused/inactive)"
+    }
+    if page['next_cursor']:
+        result["next_cursor"] = page['next_cursor']
+        result["message"] += ". Pass next_cursor to get the next page."
+    return result
+
+
+@tool_registry.tool(
+    "list_accounts",
+    "List all connected Facebook ad accounts and their data availability status",
+    {
+        "type": "object",
+        "properties": {},
+        "required": []
+    },
+    timeout=float(os.getenv('LIST_ACCOUNTS_TIMEOUT_SECONDS', '180')),
+    cache_ttl=120,
+    cache_if=lambda result: not any(acc["data_status"].startswith("Error checking")
+                                    for acc in result["accounts"]),
+    json_style=serialization.COMPACT,
+    error_message="Failed to list accounts"
+)
+def list_accounts(ctx):
+    _, _, probe_range = _date_range(90)
+
+    def probe(acc):
+        try:
+            client = MetaAdsClient(acc.access_token)
+            return client._make_request(f'/act_{acc.account_id}/insights', {
+                'fields': 'spend,account_currency',
+                'time_range': f'{{"since":"{probe_range["since"]}","until":"{probe_range["until"]}"}}',
+                'level': 'account'
+            }), None
+        except (ToolTimeoutError, GraphCapacityError):
+            raise
+        except Exception as e:
+            return None, e
+
+    # One spend-only query per account, run concurrently on the fan-out pool
+    probes = parallel_map(probe, ctx.ad_accounts)
+
+    accounts_info = []
+    for acc, (test_data, error) in zip(ctx.ad_accounts, probes):
+        account_info = {
+            "name": acc.account_name,
+            "id": acc.account_id,
+            "is_active": acc.is_active,
+            "has_data": False,
+            "data_status": "unknown"
+        }
+
+        if error is not None:
+            account_info["data_status"] = f"Error checking: {str(error)[:50]}"
+        elif test_data.get('data'):
+            row = test_data['data'][0]
+            account_info["has_data"] = True
+            account_info["data_status"] = "Has campaign data"
+            account_info["total_spend_90_days"] = portfolio.format_amount(
+                float(row.get('spend', 0)), row.get('account_currency', 'USD'))
+        else:
+            account_info["data_status"] = "No campaign data in last 90 days"
+
+        accounts_info.append(account_info)
+
+    # Identify which account would be used by default
+    default_account = None
+    for acc in accounts_info:
+        if acc["has_data"]:
+            default_account = acc["name"]
+            break
+
+    return {
+        "total_accounts": len(accounts_info),
+        "accounts": accounts_info,
+        "default_account": default_account or "None with data",
+        "message": f"Found {len(accounts_info)} account(s). Default will use: {default_account or 'first available'}"
+    }
+
+SERVER_INFO = {
+    "name": "Zane - Meta Ads Connector",
+    "version": "1.0.0"
+}
+
+initialize_results = InitializeResults(SERVER_INFO)
+
+# Discovery documents only depend on BASE_URL, so serialize them once
+ROOT_INFO = PrecomputedPayload({
+    "name": "Zane - Meta Ads Connector",
+    "version": "1.0.0",
+    "oauth_required": True,
+    "discovery": "/.well-known/oauth-authorization-server"
+})
+
+AUTHORIZATION_SERVER_METADATA = PrecomputedPayload({
+    "issuer": BASE_URL,
+    "authorization_endpoint": f"{BASE_URL}/oauth/authorize",
+    "token_endpoint": f"{BASE_URL}/oauth/token",
+    "registration_endpoint": f"{BASE_URL}/oauth/register",
+    "revocation_endpoint": f"{BASE_URL}/oauth/revoke",
+    "response_types_supported": ["code", "token"],
+    "grant_types_supported": ["authorization_code", "client_credentials"],
+    "code_challenge_methods_supported": ["S256", "plain"],
+    "token_endpoint_auth_methods_supported": ["none"],
+    "scopes_supported": ["mcp:read", "mcp:write"],
+    "response_modes_supported": ["query", "fragment"],
+    "revocation_endpoint_auth_methods_supported": ["none"]
+})
+
+PROTECTED_RESOURCE_METADATA = PrecomputedPayload({
+    "mcp_server": f"{BASE_URL}/mcp/sse",
+    "authorization_server": f"{BASE_URL}/.well-known/oauth-authorization-server",
+    "error": "unauthorized",
+    "error_description": "OAuth 2.0 authorization required"
+})
+
+def get_tools_list():
+    """Return the list of available tools"""
+    return tool_registry.schemas()
+
+def execute_tool(tool_name, arguments, user_email=None):
+    """Execute a tool and return results from real Facebook data"""
+    # IMPORTANT: No demo data - only real data or error messages
+    try:
+        with graph_scheduler.work(user_email, INTERACTIVE):
+            return tool_registry.dispatch(tool_name, arguments, ToolContext(user_email))
+    except UnknownToolError:
+        return _error(f"Unknown tool: {tool_name}. Available tools: {', '.join(tool_registry.names())}")
+    except ToolArgumentError as e:
+        return _error(f"Invalid arguments for {tool_name}: {e}")
 
 # Root MCP discovery endpoint for faster validation
 @oauth_mcp_fixed_bp.route('/')
 def root():
     """Root endpoint for quick availability check"""
-    response = jsonify({
-        "name": "Zane - Meta Ads Connector",
-        "version": "1.0.0",
-        "oauth_required": True,
-        "discovery": "/.well-known/oauth-authorization-server"
-    })
+    response = ROOT_INFO.to_response()
     return add_cors_headers(response)
 
 # OAuth Discovery Endpoints
 @oauth_mcp_fixed_bp.route('/.well-known/oauth-authorization-server')
 def oauth_discovery():
     """OAuth 2.0 Authorization Server Metadata"""
-    response = jsonify({
-        "issuer": BASE_URL,
-        "authorization_endpoint": f"{BASE_URL}/oauth/authorize",
-        "token_endpoint": f"{BASE_URL}/oauth/token",
-        "registration_endpoint": f"{BASE_URL}/oauth/register",
-        "revocation_endpoint": f"{BASE_URL}/oauth/revoke",
-        "response_types_supported": ["code", "token"],
-        "grant_types_supported": ["authorization_code", "client_credentials"],
-        "code_challenge_methods_supported": ["S256", "plain"],
-        "token_endpoint_auth_methods_supported": ["none"],
-        "scopes_supported": ["mcp:read", "mcp:write"],
-        "response_modes_supported": ["query", "fragment"],
-        "revocation_endpoint_auth_methods_supported": ["none"]
+    return AUTHORIZATION_SERVER_METADATA.to_response(headers={
+        'Cache-Control': 'public, max-age=3600'  # Cache for 1 hour
     })
-    response.headers['Cache-Control'] = 'public, max-age=3600'  # Cache for 1 hour
-    return response
 
 @oauth_mcp_fixed_bp.route('/.well-known/oauth-protected-resource')
 def oauth_protected_resource():
     """Tell Claude this server requires OAuth"""
     # Return a proper JSON response with the OAuth info
-    data = {
-        "mcp_server": f"{BASE_URL}/mcp/sse",
-        "authorization_server": f"{BASE_URL}/.well-known/oauth-authorization-server",
-        "error": "unauthorized",
-        "error_description": "OAuth 2.0 authorization required"
-    }
-    response = make_response(jsonify(data), 401)
-    response.headers['WWW-Authenticate'] = f'Bearer realm="{BASE_URL}", authorization_uri="{BASE_URL}/oauth/authorize", token_uri="{BASE_URL}/oauth/token"'
-    response.headers['Cache-Control'] = 'public, max-age=3600'  # Cache for 1 hour
-    response.headers['Content-Type'] = 'application/json'
-    return response
+    return PROTECTED_RESOURCE_METADATA.to_response(status=401, headers={
+        'WWW-Authenticate': f'Bearer realm="{BASE_URL}", authorization_uri="{BASE_URL}/oauth/authorize", token_uri="{BASE_URL}/oauth/token"',
+        'Cache-Control': 'public, max-age=3600'  # Cache for 1 hour
+    })
 
 # OAuth Endpoints
 @oauth_mcp_fixed_bp.route('/oauth/register', methods=['POST', 'OPTIONS'])
@@ -918,8 +840,18 @@ def oauth_revoke():
     # Always return 200 per RFC 7009
     return '', 200
 
+def traced_request(f):
+    """Run a view inside an mcp.request span, joining the caller's traceparent"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        with tracing.span('mcp.request', parent=tracing.extract(request.headers),
+                          http_method=request.method, path=request.path):
+            return f(*args, **kwargs)
+    return decorated
+
 # MCP Endpoints
 @oauth_mcp_fixed_bp.route('/', methods=['GET', 'POST', 'OPTIONS', 'HEAD'])
+@traced_request
 def root_handler():
     """Main MCP endpoint"""
     
@@ -958,7 +890,8 @@ def root_handler():
     
     # Verify token
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        with tracing.span('mcp.auth'):
+            payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
         user_id = payload.get('user_id')
         user_email = payload.get('email')  # Get email from token
     except jwt.InvalidTokenError:
@@ -974,47 +907,60 @@ def root_handler():
     method = message.get('method')
     params = message.get('params', {})
     msg_id = message.get('id')
+    g.mcp_method = method
+    tracing.current_span().set_attribute('mcp.method', method)
     
     print(f"MCP Request: method={method}, id={msg_id}")
     
     # Handle different methods
     if method == 'initialize':
-        result = {
-            "protocolVersion": params.get('protocolVersion', '2024-11-05'),
-            "capabilities": {
-                "tools": {}
-            },
-            "serverInfo": {
-                "name": "Zane - Meta Ads Connector",
-                "version": "1.0.0"
-            }
-        }
-        print(f"MCP: Initialized with protocol {result['protocolVersion']}")
-    
+        protocol_version = params.get('protocolVersion', '2024-11-05')
+        print(f"MCP: Initialized with protocol {protocol_version}")
+        return initialize_results.get(protocol_version).to_jsonrpc_response(msg_id, {
+            'Access-Control-Allow-Origin': '*'
+        })
+
     elif method == 'initialized':
         # Client notification - no response needed
         return '', 204
-    
+
     elif method == 'tools/list':
-        tools = get_tools_list()
-        result = {"tools": tools}
-        print(f"MCP: Returning {len(tools)} tools")
-    
+        print(f"MCP: Returning {len(tool_registry)} tools")
+        return tool_registry.tools_list().to_jsonrpc_response(msg_id, {
+            'Access-Control-Allow-Origin': '*'
+        })
+
     elif method == 'tools/call':
         tool_name = params.get('name')
         arguments = params.get('arguments', {})
         print(f"MCP: Executing tool {tool_name} for user {user_email}")
 
         # Pass user_email to execute_tool to fetch real data
-        tool_result = execute_tool(tool_name, arguments, user_email)
-        result = {
-            "content": [
-                {
-                    "type": "text",
-                    "text": json.dumps(tool_result, indent=2)
-                }
-            ]
-        }
+        try:
+            graph_scheduler.check_admission(user_email)
+            tool_result = execute_tool(tool_name, arguments, user_email)
+        except GraphCapacityError as e:
+            logger.warning(str(e))
+            response = jsonify({
+                "jsonrpc": "2.0",
+                "error": {
+                    "code": -32000,
+                    "message": str(e),
+                    "data": {"retry_after": e.retry_after}
+                },
+                "id": msg_id
+            })
+            response.status_code = 429
+            response.headers['Retry-After'] = str(e.retry_after)
+            response.headers['Access-Control-Allow-Origin'] = '*'
+            return response
+        spec = tool_registry.get(tool_name)
+        style = serialization.resolve_style(
+            serialization.client_style(),
+            spec.options.get('json_style') if spec else None
+        )
+        with tracing.span('mcp.serialize', style=style):
+            result = serialization.tool_result(tool_result, style)
     
     elif method == 'ping':
         result = {}
@@ -1030,18 +976,10 @@ def root_handler():
             "id": msg_id
         }), 404
     
-    # Return success response
-    response = {
-        "jsonrpc": "2.0",
-        "result": result
-    }
-    if msg_id is not None:
-        response["id"] = msg_id
-    
-    return jsonify(response), 200, {
-        'Content-Type': 'application/json',
+    # Return success response, encoded once
+    return serialization.jsonrpc_response(result, msg_id, {
         'Access-Control-Allow-Origin': '*'
-    }
+    })
 
 @oauth_mcp_fixed_bp.route('/rpc', methods=['POST', 'OPTIONS'])
 def rpc_handler():
@@ -0,0 +1,204 @@
+"""
+Budget pacing for campaigns
+Budgets (campaign or ad set, daily or lifetime, with flight dates) change
+rarely and are cached per account; daily spend is fetched on every call. On
+a cold cache both come back in a single Graph batch request.
+"""
+
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from app.tool_registry import TTLCache
+
+logger = logging.getLogger(__name__)
+
+BUDGET_CACHE_TTL = float(os.getenv('BUDGET_CACHE_TTL', '900'))
+UNDER_PACING = float(os.getenv('PACING_UNDER_THRESHOLD', '0.85'))
+OVER_PACING = float(os.getenv('PACING_OVER_THRESHOLD', '1.15'))
+RUN_RATE_DAYS = int(os.getenv('PACING_RUN_RATE_DAYS', '3'))
+
+# Graph returns budgets in the currency's minor unit (cents for USD/EUR/GBP)
+BUDGET_MINOR_UNITS = 100
+
+CAMPAIGN_FIELDS = 'id,name,effective_status,daily_budget,lifetime_budget,budget_remaining,start_time,stop_time'
+ADSET_FIELDS = 'id,campaign_id,effective_status,daily_budget,lifetime_budget,budget_remaining,start_time,end_time'
+
+_budget_cache = TTLCache(ttl=BUDGET_CACHE_TTL, max_entries=256)
+
+
+def _spend_call(account_id: str, date_range: Dict) -> tuple:
+    return f'/act_{account_id}/insights', {
+        'fields': 'campaign_id,spend',
+        'level': 'campaign',
+        'time_increment': 1,
+        'time_range': f'{{"since":"{date_range["since"]}","until":"{date_range["until"]}"}}',
+        'limit': 500
+    }
+
+
+def fetch(client, account_id: str, date_range: Dict) -> tuple:
+    """Return (budgets, daily spend rows); budgets come from cache when possible"""
+    spend_endpoint, spend_params = _spend_call(account_id, date_range)
+    budgets = _budget_cache.get(account_id)
+    if budgets is not None:
+        return budgets, list(client._iter_pages(spend_endpoint, spend_params))
+
+    calls = [
+        (f'/act_{account_id}/campaigns', {'fields': CAMPAIGN_FIELDS, 'limit': 500}),
+        (f'/act_{account_id}/adsets', {'fields': ADSET_FIELDS, 'limit': 500}),
+        (spend_endpoint, spend_params)
+    ]
+    pages = client._batch(calls)
+    campaigns, adsets, spend_rows = [list(client._iter_pages(endpoint, params, page))
+                                     for (endpoint, params), page in zip(calls, pages)]
+    budgets = {'campaigns': campaigns, 'adsets': adsets}
+    _budget_cache.set(account_id, budgets)
+    return budgets, spend_rows
+
+
+def _money(value) -> float:
+    return float(value) / BUDGET_MINOR_UNITS if value not in (None, '') else 0.0
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+    except ValueError:
+        return None
+
+
+def _campaign_budget(campaign: Dict, adsets: List[Dict]) -> Dict:
+    """Budget owner, type, amounts and flight for one campaign (CBO or summed ad set budgets)"""
+    if campaign.get('daily_budget') or campaign.get('lifetime_budget'):
+        owners, level = [campaign], 'campaign'
+    else:
+        owners = [a for a in adsets if a.get('effective_status') == 'ACTIVE'] or adsets
+        level = 'adset'
+    daily = sum(_money(o.get('daily_budget')) for o in owners)
+    lifetime = sum(_money(o.get('lifetime_budget')) for o in owners)
+    # None unless every lifetime owner reports budget_remaining; 0 is a fully spent budget
+    lifetime_owners = [o for o in owners if o.get('lifetime_budget')]
+    remaining = (sum(_money(o['budget_remaining']) for o in lifetime_owners)
+                 if lifetime_owners and all(o.get('budget_remaining') not in (None, '') for o in lifetime_owners)
+                 else None)
+    starts = [t for t in (_parse_time(o.get('start_time')) for o in owners) if t]
+    ends = [t for t in (_parse_time(o.get('stop_time') or o.get('end_time')) for o in owners) if t]
+    return {
+        'level': level,
+        'daily': daily,
+        'lifetime': lifetime,
+        'remaining': remaining,
+        'start': min(starts) if starts else None,
+        'end': max(ends) if ends and len(ends) == len(owners) else None
+    }
+
+
+def _status(ratio: Optional[float]) -> str:
+    if ratio is None:
+        return 'unknown'
+    if ratio < UNDER_PACING:
+        return 'under'
+    if ratio > OVER_PACING:
+        return 'over'
+    return 'on_track'
+
+
+def compute_pacing(budgets: Dict, spend_rows: List[Dict], date_range: Dict,
+                   today: Optional[date] = None) -> List[Dict]:
+    """Spend to date, expected spend, projected end-of-period spend and pacing per campaign"""
+    today = today or date.today()
+    since = datetime.strptime(date_range['since'], '%Y-%m-%d').date()
+    until = datetime.strptime(date_range['until'], '%Y-%m-%d').date()
+    period_days = (until - since).days + 1
+    elapsed_end = min(until, today)
+    elapsed_days = max(0, (elapsed_end - since).days + 1)
+    remaining_days = period_days - elapsed_days
+    run_rate_start = (elapsed_end - timedelta(days=RUN_RATE_DAYS - 1)).isoformat()
+
+    # One pass over the daily rows: total and recent spend per campaign
+    spent: Dict[str, float] = {}
+    recent: Dict[str, float] = {}
+    for row in spend_rows:
+        campaign_id = row.get('campaign_id')
+        spend = float(row.get('spend', 0))
+        spent[campaign_id] = spent.get(campaign_id, 0.0) + spend
+        if (row.get('date_start') or '') >= run_rate_start:
+            recent[campaign_id] = recent.get(campaign_id, 0.0) + spend
+
+    adsets_by_campaign: Dict[str, List[Dict]] = {}
+    for adset in budgets['adsets']:
+        adsets_by_campaign.setdefault(adset.get('campaign_id'), []).append(adset)
+
+    now = datetime.combine(today, datetime.min.time())
+    results = []
+    for campaign in budgets['campaigns']:
+        campaign_id = campaign.get('id')
+        spend = spent.get(campaign_id, 0.0)
+        run_rate = recent.get(campaign_id, 0.0) / min(RUN_RATE_DAYS, elapsed_days) if elapsed_days else 0.0
+        budget = _campaign_budget(campaign, adsets_by_campaign.get(campaign_id, []))
+        row = {
+            'campaign_id': campaign_id,
+            'campaign_name': campaign.get('name', 'Unknown'),
+            'effective_status': campaign.get('effective_status'),
+            'budget_level': budget['level'],
+            'spend': round(spend, 2),
+            'daily_run_rate': round(run_rate, 2)
+        }
+
+        if budget['daily']:
+            expected = budget['daily'] * elapsed_days
+            row.update({
+                'budget_type': 'daily',
+                'daily_budget': round(budget['daily'], 2),
+                'budget_target': round(budget['daily'] * period_days, 2),
+                'expected_spend': round(expected, 2),
+                'projected_spend': round(spend + run_rate * remaining_days, 2),
+                'pacing_ratio': round(spend / expected, 2) if expected else None
+            })
+        elif budget['lifetime'] and budget['start'] and budget['end'] and budget['end'] > budget['start']:
+            flight = (budget['end'] - budget['start']).total_seconds()
+            elapsed = min(max((now - budget['start']).total_seconds(), 0), flight)
+            lifetime_spent = budget['lifetime'] - budget['remaining'] if budget['remaining'] is not None else spend
+            expected = budget['lifetime'] * elapsed / flight
+            remaining_flight_days = max(0.0, (budget['end'] - now).total_seconds() / 86400)
+            row.update({
+                'budget_type': 'lifetime',
+                'lifetime_budget': round(budget['lifetime'], 2),
+                'budget_target': round(budget['lifetime'], 2),
+                'lifetime_spend': round(lifetime_spent, 2),
+                'expected_spend': round(expected, 2),
+                'projected_spend': round(lifetime_spent + run_rate * remaining_flight_days, 2),
+                'pacing_ratio': round(lifetime_spent / expected, 2) if expected else None
+            })
+        else:
+            row.update({'budget_type': None, 'pacing_ratio': None})
+
+        if campaign.get('effective_status') != 'ACTIVE':
+            row['pacing'] = 'inactive'
+        elif row['budget_type'] is None:
+            row['pacing'] = 'no_budget'
+        else:
+            row['pacing'] = _status(row['pacing_ratio'])
+        results.append(row)
+    return results
+
+
+def budget_pacing(client, account_id: str, date_range: Dict) -> Dict:
+    """Pacing report for every campaign in an account"""
+    budgets, spend_rows = fetch(client, account_id, date_range)
+    campaigns = compute_pacing(budgets, spend_rows, date_range)
+    campaigns.sort(key=lambda row: row['spend'], reverse=True)
+
+    summary: Dict[str, int] = {}
+    for row in campaigns:
+        summary[row['pacing']] = summary.get(row['pacing'], 0) + 1
+    return {
+        'campaigns': campaigns,
+        'pacing_summary': summary,
+        # From the spend rows, so campaigns the campaigns edge no longer lists still count
+        'total_spend': round(sum(float(row.get('spend', 0)) for row in spend_rows), 2)
+    }
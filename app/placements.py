@@ -0,0 +1,197 @@
+"""
+Placement cube
+Placement insights are fetched per day at the finest breakdown
+(publisher_platform x platform_position x device_platform) and cached as
+one partition per account and day. Extending or shifting a date range only
+fetches the days not stored yet; recent days are re-fetched once they go
+stale because attribution still moves. Results are aggregated by streaming
+the partitions through PlacementAggregator, whose memory grows with the
+number of placements, not days or rows.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app import actions
+from app.trends import REFRESH_DAYS
+
+logger = logging.getLogger(__name__)
+
+PARTITION_TTL = float(os.getenv('PLACEMENT_RECENT_TTL', '900'))
+MAX_ACCOUNTS = int(os.getenv('PLACEMENT_CACHE_ACCOUNTS', '64'))
+MAX_DAYS = int(os.getenv('PLACEMENT_CACHE_DAYS', '400'))
+
+BREAKDOWNS = ('publisher_platform', 'platform_position', 'device_platform')
+MEASURES = ('spend', 'revenue', 'impressions', 'clicks', 'conversions')
+
+# group_by -> positions in the (platform, placement, device) key and their output names
+GROUPINGS = {
+    'placement': ((0, 1), ('platform', 'placement')),
+    'device': ((2,), ('device',)),
+    'placement_device': ((0, 1, 2), ('platform', 'placement', 'device'))
+}
+
+
+def _day(value: str) -> date:
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class _AccountPartitions:
+    __slots__ = ('days', 'lock')
+
+    def __init__(self):
+        # day -> (fetched_at, {(platform, placement, device): measures})
+        self.days: 'OrderedDict[date, tuple]' = OrderedDict()
+        self.lock = threading.Lock()
+
+
+class PlacementStore:
+    """Per-account, per-day placement x device partitions"""
+
+    def __init__(self, max_accounts: int = MAX_ACCOUNTS, max_days: int = MAX_DAYS):
+        self.max_accounts = max_accounts
+        self.max_days = max_days
+        self._accounts: 'OrderedDict[str, _AccountPartitions]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, account_id: str) -> _AccountPartitions:
+        with self._lock:
+            entry = self._accounts.get(account_id)
+            if entry is None:
+                entry = self._accounts[account_id] = _AccountPartitions()
+                while len(self._accounts) > self.max_accounts:
+                    self._accounts.popitem(last=False)
+            self._accounts.move_to_end(account_id)
+            return entry
+
+    def partitions(self, client, account_id: str, since: date, until: date,
+                   today: Optional[date] = None) -> List[Dict]:
+        """The day partitions for [since, until], fetching missing or stale days in contiguous runs"""
+        today = today or date.today()
+        stop = min(until, today)
+        entry = self._entry(account_id)
+        with entry.lock:
+            now = time.monotonic()
+            recent = today - timedelta(days=REFRESH_DAYS - 1)
+            due = []
+            day = since
+            while day <= stop:
+                stored = entry.days.get(day)
+                if stored is None or (day >= recent and now - stored[0] >= PARTITION_TTL):
+                    due.append(day)
+                day += timedelta(days=1)
+            for first, last in _runs(due):
+                self._fetch(client, account_id, entry, first, last)
+
+            result = []
+            for offset in range((stop - since).days + 1):
+                day = since + timedelta(days=offset)
+                entry.days.move_to_end(day)
+                result.append(entry.days[day][1])
+            while len(entry.days) > self.max_days:
+                entry.days.popitem(last=False)
+        return result
+
+    @staticmethod
+    def _fetch(client, account_id: str, entry: _AccountPartitions, since: date, until: date) -> None:
+        params = {
+            'fields': 'spend,impressions,clicks,actions,action_values,date_start',
+            'time_range': f'{{"since":"{since.isoformat()}","until":"{until.isoformat()}"}}',
+            'time_increment': '1',
+            'level': 'account',
+            'breakdowns': ','.join(BREAKDOWNS),
+            'action_breakdowns': 'action_type',
+            'limit': 500
+        }
+        classifier = actions.classifier_for(account_id)
+        fetched_at = time.monotonic()
+        days = {since + timedelta(days=n): {} for n in range((until - since).days + 1)}
+        rows = 0
+        for row in client._iter_pages(f'/act_{account_id}/insights', params):
+            partition = days.get(_day(row['date_start']))
+            if partition is None:
+                continue
+            platform = row.get('publisher_platform', 'unknown')
+            key = (platform, row.get('platform_position', platform), row.get('device_platform', 'unknown'))
+            revenue, conversions = classifier.classify(row)
+            measures = (float(row.get('spend', 0)), revenue, float(row.get('impressions', 0)),
+                        float(row.get('clicks', 0)), float(conversions))
+            previous = partition.get(key)
+            partition[key] = measures if previous is None else tuple(map(sum, zip(previous, measures)))
+            rows += 1
+        for day, partition in days.items():
+            entry.days[day] = (fetched_at, partition)
+        logger.info(f"Placement partitions for {account_id}: fetched {since} to {until}, {rows} rows")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._accounts.clear()
+
+
+def _runs(days: List[date]) -> Iterable[Tuple[date, date]]:
+    """Collapse sorted days into (first, last) runs of consecutive days"""
+    first = last = None
+    for day in days:
+        if last is not None and day == last + timedelta(days=1):
+            last = day
+            continue
+        if first is not None:
+            yield first, last
+        first = last = day
+    if first is not None:
+        yield first, last
+
+
+placement_store = PlacementStore()
+
+
+class PlacementAggregator:
+    """Streaming sum of partitions grouped by placement, device or both"""
+
+    def __init__(self, group_by: str = 'placement'):
+        if group_by not in GROUPINGS:
+            raise ValueError(f"group_by must be one of: {', '.join(GROUPINGS)}")
+        self.positions, self.names = GROUPINGS[group_by]
+        self.totals: Dict[tuple, List[float]] = {}
+
+    def add(self, partition: Dict[tuple, tuple]) -> None:
+        for key, measures in partition.items():
+            group = tuple(key[p] for p in self.positions)
+            sums = self.totals.get(group)
+            if sums is None:
+                sums = self.totals[group] = [0.0] * len(MEASURES)
+            for i, value in enumerate(measures):
+                sums[i] += value
+
+    def results(self, roas) -> List[Dict]:
+        rows = []
+        for group, (spend, revenue, impressions, clicks, conversions) in self.totals.items():
+            row = dict(zip(self.names, group))
+            row.update({
+                'spend': round(spend, 2),
+                'revenue': round(revenue, 2),
+                'impressions': int(impressions),
+                'clicks': int(clicks),
+                'conversions': int(conversions),
+                'roas': roas(spend, revenue),
+                'ctr': round(clicks / impressions * 100, 2) if impressions else 0,
+                'cpm': round(spend / impressions * 1000, 2) if impressions else 0
+            })
+            rows.append(row)
+        return sorted(rows, key=lambda x: x['spend'], reverse=True)
+
+
+def placement_performance(client, account_id: str, date_range: Dict, group_by: str = 'placement',
+                          today: Optional[date] = None) -> List[Dict]:
+    """Performance per placement (and/or device) from the cached day partitions"""
+    aggregator = PlacementAggregator(group_by)
+    since = _day(date_range['since'])
+    until = _day(date_range['until'])
+    for partition in placement_store.partitions(client, account_id, since, until, today):
+        aggregator.add(partition)
+    return aggregator.results(client._calculate_roas)
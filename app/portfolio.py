@@ -0,0 +1,235 @@
+"""
+Portfolio analytics
+Cross-account views for agencies: spend share, blended ROAS and the top
+campaigns across every connected ad account. Each account is loaded with
+one campaign-level insights query on the fan-out pool and kept as a cached
+partial aggregate; a refresh waits at most PORTFOLIO_ACCOUNT_TIMEOUT for an
+account, serving its stale partial (or listing it as pending) otherwise.
+Amounts are converted to PORTFOLIO_CURRENCY with the FX_RATES table, and
+the per-account campaign lists are k-way merged for the global top k.
+"""
+
+import heapq
+import logging
+import os
+import time
+from concurrent.futures import wait
+from itertools import islice
+from typing import Dict, List, Optional
+
+from app import actions
+from app.meta_client import fanout_submit
+from app.tool_registry import StaleWhileRevalidateCache, without_deadline
+
+logger = logging.getLogger(__name__)
+
+REPORTING_CURRENCY = os.getenv('PORTFOLIO_CURRENCY', 'USD').upper()
+PARTIAL_TTL = float(os.getenv('PORTFOLIO_CACHE_TTL', '300'))
+PARTIAL_STALE_TTL = float(os.getenv('PORTFOLIO_STALE_TTL', '3600'))
+ACCOUNT_TIMEOUT = float(os.getenv('PORTFOLIO_ACCOUNT_TIMEOUT', '20'))
+
+SORT_METRICS = ('roas', 'spend', 'revenue', 'conversions')
+# Metrics that compare across currencies without conversion
+CURRENCY_FREE = frozenset(['roas', 'conversions'])
+
+CAMPAIGN_FIELDS = 'account_name,account_currency,campaign_id,campaign_name,spend,impressions,clicks,actions,action_values'
+
+
+def _fx_rates_from_env() -> Dict[str, float]:
+    """FX_RATES=EUR:1.08,GBP:1.27 - value of one unit in PORTFOLIO_CURRENCY"""
+    rates = {REPORTING_CURRENCY: 1.0}
+    for item in os.getenv('FX_RATES', '').split(','):
+        currency, _, rate = item.strip().partition(':')
+        if currency and rate:
+            rates[currency.upper()] = float(rate)
+    return rates
+
+
+FX_RATES = _fx_rates_from_env()
+
+_partials = StaleWhileRevalidateCache(max_entries=int(os.getenv('PORTFOLIO_CACHE_ENTRIES', '1024')))
+
+
+class AccountPartial:
+    """One account's totals and campaign rows, in the reporting currency where a rate is known"""
+
+    __slots__ = ('account_id', 'account_name', 'currency', 'rate', 'totals', 'campaigns', 'fetched_at', '_sorted')
+
+    def __init__(self, account_id: str, account_name: Optional[str], currency: str, rate: Optional[float]):
+        self.account_id = account_id
+        self.account_name = account_name
+        self.currency = currency
+        self.rate = rate
+        self.totals = {'spend': 0.0, 'revenue': 0.0, 'impressions': 0, 'clicks': 0, 'conversions': 0}
+        self.campaigns: List[Dict] = []
+        self.fetched_at = time.time()
+        self._sorted: Dict[str, List[Dict]] = {}
+
+    def sorted_by(self, metric: str) -> List[Dict]:
+        """Campaigns in descending metric order, sorted once per metric"""
+        rows = self._sorted.get(metric)
+        if rows is None:
+            rows = self._sorted[metric] = sorted(self.campaigns, key=lambda row: row[metric], reverse=True)
+        return rows
+
+
+def format_amount(amount: float, currency: str) -> str:
+    return f"${amount:,.2f}" if currency == 'USD' else f"{amount:,.2f} {currency}"
+
+
+def _roas(spend: float, revenue: float) -> float:
+    return round(revenue / spend, 2) if spend else 0
+
+
+def load_partial(client, account_id: str, date_range: Dict) -> AccountPartial:
+    """Fetch one account's campaign-level insights and fold them into a partial"""
+    params = {
+        'fields': CAMPAIGN_FIELDS,
+        'time_range': f'{{"since":"{date_range["since"]}","until":"{date_range["until"]}"}}',
+        'level': 'campaign',
+        'action_breakdowns': 'action_type',
+        'limit': 500
+    }
+    classifier = actions.classifier_for(account_id)
+    partial = None
+    for row in client._iter_pages(f'/act_{account_id}/insights', params):
+        if partial is None:
+            currency = (row.get('account_currency') or REPORTING_CURRENCY).upper()
+            partial = AccountPartial(account_id, row.get('account_name'), currency, FX_RATES.get(currency))
+        revenue, conversions = classifier.classify(row)
+        rate = partial.rate or 1.0
+        campaign = {
+            'account_id': account_id,
+            'account_name': row.get('account_name'),
+            'campaign_id': row.get('campaign_id'),
+            'campaign_name': row.get('campaign_name', 'Unknown'),
+            'currency': REPORTING_CURRENCY if partial.rate else partial.currency,
+            'spend': round(float(row.get('spend', 0)) * rate, 2),
+            'revenue': round(revenue * rate, 2),
+            'impressions': int(row.get('impressions', 0)),
+            'clicks': int(row.get('clicks', 0)),
+            'conversions': conversions
+        }
+        campaign['roas'] = _roas(campaign['spend'], campaign['revenue'])
+        partial.campaigns.append(campaign)
+        for key in partial.totals:
+            partial.totals[key] += campaign[key]
+    return partial or AccountPartial(account_id, None, REPORTING_CURRENCY, 1.0)
+
+
+def _load(client, account_id: str, date_range: Dict, key: tuple) -> AccountPartial:
+    try:
+        partial = load_partial(client, account_id, date_range)
+        _partials.set(key, partial, PARTIAL_TTL, PARTIAL_STALE_TTL)
+        return partial
+    except Exception as e:
+        logger.warning(f"Portfolio load for account {account_id} failed: {e}")
+        raise
+    finally:
+        _partials.end_refresh(key)
+
+
+def account_partials(clients: Dict, date_range: Dict) -> Dict:
+    """Partials for every account: fresh or stale from cache, fetched concurrently on a miss.
+
+    Returns {'partials': {account_id: (partial, stale)}, 'pending': [...], 'failed': [...]}.
+    """
+    partials = {}
+    futures = {}
+    pending = []
+    for account_id, client in clients.items():
+        key = (account_id, date_range['since'], date_range['until'])
+        partial, _, state = _partials.lookup(key)
+        if state is not None:
+            partials[account_id] = (partial, state == StaleWhileRevalidateCache.STALE)
+        if state == StaleWhileRevalidateCache.FRESH:
+            continue
+        if _partials.begin_refresh(key):
+            # Loads outlive the request, so they run without the tool's deadline
+            future = fanout_submit(without_deadline().run, _load, client, account_id, date_range, key)
+            if state is None:
+                futures[future] = account_id
+        elif state is None:
+            pending.append(account_id)  # another request is already loading it
+
+    done, _ = wait(futures, timeout=ACCOUNT_TIMEOUT) if futures else (set(), set())
+    failed = []
+    for future in done:
+        account_id = futures[future]
+        try:
+            partials[account_id] = (future.result(), False)
+        except Exception as e:
+            failed.append({'account_id': account_id, 'error': str(e)[:200]})
+    # Slow accounts keep loading in the background and land in the cache for the next call
+    pending.extend(account_id for future, account_id in futures.items() if future not in done)
+    return {'partials': partials, 'pending': pending, 'failed': failed}
+
+
+def portfolio_summary(clients: Dict, date_range: Dict, top_k: int = 10, sort_by: str = 'roas',
+                      names: Optional[Dict[str, str]] = None) -> Dict:
+    """Per-account spend share, blended totals and the global top campaigns"""
+    if sort_by not in SORT_METRICS:
+        raise ValueError(f"sort_by must be one of: {', '.join(SORT_METRICS)}")
+    names = names or {}
+    loaded = account_partials(clients, date_range)
+
+    accounts = []
+    unconverted = set()
+    total_spend = total_revenue = 0.0
+    for account_id, (partial, stale) in loaded['partials'].items():
+        totals = partial.totals
+        converted = partial.rate is not None
+        if converted:
+            total_spend += totals['spend']
+            total_revenue += totals['revenue']
+        else:
+            unconverted.add(partial.currency)
+        impressions, clicks = totals['impressions'], totals['clicks']
+        account = {
+            'account_id': account_id,
+            'account_name': partial.account_name or names.get(account_id, 'Unknown'),
+            'currency': REPORTING_CURRENCY if converted else partial.currency,
+            'spend': round(totals['spend'], 2),
+            'revenue': round(totals['revenue'], 2),
+            'roas': _roas(totals['spend'], totals['revenue']),
+            'impressions': impressions,
+            'clicks': clicks,
+            'conversions': totals['conversions'],
+            'ctr': round(clicks / impressions * 100, 2) if impressions else 0,
+            'cpc': round(totals['spend'] / clicks, 2) if clicks else 0,
+            'campaigns': len(partial.campaigns)
+        }
+        if stale:
+            account['stale'] = True
+        accounts.append(account)
+
+    for account in accounts:
+        if account['currency'] == REPORTING_CURRENCY and total_spend:
+            account['spend_share_pct'] = round(account['spend'] / total_spend * 100, 2)
+    accounts.sort(key=lambda account: account['spend'] if account['currency'] == REPORTING_CURRENCY else -1,
+                  reverse=True)
+
+    # Per-account lists are already sorted, so a k-way merge yields the global top k
+    streams = [partial.sorted_by(sort_by) for partial, _ in loaded['partials'].values()
+               if sort_by in CURRENCY_FREE or partial.rate is not None]
+    top_campaigns = list(islice(heapq.merge(*streams, key=lambda row: row[sort_by], reverse=True), top_k))
+
+    summary = {
+        'date_range': date_range,
+        'currency': REPORTING_CURRENCY,
+        'accounts': accounts,
+        'total_spend': round(total_spend, 2),
+        'total_revenue': round(total_revenue, 2),
+        'overall_roas': _roas(total_spend, total_revenue),
+        'top_campaigns_by': sort_by,
+        'top_campaigns': top_campaigns
+    }
+    if loaded['pending']:
+        summary['pending_accounts'] = loaded['pending']
+        summary['message'] = (f"{len(loaded['pending'])} account(s) are still loading and are left out; "
+                              f"call again shortly to include them")
+    if loaded['failed']:
+        summary['failed_accounts'] = loaded['failed']
+    if unconverted:
+        summary['unconverted_currencies'] = sorted(unconverted)
+    return summary
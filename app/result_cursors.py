@@ -0,0 +1,188 @@
+"""
+Server-side cursors for large MCP tool results
+A tool returns its first page plus an opaque next_cursor; follow-up calls
+page through the materialized rows instead of re-querying Facebook.
+"""
+
+import base64
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app import serialization
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class CursorError(ValueError):
+    """Raised for cursors that are malformed, expired or owned by another user"""
+
+
+class _MemoryBackend:
+    """Process-local storage; cursors only resolve on the worker that made them"""
+
+    def __init__(self, max_sets: int):
+        self.max_sets = max_sets
+        self._sets: Dict[str, Tuple[float, str, List]] = {}
+        self._lock = threading.Lock()
+
+    def put(self, set_id: str, owner: str, rows: List, ttl: float) -> None:
+        with self._lock:
+            now = time.monotonic()
+            for key in [k for k, (expires_at, _, _) in self._sets.items() if expires_at < now]:
+                del self._sets[key]
+            if len(self._sets) >= self.max_sets:
+                # Drop the oldest result sets first
+                for key in list(self._sets)[:max(1, self.max_sets // 10)]:
+                    del self._sets[key]
+            self._sets[set_id] = (now + ttl, owner, rows)
+
+    def get(self, set_id: str) -> Optional[Tuple[str, List]]:
+        with self._lock:
+            entry = self._sets.get(set_id)
+            if entry is None:
+                return None
+            expires_at, owner, rows = entry
+            if expires_at < time.monotonic():
+                del self._sets[set_id]
+                return None
+            return owner, rows
+
+
+class _RedisBackend:
+    """Shared storage so any gunicorn worker can resolve a cursor.
+
+    Connects lazily, so a Redis outage at startup does not pin the worker
+    to process-local cursors for its lifetime.
+    """
+
+    def __init__(self, url: str):
+        import redis
+        self._redis = redis.Redis.from_url(url, socket_timeout=2)
+
+    def put(self, set_id: str, owner: str, rows: List, ttl: float) -> None:
+        payload = serialization.dumps_bytes({'owner': owner, 'rows': rows})
+        self._redis.setex(f'mcp:cursor:{set_id}', int(ttl), payload)
+
+    def get(self, set_id: str) -> Optional[Tuple[str, List]]:
+        payload = self._redis.get(f'mcp:cursor:{set_id}')
+        if payload is None:
+            return None
+        data = json.loads(payload)
+        return data['owner'], data['rows']
+
+
+class ResultCursorStore:
+    """Materialized result sets addressed by opaque, owner-scoped cursors"""
+
+    def __init__(self, ttl: float = 900, max_sets: int = 256, redis_url: Optional[str] = None,
+                 backend: Optional[str] = None):
+        self.ttl = ttl
+        # Redis whenever it is configured; memory only works with a single worker
+        backend = (backend or ('redis' if redis_url else 'memory')).lower()
+        self._backend = _MemoryBackend(max_sets)
+        if backend == 'redis':
+            if not redis_url:
+                logger.warning("RESULT_CURSOR_BACKEND=redis but REDIS_URL is not set; using memory")
+            else:
+                try:
+                    self._backend = _RedisBackend(redis_url)
+                except ImportError:
+                    logger.warning("redis package not installed; result cursors use memory and "
+                                   "only resolve on the worker that made them")
+
+    @staticmethod
+    def _encode(set_id: str, offset: int) -> str:
+        raw = f'{set_id}:{offset}'.encode('ascii')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def _decode(cursor: str) -> Tuple[str, int]:
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            set_id, offset = base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii').rsplit(':', 1)
+            return set_id, int(offset)
+        except (ValueError, UnicodeError):
+            raise CursorError('Invalid cursor')
+
+    @staticmethod
+    def clamp_page_size(page_size: Optional[int]) -> int:
+        if not page_size or page_size < 1:
+            return DEFAULT_PAGE_SIZE
+        return min(int(page_size), MAX_PAGE_SIZE)
+
+    def open(self, owner: str, rows: List, page_size: Optional[int] = None) -> Dict:
+        """Return the first page; rows beyond it are stored behind next_cursor"""
+        page_size = self.clamp_page_size(page_size)
+        next_cursor = None
+        if len(rows) > page_size:
+            set_id = secrets.token_urlsafe(12)
+            try:
+                self._backend.put(set_id, owner, rows, self.ttl)
+                next_cursor = self._encode(set_id, page_size)
+            except Exception as e:
+                # Without somewhere to keep the rest, answer unpaged rather than drop rows
+                logger.warning(f"Could not store result cursor, returning all {len(rows)} rows: {e}")
+                page_size = len(rows)
+        return {
+            'rows': rows[:page_size],
+            'total': len(rows),
+            'offset': 0,
+            'next_cursor': next_cursor
+        }
+
+    def page(self, owner: str, cursor: str, page_size: Optional[int] = None) -> Dict:
+        """Return the page a cursor points at"""
+        page_size = self.clamp_page_size(page_size)
+        set_id, offset = self._decode(cursor)
+        try:
+            entry = self._backend.get(set_id)
+        except Exception as e:
+            logger.warning(f"Could not read result cursor: {e}")
+            raise CursorError('Cursor storage unavailable. Call the tool again without a cursor.')
+        if entry is None:
+            raise CursorError('Cursor expired. Call the tool again without a cursor to refresh the results.')
+        stored_owner, rows = entry
+        if stored_owner != owner:
+            raise CursorError('Invalid cursor')
+
+        end = offset + page_size
+        return {
+            'rows': rows[offset:end],
+            'total': len(rows),
+            'offset': offset,
+            'next_cursor': self._encode(set_id, end) if end < len(rows) else None
+        }
+
+    def paginate(self, owner: str, load_rows: Callable[[], List], cursor: Optional[str] = None,
+                 page_size: Optional[int] = None) -> Dict:
+        """Serve a cursor page, or materialize rows with load_rows and open a new set"""
+        if cursor:
+            return self.page(owner, cursor, page_size)
+        return self.open(owner, load_rows(), page_size)
+
+
+# Shared by all MCP entry points in this process
+cursor_store = ResultCursorStore(
+    ttl=float(os.getenv('RESULT_CURSOR_TTL', '900')),
+    redis_url=os.getenv('REDIS_URL'),
+    backend=os.getenv('RESULT_CURSOR_BACKEND') or None
+)
+
+PAGING_PROPERTIES = {
+    'page_size': {
+        'type': 'number',
+        'description': f'Rows per page (default: {DEFAULT_PAGE_SIZE}, max: {MAX_PAGE_SIZE})'
+    },
+    'cursor': {
+        'type': 'string',
+        'description': 'next_cursor from a previous call, to fetch the following page of the same results'
+    }
+}
@@ -2,10 +2,11 @@
 Flask routes for web interface and API endpoints
 """
 
-from flask import Blueprint, render_template, request, Response, jsonify, redirect, url_for, session, current_app
+from flask import Blueprint, render_template, request, Response, jsonify, redirect, url_for, session, current_app, g
 from flask_login import login_user, logout_user, login_required, current_user
 from app.models import User, AdAccount, MCPSession
 from app.mcp_protocol import MCPHandler
+from app import metrics, serialization
 import json
 import uuid
 import jwt
@@ -21,6 +22,7 @@ logger = logging.getLogger(__name__)
 main_bp = Blueprint('main', __name__)
 auth_bp = Blueprint('auth', __name__)
 mcp_bp = Blueprint('mcp', __name__)
+metrics.track_mcp_requests(mcp_bp)
 
 # Secret key for JWT tokens
 JWT_SECRET = os.getenv('JWT_SECRET', 'your-jwt-secret-key')
@@ -361,7 +363,7 @@ def delete_account(account_id):
     try:
         from app.supabase_client import SupabaseClient
         client = SupabaseClient.get_client(use_service_role=True)
-        client.table('ad_accounts').delete().eq('id', account_id).execute()
+        SupabaseClient.execute('ad_accounts.delete', client.table('ad_accounts').delete().eq('id', account_id))
         return jsonify({'success': True})
     except Exception as e:
         logger.error(f"Error deleting account: {e}")
@@ -404,7 +406,8 @@ def revoke_facebook_permissions():
         # Delete all ad accounts from Supabase
         from app.supabase_client import SupabaseClient
         client = SupabaseClient.get_client(use_service_role=True)
-        client.table('ad_accounts').delete().eq('user_email', current_user.email).execute()
+        SupabaseClient.execute('ad_accounts.delete',
+                               client.table('ad_accounts').delete().eq('user_email', current_user.email))
 
         message = f"Disconnected {revoked_count} account(s) from Facebook."
         if failed_revokes:
@@ -601,11 +604,12 @@ def mcp_rpc():
             return jsonify({'error': 'Invalid user'}), 401
         
         # Handle MCP message
-        handler = MCPHandler(user)
+        handler = MCPHandler(user, json_style=serialization.client_style())
         message = request.get_json()
+        g.mcp_method = message.get('method') if isinstance(message, dict) else None
         response = handler.handle_message(message)
         
-        return jsonify(response)
+        return serialization.json_response(response)
         
     except jwt.ExpiredSignatureError:
         return jsonify({'error': 'Token expired'}), 401
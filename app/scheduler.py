@@ -0,0 +1,249 @@
+"""
+Fair-share scheduling of Graph API requests
+Every MetaAdsClient request takes a slot from a per-process pool. When the
+pool is busy, requests wait in per-user queues served by weighted fair
+queuing, so one user's 100-account scan cannot starve everyone else.
+Interactive work (MCP tools/call) is always dispatched before background
+work (sync, validation). A user or token whose queue is full is refused
+immediately with GraphCapacityError, which the MCP endpoint turns into a
+429 with Retry-After.
+
+    with graph_scheduler.work(user_email, INTERACTIVE):
+        client.get_campaign_roas(...)   # each Graph call waits for its turn
+"""
+
+import contextvars
+import hashlib
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from app import metrics, tracing
+from app.tool_registry import remaining_budget
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+LANES = (INTERACTIVE, BACKGROUND)
+
+_current_user: contextvars.ContextVar = contextvars.ContextVar('graph_user', default=None)
+_current_lane: contextvars.ContextVar = contextvars.ContextVar('graph_lane', default=BACKGROUND)
+
+
+def estimate_cost(params: Dict) -> float:
+    """Relative weight of a Graph call; ad-level and broken-down insights are the heavy ones"""
+    cost = 1.0
+    level = params.get('level')
+    if level == 'ad':
+        cost += 2.0
+    elif level in ('adset', 'campaign'):
+        cost += 1.0
+    breakdowns = params.get('breakdowns')
+    if breakdowns:
+        cost += 1.0 + breakdowns.count(',')
+    if params.get('time_increment'):
+        cost += 1.0
+    if params.get('batch'):
+        cost += params['batch'].count('relative_url')
+    return cost
+
+
+class GraphCapacityError(Exception):
+    """Raised when a request is not admitted; retry_after is in seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    __slots__ = ('user', 'token', 'lane', 'granted', 'cancelled')
+
+    def __init__(self, user: str, token: str, lane: str):
+        self.user = user
+        self.token = token
+        self.lane = lane
+        self.granted = False
+        self.cancelled = False
+
+
+class GraphScheduler:
+    """Slot pool with per-user WFQ queues, priority lanes and admission control"""
+
+    def __init__(self, max_concurrency: int = 8, max_queue_per_user: int = 32,
+                 max_queue_per_token: int = 16, queue_timeout: float = 30.0,
+                 weights: Optional[Dict[str, float]] = None):
+        self.max_concurrency = max_concurrency
+        self.max_queue_per_user = max_queue_per_user
+        self.max_queue_per_token = max_queue_per_token
+        self.queue_timeout = queue_timeout
+        self.weights = dict(weights or {})
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._virtual_time = 0.0
+        self._last_finish: Dict[tuple, float] = {}
+        self._queues = {lane: [] for lane in LANES}
+        self._queued_users: Dict[str, int] = {}
+        self._queued_tokens: Dict[str, int] = {}
+        self._sequence = itertools.count()
+        self._service_time = 0.5  # moving average of slot hold time, for Retry-After
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrency > 0
+
+    @contextmanager
+    def work(self, user: Optional[str], lane: str = INTERACTIVE):
+        """Attribute Graph requests made in this block to a user and lane"""
+        user_token = _current_user.set(user)
+        lane_token = _current_lane.set(lane)
+        try:
+            yield
+        finally:
+            _current_user.reset(user_token)
+            _current_lane.reset(lane_token)
+
+    def check_admission(self, user: Optional[str]) -> None:
+        """Refuse new work up front for a user whose queue is already full"""
+        if not self.enabled:
+            return
+        user = user or 'anonymous'
+        with self._cond:
+            if self._queued_users.get(user, 0) >= self.max_queue_per_user:
+                self._reject(user, _current_lane.get())
+
+    @contextmanager
+    def slot(self, access_token: str, cost: float = 1.0):
+        """Hold one Graph slot for the current user and lane"""
+        if not self.enabled:
+            yield
+            return
+        user = _current_user.get() or 'anonymous'
+        lane = _current_lane.get()
+        token = hashlib.sha256(access_token.encode('utf-8')).hexdigest()[:16] if access_token else ''
+
+        with tracing.span('graph.queue', lane=lane):
+            waited = self._acquire(user, token, lane, cost)
+        metrics.observe_scheduler_wait(lane, waited)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - started)
+
+    def _acquire(self, user: str, token: str, lane: str, cost: float) -> float:
+        started = time.perf_counter()
+        budget = remaining_budget()
+        with self._cond:
+            if self._active < self.max_concurrency and not self._waiting(lane):
+                self._active += 1
+                return 0.0
+
+            if (self._queued_users.get(user, 0) >= self.max_queue_per_user
+                    or self._queued_tokens.get(token, 0) >= self.max_queue_per_token):
+                self._reject(user, lane)
+
+            # Weighted fair queuing: a flow's finish tag advances by cost / weight per request
+            flow = (lane, user)
+            start = max(self._virtual_time, self._last_finish.get(flow, 0.0))
+            finish = start + cost / self.weights.get(user, 1.0)
+            self._last_finish[flow] = finish
+            ticket = _Ticket(user, token, lane)
+            heapq.heappush(self._queues[lane], (finish, next(self._sequence), start, ticket))
+            self._queued_users[user] = self._queued_users.get(user, 0) + 1
+            self._queued_tokens[token] = self._queued_tokens.get(token, 0) + 1
+
+            deadline = started + (self.queue_timeout if budget is None else min(self.queue_timeout, budget))
+            while not ticket.granted:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    ticket.cancelled = True
+                    self._dequeued(ticket)
+                    remaining_budget()  # raises when the tool's own deadline is what ran out
+                    self._reject(user, lane, timed_out=True)
+                self._cond.wait(remaining)
+        return time.perf_counter() - started
+
+    def _waiting(self, lane: str) -> bool:
+        """True if requests in this lane or a higher-priority one are queued"""
+        for name in LANES:
+            if any(not entry[3].cancelled for entry in self._queues[name]):
+                return True
+            if name == lane:
+                return False
+        return False
+
+    def _release(self, held: float) -> None:
+        with self._cond:
+            self._service_time = 0.9 * self._service_time + 0.1 * held
+            self._active -= 1
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._active < self.max_concurrency:
+            entry = None
+            for lane in LANES:
+                queue = self._queues[lane]
+                while queue and queue[0][3].cancelled:
+                    heapq.heappop(queue)
+                if queue:
+                    entry = heapq.heappop(queue)
+                    break
+            if entry is None:
+                if not any(self._queues.values()):
+                    self._last_finish.clear()
+                return
+            _, _, start, ticket = entry
+            self._virtual_time = max(self._virtual_time, start)
+            ticket.granted = True
+            self._active += 1
+            self._dequeued(ticket)
+            self._cond.notify_all()
+
+    def _dequeued(self, ticket: _Ticket) -> None:
+        for counts, key in ((self._queued_users, ticket.user), (self._queued_tokens, ticket.token)):
+            counts[key] -= 1
+            if not counts[key]:
+                del counts[key]
+
+    def _reject(self, user: str, lane: str, timed_out: bool = False) -> None:
+        queued = sum(len(queue) for queue in self._queues.values())
+        retry_after = max(1, int(round(queued * self._service_time / max(1, self.max_concurrency))))
+        metrics.observe_scheduler_rejection(lane, 'timeout' if timed_out else 'queue_full')
+        reason = 'waited too long for Facebook capacity' if timed_out else 'has too many Facebook requests queued'
+        raise GraphCapacityError(f'User {user} {reason}; retry in {retry_after}s', retry_after)
+
+
+def _weights_from_env() -> Dict[str, float]:
+    """GRAPH_USER_WEIGHTS=agency@example.com:2,other@example.com:0.5"""
+    weights = {}
+    for item in os.getenv('GRAPH_USER_WEIGHTS', '').split(','):
+        user, _, weight = item.strip().rpartition(':')
+        if not user:
+            continue
+        try:
+            value = float(weight)
+        except ValueError:
+            value = None
+        # Zero would divide by zero in the finish tags and negatives reverse the fair-share order
+        if value is None or not 0 < value < float('inf'):
+            logger.warning(f"Ignoring GRAPH_USER_WEIGHTS entry for {user}: weight must be a positive number, got {weight!r}")
+            continue
+        weights[user] = value
+    return weights
+
+
+graph_scheduler = GraphScheduler(
+    max_concurrency=int(os.getenv('GRAPH_MAX_CONCURRENCY', '8')),
+    max_queue_per_user=int(os.getenv('GRAPH_QUEUE_PER_USER', '32')),
+    max_queue_per_token=int(os.getenv('GRAPH_QUEUE_PER_TOKEN', '16')),
+    queue_timeout=float(os.getenv('GRAPH_QUEUE_TIMEOUT', '30')),
+    weights=_weights_from_env()
+)
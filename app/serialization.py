@@ -0,0 +1,109 @@
+"""
+JSON serialization for MCP responses
+Uses orjson when it is installed and falls back to the standard library
+"""
+
+import json
+import os
+from typing import Any, Dict, Optional
+
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:  # Optional fast backend
+    orjson = None
+
+COMPACT = 'compact'
+PRETTY = 'pretty'
+
+# Style used when neither the client nor the tool asks for one
+DEFAULT_STYLE = os.getenv('MCP_JSON_STYLE', PRETTY)
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+if orjson is not None:
+    _ORJSON_OPTIONS = {
+        COMPACT: orjson.OPT_NON_STR_KEYS,
+        PRETTY: orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2
+    }
+
+
+def _default(value: Any) -> Any:
+    """Fallback for values the encoders do not know (Decimal, datetime, sets)"""
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    return str(value)
+
+
+def dumps_bytes(obj: Any, style: str = COMPACT) -> bytes:
+    """Encode to UTF-8 JSON bytes in the given style"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS.get(style, 0))
+    if style == PRETTY:
+        return json.dumps(obj, indent=2, ensure_ascii=False, default=_default).encode('utf-8')
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=_default).encode('utf-8')
+
+
+def dumps(obj: Any, style: str = COMPACT) -> str:
+    """Encode to a JSON string in the given style"""
+    if orjson is not None:
+        return dumps_bytes(obj, style).decode('utf-8')
+    if style == PRETTY:
+        return json.dumps(obj, indent=2, ensure_ascii=False, default=_default)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=_default)
+
+
+def client_style() -> Optional[str]:
+    """Style requested by the client via X-MCP-JSON-Style or ?json_style="""
+    style = request.headers.get('X-MCP-JSON-Style') or request.args.get('json_style')
+    if style:
+        style = style.strip().lower()
+        if style in (COMPACT, PRETTY):
+            return style
+    return None
+
+
+def resolve_style(client: Optional[str] = None, tool: Optional[str] = None) -> str:
+    """Client preference wins over the tool's preference, then the server default"""
+    return client or tool or DEFAULT_STYLE
+
+
+def tool_result(result: Any, style: str) -> Dict:
+    """Wrap a tool result as MCP text content, encoding it exactly once"""
+    return {
+        'content': [
+            {
+                'type': 'text',
+                'text': dumps(result, style)
+            }
+        ]
+    }
+
+
+def jsonrpc_body(result: Any, msg_id: Any = None) -> bytes:
+    """Encode a JSON-RPC success envelope in a single compact pass"""
+    envelope = {
+        'jsonrpc': '2.0',
+        'result': result
+    }
+    if msg_id is not None:
+        envelope['id'] = msg_id
+    return dumps_bytes(envelope, COMPACT)
+
+
+def json_response(obj: Any, status: int = 200, headers: Optional[Dict] = None) -> Response:
+    """Response with a compact JSON body, used instead of jsonify for large payloads"""
+    response = Response(dumps_bytes(obj, COMPACT), status=status, mimetype='application/json')
+    if headers:
+        for key, value in headers.items():
+            response.headers[key] = value
+    return response
+
+
+def jsonrpc_response(result: Any, msg_id: Any = None, headers: Optional[Dict] = None) -> Response:
+    response = Response(jsonrpc_body(result, msg_id), mimetype='application/json')
+    if headers:
+        for key, value in headers.items():
+            response.headers[key] = value
+    return response
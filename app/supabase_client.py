@@ -3,6 +3,8 @@ from supabase import create_client, Client
 from typing import Optional, Dict, Any
 import logging
 
+from app import metrics, tracing
+
 logger = logging.getLogger(__name__)
 
 class SupabaseClient:
@@ -46,6 +48,12 @@ class SupabaseClient:
                 logger.info("Supabase anon client initialized")
             return cls._anon_client
     
+    @staticmethod
+    def execute(operation: str, query):
+        """Run a query builder, recording latency under an operation label like 'users.select'"""
+        with tracing.span('supabase.query', operation=operation), metrics.supabase_query(operation):
+            return query.execute()
+    
     @classmethod
     def sync_user_to_supabase(cls, user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
@@ -57,28 +65,28 @@ class SupabaseClient:
             client = cls.get_client(use_service_role=True)
             
             # Check if user exists
-            result = client.table('users').select('*').eq('email', user_data['email']).execute()
+            result = cls.execute('users.select', client.table('users').select('*').eq('email', user_data['email']))
             
             if result.data:
                 # Update existing user
-                updated = client.table('users').update({
+                updated = cls.execute('users.update', client.table('users').update({
                     'name': user_data.get('name'),
                     'google_id': user_data.get('google_id'),
                     'api_key': user_data.get('api_key'),
                     'password_hash': user_data.get('password_hash'),
                     'updated_at': 'now()'
-                }).eq('email', user_data['email']).execute()
+                }).eq('email', user_data['email']))
                 logger.info(f"Updated user in Supabase: {user_data['email']}")
                 return updated.data[0] if updated.data else None
             else:
                 # Create new user
-                created = client.table('users').insert({
+                created = cls.execute('users.insert', client.table('users').insert({
                     'email': user_data['email'],
                     'name': user_data.get('name'),
                     'google_id': user_data.get('google_id'),
                     'password_hash': user_data.get('password_hash'),
                     'api_key': user_data.get('api_key')
-                }).execute()
+                }))
                 logger.info(f"Created new user in Supabase: {user_data['email']}")
                 return created.data[0] if created.data else None
                 
@@ -98,7 +106,7 @@ class SupabaseClient:
             client = cls.get_client(use_service_role=True)
             
             # Get user's Supabase ID
-            user_result = client.table('users').select('id').eq('email', account_data['user_email']).execute()
+            user_result = cls.execute('users.select', client.table('users').select('id').eq('email', account_data['user_email']))
             if not user_result.data:
                 logger.error(f"User not found in Supabase: {account_data['user_email']}")
                 return None
@@ -106,23 +114,23 @@ class SupabaseClient:
             supabase_user_id = user_result.data[0]['id']
             
             # Check if ad account exists
-            result = client.table('ad_accounts').select('*').eq('account_id', account_data['account_id']).eq('user_id', supabase_user_id).execute()
+            result = cls.execute('ad_accounts.select', client.table('ad_accounts').select('*').eq('account_id', account_data['account_id']).eq('user_id', supabase_user_id))
             
             if result.data:
                 # Update existing ad account
-                updated = client.table('ad_accounts').update({
+                updated = cls.execute('ad_accounts.update', client.table('ad_accounts').update({
                     'account_name': account_data.get('account_name'),
                     'access_token': account_data.get('access_token'),
                     'refresh_token': account_data.get('refresh_token'),
                     'is_active': account_data.get('is_active', True),
                     'last_synced': account_data.get('last_synced'),
                     'updated_at': 'now()'
-                }).eq('account_id', account_data['account_id']).eq('user_id', supabase_user_id).execute()
+                }).eq('account_id', account_data['account_id']).eq('user_id', supabase_user_id))
                 logger.info(f"Updated ad account in Supabase: {account_data['account_id']}")
                 return updated.data[0] if updated.data else None
             else:
                 # Create new ad account
-                created = client.table('ad_accounts').insert({
+                created = cls.execute('ad_accounts.insert', client.table('ad_accounts').insert({
                     'user_id': supabase_user_id,
                     'account_id': account_data['account_id'],
                     'account_name': account_data.get('account_name'),
@@ -130,7 +138,7 @@ class SupabaseClient:
                     'refresh_token': account_data.get('refresh_token'),
                     'is_active': account_data.get('is_active', True),
                     'last_synced': account_data.get('last_synced')
-                }).execute()
+                }))
                 logger.info(f"Created new ad account in Supabase: {account_data['account_id']}")
                 return created.data[0] if created.data else None
                 
@@ -147,7 +155,7 @@ class SupabaseClient:
         try:
             # Use service role for authentication (needs to read any user)
             client = cls.get_client(use_service_role=True)
-            result = client.table('users').select('*').eq('email', email).execute()
+            result = cls.execute('users.select', client.table('users').select('*').eq('email', email))
             return result.data[0] if result.data else None
         except Exception as e:
             logger.error(f"Error getting user from Supabase: {str(e)}")
@@ -163,14 +171,14 @@ class SupabaseClient:
             client = cls.get_client(use_service_role=True)
             
             # Get user's Supabase ID
-            user_result = client.table('users').select('id').eq('email', user_email).execute()
+            user_result = cls.execute('users.select', client.table('users').select('id').eq('email', user_email))
             if not user_result.data:
                 return []
             
             supabase_user_id = user_result.data[0]['id']
             
             # Get ad accounts
-            result = client.table('ad_accounts').select('*').eq('user_id', supabase_user_id).execute()
+            result = cls.execute('ad_accounts.select', client.table('ad_accounts').select('*').eq('user_id', supabase_user_id))
             return result.data if result.data else []
         except Exception as e:
             logger.error(f"Error getting ad accounts from Supabase: {str(e)}")
@@ -0,0 +1,510 @@
+"""
+Tool registry for MCP servers
+Builds tool schemas once, serves pre-serialized discovery payloads and
+dispatches tool calls through shared middleware
+"""
+
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Any, Optional
+
+from flask import Response, request
+
+from app import metrics, tracing
+
+
+class PrecomputedPayload:
+    """JSON document serialized once, with a content hash used as its ETag"""
+
+    __slots__ = ('data', 'body', 'etag')
+
+    def __init__(self, data: Any):
+        self.data = data
+        self.body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+
+    def not_modified(self) -> bool:
+        """True when the client already holds this exact payload"""
+        if_none_match = request.headers.get('If-None-Match')
+        if not if_none_match:
+            return False
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in candidates or self.etag in candidates or f'W/{self.etag}' in candidates
+
+    def to_response(self, status: int = 200, headers: Optional[Dict] = None) -> Response:
+        """Build a response from the cached bytes, honouring If-None-Match"""
+        if status == 200 and self.not_modified():
+            response = Response(status=304)
+        else:
+            response = Response(self.body, status=status, mimetype='application/json')
+        response.headers['ETag'] = self.etag
+        if headers:
+            for key, value in headers.items():
+                response.headers[key] = value
+        return response
+
+    def jsonrpc_body(self, msg_id: Any = None) -> bytes:
+        """Splice the cached bytes into a JSON-RPC success envelope"""
+        if msg_id is None:
+            return b'{"jsonrpc":"2.0","result":' + self.body + b'}'
+        return (b'{"jsonrpc":"2.0","result":' + self.body +
+                b',"id":' + json.dumps(msg_id).encode('utf-8') + b'}')
+
+    def to_jsonrpc_response(self, msg_id: Any = None, headers: Optional[Dict] = None) -> Response:
+        """Build a JSON-RPC response whose result is this payload.
+
+        Never conditional: a 304 has no body to carry the JSON-RPC id, so
+        If-None-Match is only honoured by the GET discovery endpoints.
+        """
+        response = Response(self.jsonrpc_body(msg_id), mimetype='application/json')
+        if headers:
+            for key, value in headers.items():
+                response.headers[key] = value
+        return response
+
+
+class ToolArgumentError(ValueError):
+    """Raised when tool arguments do not match the tool's inputSchema"""
+
+
+class ToolTimeoutError(TimeoutError):
+    """Raised when a tool exceeds its time budget"""
+
+
+class UnknownToolError(KeyError):
+    """Raised when dispatching a tool that was never registered"""
+
+
+def _coerce_number(value):
+    if isinstance(value, bool):
+        raise TypeError('boolean is not a number')
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def _coerce_integer(value):
+    if isinstance(value, bool):
+        raise TypeError('boolean is not an integer')
+    number = float(value)
+    if not number.is_integer():
+        raise ValueError('expected a whole number')
+    return int(number)
+
+
+def _coerce_boolean(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ('true', 'false', '1', '0'):
+        return value.lower() in ('true', '1')
+    raise TypeError('expected a boolean')
+
+
+def _coerce_array(value):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    if isinstance(value, str):
+        # Clients sometimes send comma separated strings for list arguments
+        return [item.strip() for item in value.split(',') if item.strip()]
+    raise TypeError('expected an array')
+
+
+def _coerce_object(value):
+    if not isinstance(value, dict):
+        raise TypeError('expected an object')
+    return value
+
+
+_COERCERS = {
+    'number': _coerce_number,
+    'integer': _coerce_integer,
+    'string': str,
+    'boolean': _coerce_boolean,
+    'array': _coerce_array,
+    'object': _coerce_object
+}
+
+
+def compile_validator(input_schema: Dict) -> Callable[[Optional[Dict]], Dict]:
+    """Compile an inputSchema into a function that checks and coerces arguments.
+
+    Undeclared arguments are rejected when ``additionalProperties`` is False
+    and dropped otherwise, so handlers only ever see declared parameters.
+    Null values are treated as absent so handler defaults apply.
+    """
+    properties = input_schema.get('properties', {})
+    required = tuple(input_schema.get('required', []))
+    strict = input_schema.get('additionalProperties', True) is False
+    coercers = {}
+    for prop_name, prop_schema in properties.items():
+        coercers[prop_name] = _COERCERS.get(prop_schema.get('type'))
+        enum = prop_schema.get('enum')
+        if enum and coercers[prop_name] is not None:
+            coercers[prop_name] = _with_enum(coercers[prop_name], frozenset(enum))
+
+    def validate(arguments: Optional[Dict]) -> Dict:
+        if arguments is None:
+            arguments = {}
+        if not isinstance(arguments, dict):
+            raise ToolArgumentError('Tool arguments must be a JSON object')
+
+        cleaned = {}
+        for key, value in arguments.items():
+            if key not in coercers:
+                if strict:
+                    raise ToolArgumentError(f"Unexpected argument '{key}'")
+                continue
+            if value is None:
+                continue
+            coerce = coercers[key]
+            if coerce is None:
+                cleaned[key] = value
+                continue
+            try:
+                cleaned[key] = coerce(value)
+            except (TypeError, ValueError) as e:
+                raise ToolArgumentError(f"Invalid value for '{key}': {e}")
+
+        for key in required:
+            if key not in cleaned:
+                raise ToolArgumentError(f"Missing required argument '{key}'")
+        return cleaned
+
+    return validate
+
+
+def _with_enum(coerce, allowed):
+    def coerce_enum(value):
+        value = coerce(value)
+        if value not in allowed:
+            raise ValueError(f"must be one of {', '.join(sorted(map(str, allowed)))}")
+        return value
+    return coerce_enum
+
+
+class ToolSpec:
+    """A registered tool: schema, handler and per-tool execution options"""
+
+    __slots__ = ('name', 'description', 'input_schema', 'handler', 'timeout', 'options', 'validate')
+
+    def __init__(self, name: str, description: str, input_schema: Dict,
+                 handler: Optional[Callable] = None, timeout: Optional[float] = None, **options):
+        self.name = name
+        self.description = description
+        self.input_schema = input_schema
+        self.handler = handler
+        self.timeout = timeout
+        self.options = options
+        self.validate = compile_validator(input_schema)
+
+    def definition(self) -> Dict:
+        return {
+            'name': self.name,
+            'description': self.description,
+            'inputSchema': self.input_schema
+        }
+
+
+# (deadline, tool name, budget) of the tool running in this context; copied
+# into fan-out and hedge threads along with the rest of the context
+_tool_deadline = contextvars.ContextVar('tool_deadline', default=None)
+
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left of the current tool's time budget, None outside a budgeted tool.
+
+    Raises ToolTimeoutError once the budget is spent, so Graph calls made
+    after the deadline fail instead of starting.
+    """
+    current = _tool_deadline.get()
+    if current is None:
+        return None
+    deadline, name, timeout = current
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise ToolTimeoutError(f"Tool '{name}' timed out after {timeout:g}s")
+    return remaining
+
+
+def without_deadline() -> contextvars.Context:
+    """A copy of the current context with no tool deadline, for work that outlives the tool call"""
+    context = contextvars.copy_context()
+    context.run(_tool_deadline.set, None)
+    return context
+
+
+class ToolRegistry:
+    """Decorator-based tool registry with O(1) dispatch.
+
+    Handlers are called as ``handler(context, **arguments)`` after the
+    arguments pass the validator compiled from the tool's inputSchema.
+    Middleware registered with ``use`` wraps every call and receives
+    ``(spec, context, arguments, call_next)``.
+    """
+
+    def __init__(self, default_timeout: Optional[float] = None):
+        self.default_timeout = default_timeout
+        self._tools: Dict[str, ToolSpec] = {}
+        self._middleware: List[Callable] = []
+        self._tools_list: Optional[PrecomputedPayload] = None
+
+    def add(self, name: str, description: str, input_schema: Optional[Dict] = None,
+            handler: Optional[Callable] = None, timeout: Optional[float] = None, **options) -> ToolSpec:
+        """Register a tool definition"""
+        spec = ToolSpec(
+            name,
+            description,
+            input_schema or {'type': 'object', 'properties': {}, 'required': []},
+            handler=handler,
+            timeout=timeout,
+            **options
+        )
+        self._tools[name] = spec
+        self._tools_list = None
+        return spec
+
+    def tool(self, name: str, description: str, input_schema: Optional[Dict] = None,
+             timeout: Optional[float] = None, **options) -> Callable:
+        """Decorator form of ``add``; returns the handler unchanged"""
+        def decorator(handler: Callable) -> Callable:
+            self.add(name, description, input_schema, handler=handler, timeout=timeout, **options)
+            return handler
+        return decorator
+
+    def use(self, middleware: Callable) -> Callable:
+        """Append a middleware; the first one registered runs outermost"""
+        self._middleware.append(middleware)
+        return middleware
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tools
+
+    def __len__(self) -> int:
+        return len(self._tools)
+
+    def get(self, name: str) -> Optional[ToolSpec]:
+        return self._tools.get(name)
+
+    def names(self) -> List[str]:
+        return list(self._tools)
+
+    def schemas(self) -> List[Dict]:
+        """Return tool definitions in registration order"""
+        return [spec.definition() for spec in self._tools.values()]
+
+    def tools_list(self) -> PrecomputedPayload:
+        """Return the pre-serialized tools/list result, building it on first use"""
+        if self._tools_list is None:
+            self._tools_list = PrecomputedPayload({'tools': self.schemas()})
+        return self._tools_list
+
+    def dispatch(self, name: str, arguments: Optional[Dict], context: Any = None) -> Any:
+        """Validate arguments and run a tool through the middleware chain"""
+        spec = self._tools.get(name)
+        if spec is None or spec.handler is None:
+            raise UnknownToolError(name)
+
+        with tracing.span('tool.call', tool=name) as span:
+            with tracing.span('tool.validate'):
+                arguments = spec.validate(arguments)
+
+            def invoke(ctx, args):
+                return self._run_handler(spec, ctx, args)
+
+            call = invoke
+            for middleware in reversed(self._middleware):
+                call = _bind_middleware(middleware, spec, call)
+
+            started = time.perf_counter()
+            status = 'ok'
+            try:
+                result = call(context, arguments)
+                if isinstance(result, dict) and result.get('status') == 'error':
+                    status = 'error'
+                return result
+            except Exception:
+                status = 'exception'
+                raise
+            finally:
+                span.set_attribute('status', status)
+                metrics.observe_tool(name, status, time.perf_counter() - started)
+
+    def _run_handler(self, spec: ToolSpec, context: Any, arguments: Dict) -> Any:
+        """Run the handler on the request thread; the budget starts now and is
+        enforced by the Graph client, which caps its timeouts to what is left"""
+        timeout = spec.timeout if spec.timeout is not None else self.default_timeout
+        if not timeout:
+            return _traced_handler(spec, context, arguments)
+
+        token = _tool_deadline.set((time.monotonic() + timeout, spec.name, timeout))
+        try:
+            return _traced_handler(spec, context, arguments)
+        finally:
+            _tool_deadline.reset(token)
+
+
+def _traced_handler(spec: ToolSpec, context: Any, arguments: Dict) -> Any:
+    with tracing.span('tool.handler', tool=spec.name):
+        return spec.handler(context, **arguments)
+
+
+def _bind_middleware(middleware: Callable, spec: ToolSpec, call_next: Callable) -> Callable:
+    span_name = 'tool.' + middleware.__name__.strip('_')
+
+    def call(context, arguments):
+        with tracing.span(span_name):
+            return middleware(spec, context, arguments, call_next)
+    return call
+
+
+class TTLCache:
+    """Small thread-safe cache with per-entry expiry"""
+
+    def __init__(self, ttl: float, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[Any, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            return value
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._evict()
+            self._entries[key] = (time.monotonic() + (ttl or self.ttl), value)
+
+    def pop(self, key: Any) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_set(self, key: Any, factory: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _) in self._entries.items() if expires_at < now]
+        for key in expired:
+            del self._entries[key]
+        if len(self._entries) >= self.max_entries:
+            # Still full: drop the oldest insertions
+            for key in list(self._entries)[:max(1, self.max_entries // 10)]:
+                del self._entries[key]
+
+
+class StaleWhileRevalidateCache:
+    """Cache whose entries are fresh for ``ttl``, then usable but stale for ``stale_ttl``.
+
+    ``lookup`` reports which of the two an entry is in; callers serve stale
+    entries immediately and refresh them in the background, using
+    ``begin_refresh``/``end_refresh`` so only one refresh runs per key.
+    """
+
+    FRESH = 'fresh'
+    STALE = 'stale'
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: Dict[Any, tuple] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def lookup(self, key: Any) -> tuple:
+        """Return (value, stored_at, state); state is None for a miss or an expired entry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, None, None
+            stored_at, fresh_until, usable_until, value = entry
+            now = time.monotonic()
+            if now < fresh_until:
+                return value, stored_at, self.FRESH
+            if now < usable_until:
+                return value, stored_at, self.STALE
+            del self._entries[key]
+            return None, None, None
+
+    def set(self, key: Any, value: Any, ttl: float, stale_ttl: float = 0) -> float:
+        """Store a value; returns its wall-clock timestamp"""
+        stored_at = time.time()
+        now = time.monotonic()
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                self._evict(now)
+            self._entries[key] = (stored_at, now + ttl, now + ttl + stale_ttl, value)
+        return stored_at
+
+    def begin_refresh(self, key: Any) -> bool:
+        """Claim the refresh of a key; False if another caller already has it"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key: Any) -> None:
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self, now: float) -> None:
+        expired = [key for key, entry in self._entries.items() if entry[2] < now]
+        for key in expired:
+            del self._entries[key]
+        if len(self._entries) >= self.max_entries:
+            for key in list(self._entries)[:max(1, self.max_entries // 10)]:
+                del self._entries[key]
+
+
+_MISSING = object()
+
+
+class InitializeResults:
+    """Caches initialize results per negotiated protocol version"""
+
+    def __init__(self, server_info: Dict, capabilities: Optional[Dict] = None,
+                 default_version: str = '2024-11-05'):
+        self.server_info = server_info
+        self.capabilities = capabilities or {'tools': {}}
+        self.default_version = default_version
+        self._payloads: Dict[str, PrecomputedPayload] = {}
+
+    def get(self, protocol_version: Any) -> PrecomputedPayload:
+        if not isinstance(protocol_version, str) or not protocol_version:
+            # Malformed client value: answer with the version we support
+            protocol_version = self.default_version
+        payload = self._payloads.get(protocol_version)
+        if payload is None:
+            # Protocol versions come from clients; keep the cache bounded
+            if len(self._payloads) >= 16:
+                self._payloads.clear()
+            payload = PrecomputedPayload({
+                'protocolVersion': protocol_version,
+                'capabilities': self.capabilities,
+                'serverInfo': self.server_info
+            })
+            self._payloads[protocol_version] = payload
+        return payload
@@ -0,0 +1,234 @@
+"""
+Request tracing for MCP calls
+Spans cover the MCP request, each tool middleware stage, Supabase queries
+and Graph API requests. Tracing is a no-op unless TRACE_EXPORTER is set:
+
+  TRACE_EXPORTER=file  append finished spans as NDJSON to TRACE_FILE
+  TRACE_EXPORTER=otlp  hand spans to OpenTelemetry (needs opentelemetry-sdk
+                       and opentelemetry-exporter-otlp; configured through
+                       the standard OTEL_* variables)
+
+The current span lives in a contextvar, so work submitted through
+contextvars.copy_context() (the Graph fan-out and hedge pools) stays in the
+same trace.
+Convert a file trace for chrome://tracing, Perfetto or speedscope with:
+
+  python -m app.tracing traces.ndjson > trace.json
+"""
+
+import contextvars
+import json
+import logging
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EXPORTER = os.getenv('TRACE_EXPORTER', '').strip().lower()
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.ndjson')
+
+_TRACEPARENT = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+
+class Span:
+    """A timed operation; attributes end up in the exported record"""
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'attributes', 'start', '_started')
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time()
+        self._started = time.perf_counter()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def traceparent(self) -> str:
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def traceparent(self) -> Optional[str]:
+        return None
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current: contextvars.ContextVar = contextvars.ContextVar('trace_span', default=None)
+
+
+class _FileExporter:
+    """Appends one JSON line per finished span"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', buffering=1, encoding='utf-8')
+
+    def export(self, span: Span, duration: float, error: Optional[str]) -> None:
+        record = {
+            'name': span.name,
+            'trace_id': span.trace_id,
+            'span_id': span.span_id,
+            'parent_id': span.parent_id,
+            'start': span.start,
+            'duration_ms': round(duration * 1000, 3),
+            'pid': os.getpid(),
+            'thread': threading.current_thread().name,
+            'attributes': span.attributes
+        }
+        if error:
+            record['error'] = error
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+
+
+def _otel_tracer():
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+    resource = Resource.create({'service.name': os.getenv('OTEL_SERVICE_NAME', 'meta-ads-mcp')})
+    provider = TracerProvider(resource=resource)
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    return trace.get_tracer(__name__)
+
+
+_file_exporter = None
+_otel = None
+
+if EXPORTER == 'file':
+    try:
+        _file_exporter = _FileExporter(TRACE_FILE)
+    except OSError as e:
+        logger.warning(f"Tracing disabled, cannot open {TRACE_FILE}: {e}")
+elif EXPORTER == 'otlp':
+    try:
+        _otel = _otel_tracer()
+    except ImportError as e:
+        logger.warning(f"Tracing disabled, OpenTelemetry is not installed: {e}")
+
+ENABLED = _file_exporter is not None or _otel is not None
+
+
+def extract(headers) -> Optional[Tuple[str, str]]:
+    """(trace_id, parent span_id) from a W3C traceparent header, if present"""
+    match = _TRACEPARENT.match((headers.get('traceparent') or '').strip().lower())
+    return match.groups() if match else None
+
+
+@contextmanager
+def span(name: str, parent: Optional[Tuple[str, str]] = None, **attributes) -> Iterator:
+    """Time a block as a child of the current span (or of a remote parent)"""
+    if not ENABLED:
+        yield NOOP_SPAN
+        return
+
+    if _otel is not None:
+        with _otel_span(name, parent, attributes) as otel_span:
+            yield otel_span
+        return
+
+    current = _current.get()
+    if current is not None:
+        trace_id, parent_id = current.trace_id, current.span_id
+    elif parent is not None:
+        trace_id, parent_id = parent
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+
+    new_span = Span(name, trace_id, parent_id, attributes)
+    token = _current.set(new_span)
+    error = None
+    try:
+        yield new_span
+    except BaseException as e:
+        error = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        _current.reset(token)
+        _file_exporter.export(new_span, time.perf_counter() - new_span._started, error)
+
+
+@contextmanager
+def _otel_span(name: str, parent: Optional[Tuple[str, str]], attributes: Dict) -> Iterator:
+    from opentelemetry import trace
+    from opentelemetry.trace import NonRecordingSpan, SpanContext, TraceFlags
+
+    context = None
+    if parent is not None and not trace.get_current_span().get_span_context().is_valid:
+        remote = SpanContext(int(parent[0], 16), int(parent[1], 16), is_remote=True,
+                             trace_flags=TraceFlags(TraceFlags.SAMPLED))
+        context = trace.set_span_in_context(NonRecordingSpan(remote))
+    attributes = {key: value if isinstance(value, (str, bool, int, float)) else str(value)
+                  for key, value in attributes.items() if value is not None}
+    with _otel.start_as_current_span(name, context=context, attributes=attributes) as otel_span:
+        yield otel_span
+
+
+def current_span():
+    """The innermost active span, or a no-op span"""
+    if _otel is not None:
+        from opentelemetry import trace
+        return trace.get_current_span()
+    return _current.get() or NOOP_SPAN
+
+
+def traced(name: str):
+    """Decorator form of span()"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def to_chrome_trace(lines) -> Dict:
+    """Convert NDJSON span records to the Chrome trace event format"""
+    events = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        args = dict(record.get('attributes') or {})
+        args['trace_id'] = record['trace_id']
+        if record.get('error'):
+            args['error'] = record['error']
+        events.append({
+            'name': record['name'],
+            'ph': 'X',
+            'ts': record['start'] * 1e6,
+            'dur': record['duration_ms'] * 1e3,
+            'pid': record.get('pid', 0),
+            'tid': record.get('thread', 'main'),
+            'args': args
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+if __name__ == '__main__':
+    with open(sys.argv[1] if len(sys.argv) > 1 else TRACE_FILE, encoding='utf-8') as f:
+        json.dump(to_chrome_trace(f), sys.stdout)
@@ -0,0 +1,290 @@
+"""
+Daily trend series
+Each ad account keeps one append-only daily series of base measures. A call
+only asks Graph for the days after the last stored date, plus the most
+recent REFRESH_DAYS again because attribution keeps moving conversions into
+recent days. Rolling averages, week-over-week deltas and anomaly flags are
+computed in one pass over prefix sums of the stored columns.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+from app import actions
+
+logger = logging.getLogger(__name__)
+
+REFRESH_DAYS = int(os.getenv('TRENDS_REFRESH_DAYS', '3'))
+REFRESH_SECONDS = float(os.getenv('TRENDS_REFRESH_SECONDS', '300'))
+MAX_ACCOUNTS = int(os.getenv('TRENDS_CACHE_ACCOUNTS', '64'))
+ANOMALY_Z = float(os.getenv('TRENDS_ANOMALY_Z', '3'))
+
+ROLLING_DAYS = 7
+BASELINE_DAYS = 14   # trailing days an anomaly is measured against
+MIN_BASELINE_DAYS = 7
+CONTEXT_DAYS = BASELINE_DAYS  # extra history fetched ahead of `since` so the first days have context
+
+BASE_MEASURES = ('spend', 'revenue', 'impressions', 'clicks', 'conversions')
+# derived metric -> (numerator, denominator, scale, decimals)
+DERIVED_METRICS = {
+    'roas': ('revenue', 'spend', 1, 2),
+    'ctr': ('clicks', 'impressions', 100, 2),
+    'cpm': ('spend', 'impressions', 1000, 2)
+}
+METRICS = BASE_MEASURES + tuple(DERIVED_METRICS)
+INTEGER_MEASURES = ('impressions', 'clicks', 'conversions')
+
+
+def _day(value: str) -> date:
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class DailySeries:
+    """Contiguous per-day columns starting at `start`; days without delivery are zero"""
+
+    __slots__ = ('start', 'columns', 'synced_at', 'lock')
+
+    def __init__(self):
+        self.start: Optional[date] = None
+        self.columns = {measure: array('d') for measure in BASE_MEASURES}
+        self.synced_at = 0.0  # when the refresh window was last re-fetched
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.columns['spend'])
+
+    @property
+    def end(self) -> Optional[date]:
+        return self.start + timedelta(days=len(self) - 1) if len(self) else None
+
+    def cover(self, since: date, until: date) -> None:
+        """Grow the series with zero days so [since, until] is addressable"""
+        if self.start is None:
+            self.start = since
+        if since < self.start:
+            pad = array('d', bytes(8 * (self.start - since).days))
+            for measure, column in self.columns.items():
+                self.columns[measure] = pad + column
+            self.start = since
+        missing = (until - self.start).days + 1 - len(self)
+        if missing > 0:
+            for column in self.columns.values():
+                column.extend(array('d', bytes(8 * missing)))
+
+    def write(self, since: date, until: date, rows: Sequence[Dict]) -> None:
+        """Replace [since, until] with the fetched daily rows"""
+        self.cover(since, until)
+        first = (since - self.start).days
+        last = (until - self.start).days
+        for column in self.columns.values():
+            column[first:last + 1] = array('d', bytes(8 * (last - first + 1)))
+        for row in rows:
+            index = (_day(row['date_start']) - self.start).days
+            if first <= index <= last:
+                for measure, value in row['measures'].items():
+                    self.columns[measure][index] = value
+
+    def snapshot(self, since: date, until: date) -> tuple:
+        """(start, columns) copied and zero-padded to cover [since, until]; days after today stay unstored"""
+        start = min(self.start or since, since)
+        lead = (self.start - start).days if self.start else 0
+        length = (until - start).days + 1
+        columns = {}
+        for measure, column in self.columns.items():
+            padded = array('d', bytes(8 * lead)) + column
+            if len(padded) < length:
+                padded.extend(array('d', bytes(8 * (length - len(padded)))))
+            columns[measure] = padded
+        return start, columns
+
+
+class TrendStore:
+    """Per-account daily series, synced incrementally from Graph"""
+
+    def __init__(self, max_accounts: int = MAX_ACCOUNTS):
+        self.max_accounts = max_accounts
+        self._accounts: 'OrderedDict[str, DailySeries]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, account_id: str) -> DailySeries:
+        with self._lock:
+            series = self._accounts.get(account_id)
+            if series is None:
+                series = self._accounts[account_id] = DailySeries()
+                while len(self._accounts) > self.max_accounts:
+                    self._accounts.popitem(last=False)
+            self._accounts.move_to_end(account_id)
+            return series
+
+    def series(self, client, account_id: str, since: date, until: date,
+               today: Optional[date] = None) -> DailySeries:
+        """The account's series, synced so it covers [since, until] up to today"""
+        today = today or date.today()
+        series = self._entry(account_id)
+        with series.lock:
+            stop = min(until, today)
+            if stop >= since:
+                self._sync(client, account_id, series, since, stop)
+        return series
+
+    def _sync(self, client, account_id: str, series: DailySeries, since: date, stop: date) -> None:
+        if series.start is None:
+            self._fetch(client, account_id, series, since, stop)
+            series.synced_at = time.monotonic()
+            return
+
+        if since < series.start:
+            self._fetch(client, account_id, series, since, series.start - timedelta(days=1))
+
+        end = series.end
+        refresh_from = max(series.start, end - timedelta(days=REFRESH_DAYS - 1))
+        window_due = time.monotonic() - series.synced_at >= REFRESH_SECONDS
+        if stop >= refresh_from and window_due:
+            self._fetch(client, account_id, series, refresh_from, stop)
+            series.synced_at = time.monotonic()
+        elif stop > end:
+            self._fetch(client, account_id, series, end + timedelta(days=1), stop)
+
+    @staticmethod
+    def _fetch(client, account_id: str, series: DailySeries, since: date, until: date) -> None:
+        params = {
+            'fields': 'spend,impressions,clicks,actions,action_values,date_start',
+            'time_range': f'{{"since":"{since.isoformat()}","until":"{until.isoformat()}"}}',
+            'time_increment': '1',
+            'level': 'account',
+            'action_breakdowns': 'action_type',
+            'limit': 500
+        }
+        classifier = actions.classifier_for(account_id)
+        rows = []
+        for day in client._iter_pages(f'/act_{account_id}/insights', params):
+            revenue, conversions = classifier.classify(day)
+            rows.append({
+                'date_start': day.get('date_start'),
+                'measures': {
+                    'spend': float(day.get('spend', 0)),
+                    'revenue': revenue,
+                    'impressions': float(day.get('impressions', 0)),
+                    'clicks': float(day.get('clicks', 0)),
+                    'conversions': float(conversions)
+                }
+            })
+        series.write(since, until, rows)
+        logger.info(f"Daily series for {account_id}: fetched {since} to {until}, {len(rows)} days with delivery")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._accounts.clear()
+
+
+trend_store = TrendStore()
+
+
+def _prefix(values: Sequence[float]) -> array:
+    sums = array('d', [0.0])
+    total = 0.0
+    for value in values:
+        total += value
+        sums.append(total)
+    return sums
+
+
+def _ratio(numerator: float, denominator: float, scale: float, decimals: int) -> float:
+    return round(numerator / denominator * scale, decimals) if denominator else 0
+
+
+class _SeriesView:
+    """Prefix sums over a series, so any window total is two lookups"""
+
+    def __init__(self, columns: Dict[str, array], metrics: Sequence[str]):
+        self.sums = {measure: _prefix(column) for measure, column in columns.items()}
+        self.daily = {metric: self._daily(columns, metric) for metric in metrics}
+        self.daily_sums = {metric: _prefix(values) for metric, values in self.daily.items()}
+        self.daily_squares = {metric: _prefix(value * value for value in values)
+                              for metric, values in self.daily.items()}
+
+    @staticmethod
+    def _daily(columns: Dict[str, array], metric: str) -> Sequence[float]:
+        if metric in columns:
+            return columns[metric]
+        numerator, denominator, scale, decimals = DERIVED_METRICS[metric]
+        return array('d', (_ratio(n, d, scale, decimals)
+                           for n, d in zip(columns[numerator], columns[denominator])))
+
+    def window(self, metric: str, first: int, last: int) -> Optional[float]:
+        """Metric over days [first, last]: daily average for base measures, ratio of totals for derived ones"""
+        if first < 0:
+            return None
+        if metric in DERIVED_METRICS:
+            numerator, denominator, scale, decimals = DERIVED_METRICS[metric]
+            return _ratio(self._total(numerator, first, last), self._total(denominator, first, last), scale, decimals)
+        return round(self._total(metric, first, last) / (last - first + 1), 2)
+
+    def _total(self, measure: str, first: int, last: int) -> float:
+        sums = self.sums[measure]
+        return sums[last + 1] - sums[first]
+
+    def wow_change(self, metric: str, index: int) -> Optional[float]:
+        """Trailing week against the week before, in percent"""
+        current = self.window(metric, index - ROLLING_DAYS + 1, index)
+        previous = self.window(metric, index - 2 * ROLLING_DAYS + 1, index - ROLLING_DAYS)
+        if current is None or previous is None or not previous:
+            return None
+        return round((current - previous) / previous * 100, 1)
+
+    def anomaly(self, metric: str, index: int) -> Optional[str]:
+        """'spike' or 'drop' when the day is ANOMALY_Z deviations off its trailing baseline"""
+        first = max(0, index - BASELINE_DAYS)
+        count = index - first
+        if count < MIN_BASELINE_DAYS:
+            return None
+        total = self.daily_sums[metric][index] - self.daily_sums[metric][first]
+        squares = self.daily_squares[metric][index] - self.daily_squares[metric][first]
+        mean = total / count
+        deviation = math.sqrt(max(0.0, squares / count - mean * mean))
+        if deviation <= 1e-9:
+            return None
+        score = (self.daily[metric][index] - mean) / deviation
+        if score >= ANOMALY_Z:
+            return 'spike'
+        if score <= -ANOMALY_Z:
+            return 'drop'
+        return None
+
+
+def daily_trends(client, account_id: str, date_range: Dict, metrics: Optional[List[str]] = None,
+                 today: Optional[date] = None) -> List[Dict]:
+    """One row per day in the range with the requested metrics, 7-day averages, WoW change and anomalies"""
+    metrics = list(metrics or METRICS)
+    unknown = [metric for metric in metrics if metric not in METRICS]
+    if unknown:
+        raise ValueError(f"Unknown metrics: {', '.join(unknown)}. Choose from {', '.join(METRICS)}")
+
+    since = _day(date_range['since'])
+    until = _day(date_range['until'])
+    series = trend_store.series(client, account_id, since - timedelta(days=CONTEXT_DAYS), until, today)
+
+    with series.lock:
+        start, columns = series.snapshot(since, until)
+    view = _SeriesView(columns, metrics)
+    offset = (since - start).days
+
+    trends = []
+    for index in range(offset, offset + (until - since).days + 1):
+        row = {'date': (start + timedelta(days=index)).isoformat()}
+        for metric in metrics:
+            value = view.daily[metric][index]
+            row[metric] = int(value) if metric in INTEGER_MEASURES else value
+        row['rolling_7d'] = {metric: view.window(metric, index - ROLLING_DAYS + 1, index) for metric in metrics}
+        row['wow_change_pct'] = {metric: view.wow_change(metric, index) for metric in metrics}
+        row['anomalies'] = {metric: flag for metric in metrics
+                            for flag in (view.anomaly(metric, index),) if flag}
+        trends.append(row)
+    return trends
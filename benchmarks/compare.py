@@ -0,0 +1,55 @@
+"""
+Compare two benchmark result files
+
+    python benchmarks/compare.py baseline.json candidate.json [--metric p95_ms]
+"""
+
+import argparse
+import json
+import sys
+
+KEYS = ('name', 'tool', 'ads_per_account', 'concurrency', 'rows')
+
+
+def row_key(row) -> tuple:
+    key = tuple(row[key] for key in KEYS if key in row)
+    # MCP tool rows from before --server existed all measured the oauth endpoint
+    return (row.get('server', 'oauth'),) + key if 'tool' in row else key
+
+
+def load(path: str):
+    with open(path, encoding='utf-8') as f:
+        report = json.load(f)
+    return report, {row_key(row): row for row in report['results']}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--metric', action='append', help='metrics to compare (default: p50_ms, p95_ms, rps)')
+    args = parser.parse_args(argv)
+    metrics = args.metric or ['p50_ms', 'p95_ms', 'rps']
+
+    base_report, baseline = load(args.baseline)
+    cand_report, candidate = load(args.candidate)
+    print(f"baseline  {base_report.get('git', {}).get('commit')}")
+    print(f"candidate {cand_report.get('git', {}).get('commit')}")
+
+    for key, row in candidate.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        cells = []
+        for metric in metrics:
+            old, new = before.get(metric), row.get(metric)
+            if not isinstance(old, (int, float)) or not isinstance(new, (int, float)):
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            cells.append(f'{metric}={old:g}->{new:g} ({change:+.1f}%)')
+        print(' '.join(str(part) for part in key).ljust(48), '  '.join(cells))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
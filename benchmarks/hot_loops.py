@@ -0,0 +1,163 @@
+"""
+Microbenchmarks for the CPU-bound insights parsing and aggregation in MetaAdsClient
+Payloads come from the Graph simulator and are fed
+straight to the client methods, so only parsing and aggregation are timed.
+
+    python benchmarks/hot_loops.py --rows 100,10000,100000 --output loops.json
+"""
+
+import argparse
+import gc
+import json
+import logging
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timezone, timedelta
+from typing import Callable, Dict, List
+
+from stubs import ROOT  # noqa: F401  (puts the repo on sys.path)
+from mcp_tools import git_revision
+
+DATE_RANGE = {'since': '2026-01-01', 'until': '2026-01-31'}
+
+
+def make_rows(simulator, account_id: str, count: int, **params) -> List[Dict]:
+    """Exactly `count` insights rows, using daily rows to reach large counts"""
+    until = date.today() - timedelta(days=1)
+    per_day = len(simulator.insights_rows(account_id, time_range={'since': until.isoformat(),
+                                                                  'until': until.isoformat()}, **params))
+    days = max(1, -(-count // max(1, per_day)))
+    since = until - timedelta(days=days - 1)
+    rows = simulator.insights_rows(account_id, time_increment=1,
+                                   time_range={'since': since.isoformat(), 'until': until.isoformat()}, **params)
+    while len(rows) < count:
+        rows = rows + rows[:count - len(rows)]
+    return rows[:count]
+
+
+def build_cases(simulator, account_id: str, count: int):
+    """(name, callable) pairs; each callable runs one client method over `count` rows"""
+    from app.meta_client import MetaAdsClient
+
+    def client_for(responses: Dict[str, Dict]) -> MetaAdsClient:
+        client = MetaAdsClient('bench-token')
+        client._make_request = lambda endpoint, params=None: responses[endpoint.rsplit('/', 1)[-1]]
+        return client
+
+    roas_fields = ('ad_id,ad_name,adset_id,campaign_id,campaign_name,spend,impressions,clicks,'
+                   'purchase_roas,actions,action_values,ctr,cpm,cpc')
+    ad_rows = make_rows(simulator, account_id, count, level='ad', fields=roas_fields)
+    conversion_fields = 'ad_id,spend,impressions,clicks,conversions,conversion_values,ctr,cpm'
+    audience_rows = make_rows(simulator, account_id, count, level='ad', fields=conversion_fields,
+                              breakdowns='age,gender')
+    placement_rows = make_rows(simulator, account_id, count, level='ad', fields=conversion_fields,
+                               breakdowns='publisher_platform,placement')
+    creative_rows = make_rows(simulator, account_id, count, level='ad', fields=conversion_fields)
+    ads = {'data': simulator.account(account_id).ads}
+
+    roas_client = client_for({'insights': {'data': ad_rows}})
+    audience_client = client_for({'insights': {'data': audience_rows}})
+    placement_client = client_for({'insights': {'data': placement_rows}})
+    creative_client = client_for({'insights': {'data': creative_rows}, 'ads': ads})
+
+    pairs = [(float(row['spend']), float(row['spend']) * 1.7) for row in ad_rows]
+
+    def roas_loop():
+        calculate = roas_client._calculate_roas
+        for spend, revenue in pairs:
+            calculate(spend, revenue)
+
+    return [
+        ('action_value_revenue', lambda: roas_client.get_campaign_roas(account_id, DATE_RANGE)),
+        ('roas_computation', roas_loop),
+        ('audience_age_gender', lambda: audience_client.get_audience_insights(account_id, DATE_RANGE)),
+        ('placement_grouping', lambda: placement_client.get_placement_performance(account_id, DATE_RANGE)),
+        ('creative_grouping', lambda: creative_client.get_creative_performance(account_id, DATE_RANGE)),
+        ('top_ads_sort', lambda: roas_client.get_top_performing_ads(account_id, DATE_RANGE, limit=10))
+    ]
+
+
+def measure(func: Callable, rows: int, min_seconds: float) -> Dict:
+    func()  # warm up
+    timings = []
+    deadline = time.perf_counter() + min_seconds
+    while len(timings) < 3 or (time.perf_counter() < deadline and len(timings) < 200):
+        gc.collect()
+        started = time.perf_counter_ns()
+        func()
+        timings.append(time.perf_counter_ns() - started)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    diff = after.compare_to(before, 'filename')
+
+    best = min(timings)
+    return {
+        'rows': rows,
+        'runs': len(timings),
+        'best_ms': round(best / 1e6, 3),
+        'median_ms': round(statistics.median(timings) / 1e6, 3),
+        'ns_per_row': round(best / rows, 1),
+        'median_ns_per_row': round(statistics.median(timings) / rows, 1),
+        'peak_alloc_bytes': peak,
+        'peak_bytes_per_row': round(peak / rows, 1),
+        'retained_blocks': sum(stat.count_diff for stat in diff)
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Insights parsing and aggregation microbenchmarks')
+    parser.add_argument('--rows', default='100,10000,100000', help='comma-separated payload sizes')
+    parser.add_argument('--ads', type=int, default=2000, help='ads in the synthetic account')
+    parser.add_argument('--only', default='', help='comma-separated benchmark names')
+    parser.add_argument('--min-seconds', type=float, default=0.5, help='minimum timing per case')
+    parser.add_argument('--output', help='write JSON results here (default: stdout)')
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)
+    from app.graph_simulator import GraphSimulator
+
+    # conversions/conversion_values are left out: Graph returns them as action lists,
+    # which the current client parsers read as scalars
+    simulator = GraphSimulator(accounts=1, ads_per_account=args.ads, call_budget=10 ** 9)
+    account_id = simulator.account_ids()[0]
+    only = {name for name in args.only.split(',') if name}
+
+    results = []
+    for count in [int(n) for n in args.rows.split(',')]:
+        for name, func in build_cases(simulator, account_id, count):
+            if only and name not in only:
+                continue
+            stats = measure(func, count, args.min_seconds)
+            results.append(dict({'name': name}, **stats))
+            sys.stderr.write(f'{name:22} rows={count:<7} {stats["ns_per_row"]:>10.1f} ns/row '
+                             f'peak={stats["peak_bytes_per_row"]:>8.1f} B/row runs={stats["runs"]}\n')
+
+    report = {
+        'benchmark': 'hot_loops',
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'git': git_revision(),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform()},
+        'config': vars(args),
+        'results': results
+    }
+    encoded = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(encoded + '\n')
+    else:
+        print(encoded)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
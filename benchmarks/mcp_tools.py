@@ -0,0 +1,232 @@
+"""
+End-to-end latency and throughput of the MCP tools
+Drives the real Flask app with a JWT, with Supabase replaced by an in-memory
+fake and Graph by the local simulator, or by a recorded capture (see
+app/graph_capture.py) with --replay. --server oauth (default) posts to /
+(oauth_mcp_fixed); --server protocol posts to /mcp/rpc, where MCPHandler
+serves the analytics tools (audience, trends, funnel, placements, pacing,
+underperformers, portfolio, ...).
+
+    python benchmarks/mcp_tools.py --ads 100,10000 --concurrency 1,8 --requests 50 \\
+        --latency-ms 60 --output results.json
+    python benchmarks/mcp_tools.py --server protocol --ads 2000 --output protocol.json
+    python benchmarks/compare.py baseline.json results.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from stubs import ROOT, bearer_token, setup_environment
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def git_revision() -> Dict:
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True,
+                                         stderr=subprocess.DEVNULL).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                             cwd=ROOT, text=True, stderr=subprocess.DEVNULL).strip())
+        return {'commit': commit, 'dirty': dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+
+def is_error_result(payload: bytes) -> bool:
+    """True when a tools/call response carries an error instead of a tool result"""
+    try:
+        message = json.loads(payload)
+        text = message['result']['content'][0]['text']
+        result = json.loads(text)
+    except (ValueError, KeyError, IndexError, TypeError):
+        return True
+    return isinstance(result, dict) and result.get('status') == 'error'
+
+
+# Server under test -> the path its JSON-RPC endpoint is served at
+SERVER_PATHS = {'oauth': '/', 'protocol': '/mcp/rpc'}
+
+
+def clear_caches() -> None:
+    """Drop the per-process caches so every request does the full work"""
+    from app import audience, creatives, filtering, oauth_mcp_fixed, pacing, placements, portfolio, trends
+    for cache in (oauth_mcp_fixed._user_cache, oauth_mcp_fixed._account_choice_cache,
+                  oauth_mcp_fixed._tool_result_cache, portfolio._partials, audience._cube_cache,
+                  filtering._row_cache, pacing._budget_cache, creatives.creative_index,
+                  placements.placement_store, trends.trend_store):
+        cache.clear()
+
+
+def protocol_app(app):
+    """Serve MCPHandler's JSON-RPC endpoint (routes.mcp_rpc) at /mcp/rpc on the benchmark app"""
+    from app.routes import mcp_bp
+    if 'mcp' not in app.blueprints:
+        app.register_blueprint(mcp_bp, url_prefix='/mcp')
+    return app
+
+
+def default_arguments(server: str, simulator) -> Dict:
+    """Arguments for tools that cannot run without some"""
+    if server != 'protocol' or simulator is None:
+        return {}
+    campaigns = simulator.account(simulator.account_ids()[0]).campaigns
+    return {'compare_campaigns': {'campaign_ids': [campaign['id'] for campaign in campaigns[:3]]}}
+
+
+def run_case(app, token: str, tool: str, arguments: Dict, requests_count: int,
+             concurrency: int, cold: bool, path: str = '/') -> Dict:
+    headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+    body = json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': 'tools/call',
+                       'params': {'name': tool, 'arguments': arguments}})
+    local = threading.local()
+    latencies: List[float] = []
+    errors = 0
+    response_bytes = 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal errors, response_bytes
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        if cold:
+            clear_caches()
+        started = time.perf_counter()
+        response = client.post(path, data=body, headers=headers)
+        payload = response.get_data()
+        elapsed = time.perf_counter() - started
+        failed = response.status_code != 200 or is_error_result(payload)
+        with lock:
+            latencies.append(elapsed)
+            response_bytes += len(payload)
+            errors += failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests_count)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': requests_count,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+        'rps': round(requests_count / wall, 2),
+        'avg_response_bytes': response_bytes // requests_count
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--server', choices=sorted(SERVER_PATHS), default='oauth',
+                        help='oauth: oauth_mcp_fixed at /; protocol: MCPHandler at /mcp/rpc')
+    parser.add_argument('--tools', default='', help='comma-separated tool names (default: all)')
+    parser.add_argument('--ads', default='100,2000', help='comma-separated ads per account sizes')
+    parser.add_argument('--accounts', type=int, default=2, help='ad accounts per user')
+    parser.add_argument('--concurrency', default='1,8', help='comma-separated client concurrency levels')
+    parser.add_argument('--requests', type=int, default=30, help='requests per tool and configuration')
+    parser.add_argument('--warmup', type=int, default=2, help='untimed requests per tool before measuring')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='simulated Graph latency per request')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='extra random Graph latency')
+    parser.add_argument('--supabase-latency-ms', type=float, default=0.0)
+    parser.add_argument('--replay', help='serve Graph from this capture instead of the simulator')
+    parser.add_argument('--account-ids', default='', help='comma-separated account ids in the --replay capture')
+    parser.add_argument('--cold', action='store_true', help='clear server caches before every request')
+    parser.add_argument('--arguments', default='{}', help='JSON object of {tool: arguments}')
+    parser.add_argument('--output', help='write JSON results here (default: stdout)')
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)
+    from app import create_app, serialization
+    from app.graph_simulator import GraphSimulator
+    from app.mcp_protocol import protocol_tools
+    from app.oauth_mcp_fixed import tool_registry
+    import builtins
+
+    registry = protocol_tools if args.server == 'protocol' else tool_registry
+    tools = [t for t in args.tools.split(',') if t] or registry.names()
+    app = create_app()
+    if args.server == 'protocol':
+        app = protocol_app(app)
+    path = SERVER_PATHS[args.server]
+
+    results = []
+    real_print = builtins.print
+    builtins.print = lambda *a, **k: None  # the MCP handlers print every request
+    try:
+        for ads in [int(n) for n in args.ads.split(',')] if not args.replay else ['replay']:
+            if args.replay:
+                from app import graph_capture
+                graph_capture.install('replay', args.replay)
+                fake = setup_environment([a for a in args.account_ids.split(',') if a], args.supabase_latency_ms)
+                simulator = None
+            else:
+                simulator = GraphSimulator(accounts=args.accounts, ads_per_account=ads,
+                                           latency_ms=args.latency_ms, latency_jitter_ms=args.jitter_ms,
+                                           call_budget=10 ** 9)
+                fake = setup_environment(simulator.account_ids(), args.supabase_latency_ms, simulator)
+                for account_id in simulator.account_ids():
+                    simulator.account(account_id)  # generate outside the timed runs
+            # mcp_rpc looks the user up by id, oauth_mcp_fixed by email
+            token = bearer_token(user_id=fake.tables['users'][0]['id'])
+            tool_arguments = dict(default_arguments(args.server, simulator), **json.loads(args.arguments))
+            clear_caches()
+            for tool in tools:
+                arguments = tool_arguments.get(tool, {})
+                if args.warmup:
+                    run_case(app, token, tool, arguments, args.warmup, 1, args.cold, path)
+                for concurrency in [int(n) for n in args.concurrency.split(',')]:
+                    stats = run_case(app, token, tool, arguments, args.requests, concurrency, args.cold, path)
+                    case = {'server': args.server, 'tool': tool, 'ads_per_account': ads, 'concurrency': concurrency}
+                    case.update(stats)
+                    results.append(case)
+                    sys.stderr.write(f'{tool:28} ads={str(ads):<7} c={concurrency:<3} p50={stats["p50_ms"]:>9.2f}ms '
+                                     f'p95={stats["p95_ms"]:>9.2f}ms p99={stats["p99_ms"]:>9.2f}ms '
+                                     f'{stats["rps"]:>8.1f} req/s errors={stats["errors"]}\n')
+    finally:
+        builtins.print = real_print
+
+    report = {
+        'benchmark': 'mcp_tools',
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'git': git_revision(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'json_backend': serialization.BACKEND,
+            'tool_timeout': os.getenv('TOOL_TIMEOUT_SECONDS', '90')
+        },
+        'config': vars(args),
+        'results': results
+    }
+    encoded = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(encoded + '\n')
+    else:
+        print(encoded)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Stand-ins for external services used by the benchmarks
+FakeSupabase answers the query-builder calls SupabaseClient makes from
+in-memory tables; setup_environment() wires it and the Graph simulator in.
+"""
+
+import os
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+BENCH_EMAIL = 'bench@example.com'
+
+
+class _Result:
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    def __init__(self, store: 'FakeSupabase', table: str):
+        self.store = store
+        self.table = table
+        self.filters = []
+        self.action = 'select'
+        self.payload = None
+
+    def select(self, columns='*'):
+        self.action = 'select'
+        return self
+
+    def insert(self, payload):
+        self.action, self.payload = 'insert', payload
+        return self
+
+    def update(self, payload):
+        self.action, self.payload = 'update', payload
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, value))
+        return self
+
+    def execute(self):
+        if self.store.latency_ms:
+            time.sleep(self.store.latency_ms / 1000.0)
+        with self.store.lock:
+            rows = self.store.tables.setdefault(self.table, [])
+            matching = [row for row in rows if all(row.get(c) == v for c, v in self.filters)]
+            if self.action == 'insert':
+                row = dict(self.payload, id=self.payload.get('id') or str(uuid.uuid4()))
+                rows.append(row)
+                return _Result([row])
+            if self.action == 'update':
+                for row in matching:
+                    row.update(self.payload)
+            return _Result([dict(row) for row in matching])
+
+
+class FakeSupabase:
+    """Minimal in-memory replacement for the supabase-py client"""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.tables: Dict[str, List[Dict]] = {}
+        self.lock = threading.Lock()
+        self.latency_ms = latency_ms
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+
+def setup_environment(account_ids: List[str], supabase_latency_ms: float = 0.0,
+                      simulator=None) -> FakeSupabase:
+    """Point SupabaseClient at a FakeSupabase holding one user who owns the given accounts"""
+    os.environ.setdefault('SUPABASE_URL', 'http://supabase.invalid')
+    from app.supabase_client import SupabaseClient
+
+    fake = FakeSupabase(latency_ms=supabase_latency_ms)
+    user_id = str(uuid.uuid4())
+    fake.tables['users'] = [{'id': user_id, 'email': BENCH_EMAIL, 'name': 'Benchmark'}]
+    fake.tables['ad_accounts'] = [{
+        'id': str(uuid.uuid4()),
+        'user_id': user_id,
+        'account_id': account_id,
+        'account_name': f'Account {n + 1}',
+        'access_token': 'bench-token',
+        'is_active': True
+    } for n, account_id in enumerate(account_ids)]
+    SupabaseClient._service_client = fake
+    SupabaseClient._anon_client = fake
+
+    if simulator is not None:
+        from app.graph_simulator import install
+        install(simulator)
+    return fake
+
+
+def bearer_token(email: str = BENCH_EMAIL, secret: Optional[str] = None, user_id: str = 'bench') -> str:
+    import jwt
+    from app.oauth_mcp_fixed import JWT_SECRET
+    return jwt.encode({'user_id': user_id, 'email': email}, secret or JWT_SECRET, algorithm='HS256')
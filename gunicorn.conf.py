@@ -0,0 +1,22 @@
+"""
+Gunicorn settings
+Prepares PROMETHEUS_MULTIPROC_DIR so /metrics aggregates every worker.
+"""
+
+import os
+import shutil
+
+
+def on_starting(server):
+    """Start each deploy with an empty multiprocess metrics directory"""
+    path = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Drop live gauges of workers that exit"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)